@@ -0,0 +1,198 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import pandas as pd
+from sqlalchemy.orm import sessionmaker
+from benchmarks.synthetic import SyntheticInvoiceGenerator
+from etl.db.core import DBContext
+from etl.db.loader import get_bulk_loader
+from etl.instrumentation import RunInstrumentation, current_rss_bytes
+from etl.logger import get_logger
+from etl.main import _read_csv_chunks_from_source, _read_csv_from_source
+from etl.pipeline import ETLPipeline
+
+DEFAULT_ROWS = [100_000, 1_000_000, 10_000_000, 50_000_000]
+
+
+def _git_commit() -> str | None:
+    """Return the commit the benchmark runs against, if run inside a git checkout."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_single(
+    csv_path: str,
+    chunk_size: int | None,
+    batch_size: int,
+    compact: bool = False,
+    low_copy: bool = False
+) -> dict:
+    """Run the pipeline once on `csv_path` against a fresh SQLite database and return its measurements.
+    Peak RSS growth is measured from the resident memory before the run, i.e. after the interpreter
+    and libraries are loaded."""
+    rss_before_run: int = current_rss_bytes() or 0
+    instrumentation = RunInstrumentation()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = DBContext()
+        engine = db.get_sqlite_engine(db_path=os.path.join(tmp_dir, "invoices.db"))
+        db.create_tables(engine)
+        session = sessionmaker(bind=engine)()
+        pipeline = ETLPipeline(
+            session,
+            loader=get_bulk_loader(session, batch_size=batch_size),
+            instrumentation=instrumentation,
+            compact=compact,
+            low_copy=low_copy
+        )
+
+        try:
+            if chunk_size:
+                pipeline.run_pipeline_in_chunks(
+                    lambda: _read_csv_chunks_from_source(file_path=csv_path, chunk_size=chunk_size)
+                )
+            else:
+                with instrumentation.stage("read_source") as stage:
+                    df: pd.DataFrame = _read_csv_from_source(file_path=csv_path)
+                    stage.add_rows_out(len(df))
+                pipeline.run_pipeline(df)
+                del df
+            with instrumentation.stage("commit"):
+                pipeline.commit()
+        finally:
+            pipeline.close()
+        instrumentation.finish(status="succeeded")
+
+        loads = {
+            table_name: {"rows": result.rows, "seconds": result.seconds, "rows_per_second": result.rows_per_second}
+            for table_name, result in pipeline.loader.report().items()
+        }
+
+    run_report: dict = instrumentation.report()
+    n_rows = sum(1 for _ in open(csv_path, "rb")) - 1
+    return {
+        "rows": n_rows,
+        "file_bytes": os.path.getsize(csv_path),
+        "mode": "chunked" if chunk_size else "full",
+        "chunk_size": chunk_size,
+        "batch_size": batch_size,
+        "compact": compact,
+        "low_copy": low_copy,
+        "wall_seconds": run_report["wall_seconds"],
+        "rows_per_second": n_rows / run_report["wall_seconds"],
+        "stages": run_report["stages"],
+        "loads": loads,
+        "peak_rss_bytes": run_report["peak_rss_bytes"],
+        "peak_rss_growth_bytes": run_report["peak_rss_bytes"] - rss_before_run,
+    }
+
+
+def _parse_args() -> argparse.Namespace:
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Benchmark the invoices ETL pipeline on synthetic invoice CSV files against SQLite."
+    )
+    parser.add_argument("--rows", type=int, nargs="+", default=DEFAULT_ROWS, help="Synthetic file sizes in rows.")
+    parser.add_argument("--chunk-size", type=int, default=None, help="Benchmark chunked streaming mode.")
+    parser.add_argument("--batch-size", type=int, default=10_000, help="Rows per executemany call.")
+    parser.add_argument("--compact", action="store_true", help="Benchmark the compact-schema transform.")
+    parser.add_argument(
+        "--low-copy", action="store_true", help="Benchmark the pipeline with pandas copy-on-write stages."
+    )
+    parser.add_argument(
+        "--max-rss-multiple",
+        type=float,
+        default=None,
+        help="Fail if the peak RSS growth of any run exceeds this multiple of its CSV file size.",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic data generator.")
+    parser.add_argument("--data-dir", default="benchmark_data", help="Directory for the generated CSV files.")
+    parser.add_argument("--report", default="benchmark_report.json", help="Path of the JSON report.")
+    parser.add_argument("--single", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--single-output", default=None, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def main():
+    logger = get_logger("Benchmark")
+    args = _parse_args()
+
+    # child process measuring a single file, so that peak memory is not shared between sizes
+    if args.single:
+        result = run_single(
+            csv_path=args.single,
+            chunk_size=args.chunk_size,
+            batch_size=args.batch_size,
+            compact=args.compact,
+            low_copy=args.low_copy
+        )
+        with open(args.single_output, "w") as f:
+            json.dump(result, f)
+        return
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    results: list[dict] = []
+    for n_rows in args.rows:
+        csv_path = os.path.join(args.data_dir, f"invoices_{n_rows}_seed{args.seed}.csv")
+        if not os.path.exists(csv_path):
+            SyntheticInvoiceGenerator(seed=args.seed).write_csv(file_path=csv_path, n_rows=n_rows)
+
+        logger.info(f"Benchmarking pipeline on {n_rows} rows")
+        with tempfile.NamedTemporaryFile(suffix=".json") as output:
+            command = [
+                sys.executable, "-m", "benchmarks.run_benchmark",
+                "--single", csv_path,
+                "--single-output", output.name,
+                "--batch-size", str(args.batch_size),
+            ]
+            if args.chunk_size:
+                command += ["--chunk-size", str(args.chunk_size)]
+            if args.compact:
+                command.append("--compact")
+            if args.low_copy:
+                command.append("--low-copy")
+            subprocess.run(command, check=True)
+            result = json.load(open(output.name))
+
+        result["rss_multiple"] = result["peak_rss_growth_bytes"] / result["file_bytes"]
+        logger.info(
+            f"{n_rows} rows: {result['wall_seconds']:.1f}s, {result['rows_per_second']:,.0f} rows/sec, "
+            f"peak RSS {result['peak_rss_bytes'] / 1024 ** 2:,.0f} MiB "
+            f"({result['rss_multiple']:.1f}x the CSV file size above the baseline)"
+        )
+        results.append(result)
+
+    report = {
+        "commit": _git_commit(),
+        "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "results": results,
+    }
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=2)
+    logger.info(f"Benchmark report written to '{args.report}'")
+
+    # memory regression gate
+    if args.max_rss_multiple is not None:
+        over_limit = [result for result in results if result["rss_multiple"] > args.max_rss_multiple]
+        for result in over_limit:
+            logger.error(
+                f"{result['rows']} rows: peak RSS growth is {result['rss_multiple']:.1f}x the CSV file size, "
+                f"above the limit of {args.max_rss_multiple}x"
+            )
+        if over_limit:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+import numpy as np
+import pandas as pd
+from etl.logger import get_logger
+
+# period covered by the generated invoices, same as the yearly extracts
+START_DATE = pd.Timestamp("2009-12-01")
+END_DATE = pd.Timestamp("2010-12-09")
+
+# invoices are issued during opening hours only
+FIRST_HOUR = 7
+LAST_HOUR = 20
+
+MEAN_LINES_PER_INVOICE = 20
+CANCELLED_INVOICE_SHARE = 0.02
+ADJUSTMENT_INVOICE_SHARE = 0.002
+MISSING_CUSTOMER_SHARE = 0.22
+FREE_ITEM_SHARE = 0.005
+
+SPECIAL_CODES = ["POST", "M", "D", "DOT", "C2", "BANK CHARGES", "PADS", "TEST001", "TEST002", "ADJUST"]
+DESCRIPTION_WORDS = [
+    "WHITE", "RED", "PINK", "BLUE", "VINTAGE", "HANGING", "HEART", "T-LIGHT", "HOLDER", "LUNCH", "BAG",
+    "CAKE", "CASES", "RETROSPOT", "JUMBO", "SHOPPER", "CERAMIC", "MUG", "GLASS", "STAR", "CHRISTMAS",
+    "PARTY", "BUNTING", "LANTERN", "DOORMAT", "CUSHION", "COVER", "BOTTLE", "WRAP", "ALARM", "CLOCK",
+]
+# share of customers per country, including the odd values cleaned up by the pipeline
+COUNTRIES = {
+    "United Kingdom": 0.88,
+    "EIRE": 0.03,
+    "Germany": 0.02,
+    "France": 0.02,
+    "Netherlands": 0.01,
+    "RSA": 0.005,
+    "U.K.": 0.005,
+    "Unspecified": 0.01,
+    "West Indies": 0.005,
+    "Channel Islands": 0.01,
+    None: 0.005,
+}
+
+
+class SyntheticInvoiceGenerator:
+    """Generates synthetic invoice CSV files with the columns and value
+    distributions of the invoices extract read by `etl.main`:
+    1. Stock codes with a long-tailed popularity, letter suffixes, lowercase and padded variants.
+    2. Descriptions with case and punctuation variants and missing values.
+    3. Cancelled invoices ('C' prefix) with negative quantities and bad debt adjustments ('A' prefix).
+    4. Missing customer IDs and odd country names.
+    Rows are written in blocks, so files of tens of millions of rows can be generated in bounded memory."""
+    def __init__(self, seed: int = 0, n_products: int = 4_000, n_customers: int = 5_900):
+        self.logger = get_logger(self.__class__.__name__)
+        self.rng = np.random.default_rng(seed)
+        self._create_products(n_products)
+        self._create_customers(n_customers)
+
+    def _long_tail_weights(self, n: int, exponent: float) -> np.ndarray:
+        """Return normalised Zipf-like weights for `n` ranked items."""
+        weights = 1.0 / np.arange(1, n + 1) ** exponent
+        return weights / weights.sum()
+
+    def _create_products(self, n_products: int) -> None:
+        """Create the product catalogue: codes, descriptions, prices and popularity."""
+        numbers = self.rng.choice(np.arange(10_000, 100_000), size=n_products, replace=False).astype(str)
+        suffixes = np.where(
+            self.rng.random(n_products) < 0.15,
+            self.rng.choice(list("ABCDEFG"), size=n_products),
+            ""
+        )
+        codes = np.char.add(numbers, suffixes).astype(object)
+        codes[:len(SPECIAL_CODES)] = SPECIAL_CODES
+        self.product_codes: np.ndarray = codes[self.rng.permutation(n_products)]
+
+        words = np.array(DESCRIPTION_WORDS, dtype=object)
+        self.product_descriptions: np.ndarray = np.array(
+            [" ".join(self.rng.choice(words, size=self.rng.integers(2, 5), replace=False)) for _ in range(n_products)],
+            dtype=object
+        )
+        self.product_prices: np.ndarray = np.round(self.rng.lognormal(mean=1.0, sigma=0.8, size=n_products), 2)
+        self.product_weights: np.ndarray = self._long_tail_weights(n_products, exponent=1.1)
+
+    def _create_customers(self, n_customers: int) -> None:
+        """Create the customers with their country and popularity."""
+        self.customer_ids: np.ndarray = np.arange(12_346, 12_346 + n_customers).astype(float)
+        countries = np.array(list(COUNTRIES.keys()), dtype=object)
+        shares = np.array(list(COUNTRIES.values()))
+        self.customer_countries: np.ndarray = self.rng.choice(countries, size=n_customers, p=shares / shares.sum())
+        self.customer_weights: np.ndarray = self._long_tail_weights(n_customers, exponent=0.8)
+
+    def _invoice_index_per_row(self, n_rows: int) -> np.ndarray:
+        """Split `n_rows` rows into invoices with a geometric number of lines each."""
+        lines = self.rng.geometric(1 / MEAN_LINES_PER_INVOICE, size=n_rows)
+        invoice_ends = np.cumsum(lines)
+        return np.searchsorted(invoice_ends, np.arange(n_rows), side="right")
+
+    def _invoice_dates(self, first_row_position: np.ndarray) -> pd.DatetimeIndex:
+        """Spread invoices over the period in file order, during opening hours."""
+        n_days = (END_DATE - START_DATE).days + 1
+        day_position = first_row_position * n_days
+        days = np.floor(day_position).astype(int)
+        minutes = FIRST_HOUR * 60 + ((day_position - days) * (LAST_HOUR - FIRST_HOUR) * 60).astype(int)
+        return START_DATE + pd.to_timedelta(days, unit="D") + pd.to_timedelta(minutes, unit="min")
+
+    def _add_code_and_description_noise(self, codes: np.ndarray, descriptions: np.ndarray) -> None:
+        """Add the lowercase, padded, punctuated and missing variants found in the extract, in place."""
+        n_rows = len(codes)
+        lower_codes = self.rng.random(n_rows) < 0.01
+        codes[lower_codes] = pd.Series(codes[lower_codes], dtype=object).str.lower().to_numpy()
+        padded_codes = self.rng.random(n_rows) < 0.005
+        codes[padded_codes] = codes[padded_codes] + " "
+
+        lower_descriptions = self.rng.random(n_rows) < 0.03
+        descriptions[lower_descriptions] = pd.Series(descriptions[lower_descriptions], dtype=object).str.lower().to_numpy()
+        punctuated_descriptions = self.rng.random(n_rows) < 0.01
+        descriptions[punctuated_descriptions] = descriptions[punctuated_descriptions] + "!"
+        missing_descriptions = self.rng.random(n_rows) < 0.004
+        descriptions[missing_descriptions] = None
+
+    def _generate_block(self, n_rows: int, row_offset: int, total_rows: int, invoice_offset: int) -> pd.DataFrame:
+        """Generate `n_rows` rows starting at row `row_offset` of a file of `total_rows` rows."""
+        invoice_index = self._invoice_index_per_row(n_rows)
+        n_invoices = int(invoice_index[-1]) + 1
+        first_rows = np.searchsorted(invoice_index, np.arange(n_invoices))
+
+        # invoice attributes
+        kind = self.rng.random(n_invoices)
+        is_cancelled = kind < CANCELLED_INVOICE_SHARE
+        is_adjustment = (kind >= CANCELLED_INVOICE_SHARE) & (kind < CANCELLED_INVOICE_SHARE + ADJUSTMENT_INVOICE_SHARE)
+        invoice_numbers = (489_434 + invoice_offset + np.arange(n_invoices)).astype(str).astype(object)
+        invoice_numbers[is_cancelled] = "C" + invoice_numbers[is_cancelled]
+        invoice_numbers[is_adjustment] = "A" + invoice_numbers[is_adjustment]
+        invoice_dates = self._invoice_dates((row_offset + first_rows) / total_rows).strftime("%Y-%m-%d %H:%M:%S")
+
+        customers = self.rng.choice(len(self.customer_ids), size=n_invoices, p=self.customer_weights)
+        customer_ids = self.customer_ids[customers]
+        customer_ids[self.rng.random(n_invoices) < MISSING_CUSTOMER_SHARE] = np.nan
+
+        # line attributes
+        products = self.rng.choice(len(self.product_codes), size=n_rows, p=self.product_weights)
+        codes = self.product_codes[products].copy()
+        descriptions = self.product_descriptions[products].copy()
+        self._add_code_and_description_noise(codes, descriptions)
+
+        quantities = self.rng.choice([1, 2, 3, 4, 6, 8, 12, 24, 48, 96], size=n_rows, p=[
+            0.2, 0.15, 0.1, 0.1, 0.15, 0.05, 0.15, 0.06, 0.03, 0.01
+        ])
+        quantities[is_cancelled[invoice_index]] *= -1
+        prices = self.product_prices[products].copy()
+        prices[self.rng.random(n_rows) < FREE_ITEM_SHARE] = 0.0
+
+        # bad debt adjustments have a single negative amount
+        row_is_adjustment = is_adjustment[invoice_index]
+        codes[row_is_adjustment] = "B"
+        descriptions[row_is_adjustment] = "Adjust bad debt"
+        quantities[row_is_adjustment] = 1
+        prices[row_is_adjustment] = -np.round(self.rng.lognormal(mean=6, sigma=1, size=int(row_is_adjustment.sum())), 2)
+
+        return pd.DataFrame({
+            "Invoice": invoice_numbers[invoice_index],
+            "StockCode": codes,
+            "Description": descriptions,
+            "Quantity": quantities,
+            "InvoiceDate": invoice_dates[invoice_index],
+            "Price": prices,
+            "Customer ID": customer_ids[invoice_index],
+            "Country": self.customer_countries[customers][invoice_index],
+        })
+
+    def write_csv(self, file_path: str, n_rows: int, block_size: int = 1_000_000) -> None:
+        """Write a synthetic invoices CSV file of `n_rows` rows, generated `block_size` rows at a time."""
+        self.logger.info(f"Generating {n_rows} synthetic invoice rows into '{file_path}'")
+        invoice_offset = 0
+        for row_offset in range(0, n_rows, block_size):
+            block: pd.DataFrame = self._generate_block(
+                n_rows=min(block_size, n_rows - row_offset),
+                row_offset=row_offset,
+                total_rows=n_rows,
+                invoice_offset=invoice_offset
+            )
+            invoice_offset += block["Invoice"].nunique()
+            block.to_csv(file_path, mode="w" if row_offset == 0 else "a", header=row_offset == 0, index=False)
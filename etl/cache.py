@@ -0,0 +1,80 @@
+import hashlib
+import os
+import pandas as pd
+import pyarrow.feather as feather
+from etl.constants import SOURCE_CACHE_MAX_BYTES, SOURCE_TRANSFORM_VERSION
+from etl.logger import get_logger
+
+
+def source_fingerprint(file_path: str, variant: str | None = None) -> str:
+    """Identify the cleaned source of a file by the hash of its contents and the transform version.
+    `variant` separates the same file transformed differently, e.g. to a compact schema."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    fingerprint = f"{digest.hexdigest()}-v{SOURCE_TRANSFORM_VERSION}"
+    return f"{fingerprint}-{variant}" if variant else fingerprint
+
+
+class SourceCache:
+    """Content-addressed cache of the cleaned source DataFrame on local disk.
+    Entries are keyed by the hash of the source file contents and the transform version,
+    and stored as uncompressed Arrow IPC (Feather) files so they can be memory-mapped on load.
+    The least recently used entries are evicted once the cache grows beyond `max_bytes`."""
+    def __init__(self, cache_dir: str, max_bytes: int = SOURCE_CACHE_MAX_BYTES):
+        self.logger = get_logger(self.__class__.__name__)
+        self.cache_dir: str = cache_dir
+        self.max_bytes: int = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def make_key(self, file_path: str, variant: str | None = None) -> str:
+        """Create the cache key of a source file, see `source_fingerprint`."""
+        return source_fingerprint(file_path, variant=variant)
+
+    def _entry_path(self, key: str) -> str:
+        """Return the path of the cache entry for a key."""
+        return os.path.join(self.cache_dir, f"{key}.arrow")
+
+    def load(self, key: str) -> pd.DataFrame | None:
+        """Load the cached DataFrame for a key, or return None on a cache miss."""
+        path = self._entry_path(key)
+        if not os.path.exists(path):
+            self.logger.info(f"Source cache miss for key '{key}'")
+            return None
+
+        self.logger.info(f"Source cache hit for key '{key}'. Loading cleaned source from '{path}'")
+        df: pd.DataFrame = feather.read_table(path, memory_map=True).to_pandas()
+
+        # refresh the modification time, which is used as last access time for eviction
+        os.utime(path)
+        return df
+
+    def store(self, key: str, df: pd.DataFrame) -> None:
+        """Store a DataFrame under a key and evict old entries if the cache is over its size limit."""
+        path = self._entry_path(key)
+        tmp_path = f"{path}.tmp"
+
+        # write to a temporary file first, so a failed write never leaves a corrupt entry behind
+        feather.write_feather(df.reset_index(drop=True), tmp_path, compression="uncompressed")
+        os.replace(tmp_path, path)
+        self.logger.info(f"Stored cleaned source in cache under key '{key}'")
+
+        self._evict()
+
+    def _evict(self) -> None:
+        """Remove the least recently used entries until the cache fits in `max_bytes`."""
+        entries = [
+            os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir) if name.endswith(".arrow")
+        ]
+        entries.sort(key=os.path.getmtime, reverse=True)
+
+        kept_bytes = 0
+        for position, path in enumerate(entries):
+            size = os.path.getsize(path)
+            # always keep the most recent entry, even if it is larger than the limit on its own
+            if position > 0 and kept_bytes + size > self.max_bytes:
+                self.logger.info(f"Evicting source cache entry '{path}'")
+                os.remove(path)
+            else:
+                kept_bytes += size
@@ -0,0 +1,107 @@
+import json
+import os
+import pandas as pd
+import pyarrow.feather as feather
+from etl.logger import get_logger
+
+
+class CheckpointStore:
+    """Local spill directory holding the outputs of completed pipeline stages and a JSON manifest.
+    The manifest records the source the checkpoints belong to, the stages saved so far and
+    the number of fact batches committed, so a failed run can be resumed where it stopped.
+    Stage outputs are stored as uncompressed Arrow IPC (Feather) files.
+    The store only ever removes its own files, and refuses a non-empty directory without its manifest,
+    so pointing it at a directory holding other files never deletes them."""
+    manifest_name: str = "manifest.json"
+
+    def __init__(self, checkpoint_dir: str):
+        self.logger = get_logger(self.__class__.__name__)
+        self.checkpoint_dir: str = checkpoint_dir
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        self.manifest: dict = self._read_manifest()
+
+    def _manifest_path(self) -> str:
+        """Return the path of the manifest."""
+        return os.path.join(self.checkpoint_dir, self.manifest_name)
+
+    def _stage_path(self, stage_name: str) -> str:
+        """Return the path of the saved output of a stage."""
+        return os.path.join(self.checkpoint_dir, f"{stage_name}.arrow")
+
+    def _read_manifest(self) -> dict:
+        """Read the manifest, or return an empty one if the directory is empty.
+        Raises ValueError if the directory holds other files but no manifest of a checkpoint store."""
+        manifest: dict | None = None
+        if os.path.exists(self._manifest_path()):
+            with open(self._manifest_path()) as f:
+                try:
+                    manifest = json.load(f)
+                except json.JSONDecodeError:
+                    pass
+        elif not set(os.listdir(self.checkpoint_dir)) - {f"{self.manifest_name}.tmp"}:
+            return {"run_key": None, "stages": {}, "fact_batches_committed": 0}
+
+        if not isinstance(manifest, dict) or not {"run_key", "stages", "fact_batches_committed"} <= manifest.keys():
+            raise ValueError(
+                f"Checkpoint directory '{self.checkpoint_dir}' is not empty and holds no checkpoint manifest, "
+                "use an empty or dedicated directory"
+            )
+        return manifest
+
+    def _write_manifest(self) -> None:
+        """Write the manifest through a temporary file, so a crash never leaves a partial manifest behind."""
+        tmp_path = f"{self._manifest_path()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(tmp_path, self._manifest_path())
+
+    def _remove_checkpoints(self) -> None:
+        """Remove the files of the store listed in the manifest: the saved stage outputs
+        and the temporary manifest. The manifest itself is replaced by the next one written."""
+        paths: list[str] = [self._stage_path(stage_name) for stage_name in self.manifest["stages"]]
+        for path in paths + [f"{self._manifest_path()}.tmp"]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def start(self, run_key: str, resume: bool) -> None:
+        """Start a run over the source identified by `run_key`.
+        With `resume`, the checkpoints of a previous run over the same source are kept.
+        Otherwise, or if the checkpoints belong to another source, they are removed."""
+        if resume and self.manifest["run_key"] == run_key:
+            self.logger.info(
+                f"Resuming from checkpoints: stages {', '.join(self.manifest['stages']) or 'none'}, "
+                f"{self.manifest['fact_batches_committed']} fact batches committed"
+            )
+            return
+
+        if resume:
+            self.logger.warning("No checkpoints of this source to resume from. Starting from the beginning")
+        self._remove_checkpoints()
+        self.manifest = {"run_key": run_key, "stages": {}, "fact_batches_committed": 0}
+        self._write_manifest()
+
+    def load_stage(self, stage_name: str) -> pd.DataFrame | None:
+        """Load the saved output of a stage, or return None if the stage has not completed."""
+        if stage_name not in self.manifest["stages"]:
+            return None
+        self.logger.info(f"Loading output of completed stage '{stage_name}' from checkpoint")
+        return feather.read_table(self._stage_path(stage_name), memory_map=True).to_pandas()
+
+    def save_stage(self, stage_name: str, df: pd.DataFrame) -> None:
+        """Save the output of a completed stage and record it in the manifest."""
+        feather.write_feather(df.reset_index(drop=True), self._stage_path(stage_name), compression="uncompressed")
+        self.manifest["stages"][stage_name] = {"rows": len(df)}
+        self._write_manifest()
+        self.logger.info(f"Saved checkpoint of stage '{stage_name}'")
+
+    @property
+    def fact_batches_committed(self) -> int:
+        """Number of fact batches committed so far."""
+        return self.manifest["fact_batches_committed"]
+
+    def record_fact_batch(self, batches_committed: int) -> None:
+        """Record that the first `batches_committed` fact batches are committed."""
+        self.manifest["fact_batches_committed"] = batches_committed
+        self._write_manifest()
@@ -11,4 +11,76 @@ DIM_INVOICE_TABLE_NAME = "dim_invoice"
 DIM_PRODUCT_TABLE_NAME = "dim_product"
 DIM_DATE_TABLE_NAME = "dim_date"
 DIM_CUSTOMER_TABLE_NAME = "dim_customer"
-FACT_TRANSACTION_TABLE_NAME = "fact_transactions"
\ No newline at end of file
+FACT_TRANSACTION_TABLE_NAME = "fact_transactions"
+# column names of the invoices CSV file and their names in the pipeline
+SOURCE_COLUMN_NAMES = {
+    "Invoice": "invoice_no",
+    "StockCode": "code",
+    "Description": "description",
+    "Quantity": "quantity",
+    "InvoiceDate": "invoice_date",
+    "Price": "price",
+    "Customer ID": "customer_id",
+    "Country": "country",
+}
+
+# staging tables of the in-database ELT mode (etl.elt)
+STG_INVOICE_TABLE_NAME = "stg_invoices"
+STG_INVOICE_CLEAN_TABLE_NAME = "stg_invoices_clean"
+
+# source rows failing data-quality rules (etl.quality)
+DQ_QUARANTINE_TABLE_NAME = "dq_quarantine"
+
+# revenue summaries of the transaction fact (etl.transformations.a_revenue)
+AGG_REVENUE_DAILY_TABLE_NAME = "agg_revenue_daily"
+AGG_REVENUE_MONTHLY_TABLE_NAME = "agg_revenue_monthly"
+AGG_REVENUE_COUNTRY_MONTH_TABLE_NAME = "agg_revenue_country_month"
+AGG_REVENUE_PRODUCT_MONTH_TABLE_NAME = "agg_revenue_product_month"
+AGG_REVENUE_TYPE_MONTH_TABLE_NAME = "agg_revenue_type_month"
+
+# content hashes of the month partitions loaded by changed-partition runs (etl.transformations.p_partition)
+PARTITION_STATE_TABLE_NAME = "etl_partition_state"
+
+# invoice type for each (quantity_class, price_class) pair
+# any pair not listed here is classified as UNKNOWN_INVOICE_TYPE
+INVOICE_TYPE_RULES = {
+    ("negative", "positive"): "Purchase",
+    ("negative", "zero"): "Free Stock",
+    ("positive", "negative"): "Adjustment",
+    ("positive", "positive"): "Sale",
+    ("positive", "zero"): "Donation",
+}
+UNKNOWN_INVOICE_TYPE = "Unknown"
+
+# cleaned up customer country for odd country values, other countries are kept as is
+# 'nan' is the country of rows without one
+COUNTRY_MAPPING = {
+    "EIRE": "Ireland",
+    "RSA": "South Africa",
+    "U.K.": "United Kingdom",
+    "Unspecified": "Unknown",
+    "West Indies": "Unknown",
+    "nan": "Unknown",
+}
+
+# number of rows sent to the database per executemany call
+LOAD_BATCH_SIZE = 10_000
+# number of fact rows committed at a time by checkpointed runs
+FACT_CHECKPOINT_BATCH_SIZE = 100_000
+# number of writes waiting for the background writer before the pipeline blocks
+WRITER_MAX_PENDING = 2
+# number of CSV rows read at a time while staging the raw source in ELT mode
+STAGING_CHUNK_SIZE = 100_000
+# most processes reading and transforming source files in parallel unless set, as each holds a whole file
+SOURCE_WORKERS = 4
+
+# version of the source transformations (ETLPipeline.transform_source)
+# bump whenever they change, so cleaned sources cached by an older version are not reused
+SOURCE_TRANSFORM_VERSION = 2
+# size limit of the cleaned source cache, least recently used entries are evicted beyond it
+SOURCE_CACHE_MAX_BYTES = 2 * 1024 ** 3
+
+# number of slots of a new surrogate key registry (etl.registry), a power of two
+KEY_REGISTRY_INITIAL_CAPACITY = 2 ** 16
+# share of occupied slots beyond which a key registry is rehashed into a table twice as large
+KEY_REGISTRY_MAX_LOAD = 0.5
@@ -9,3 +9,13 @@ from etl.db.d_invoice import InvoiceDimension
 from etl.db.d_date import DateDimension
 from etl.db.d_product import ProductDimension
 from etl.db.f_transaction import TransactionFact
+from etl.db.s_invoice import InvoiceStaging, InvoiceCleanStaging
+from etl.db.q_quarantine import QuarantinedInvoice
+from etl.db.p_partition import PartitionState
+from etl.db.a_revenue import (
+    CountryMonthRevenueAggregate,
+    DailyRevenueAggregate,
+    MonthlyRevenueAggregate,
+    ProductMonthRevenueAggregate,
+    TypeMonthRevenueAggregate
+)
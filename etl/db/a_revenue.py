@@ -0,0 +1,64 @@
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Double
+from etl.db.core import Base
+from etl.constants import (
+    AGG_REVENUE_COUNTRY_MONTH_TABLE_NAME,
+    AGG_REVENUE_DAILY_TABLE_NAME,
+    AGG_REVENUE_MONTHLY_TABLE_NAME,
+    AGG_REVENUE_PRODUCT_MONTH_TABLE_NAME,
+    AGG_REVENUE_TYPE_MONTH_TABLE_NAME
+)
+
+class DailyRevenueAggregate(Base):
+    """Revenue summary of the transaction fact per invoice date."""
+    __tablename__ = AGG_REVENUE_DAILY_TABLE_NAME
+
+    date_key = Column(Integer, nullable=False, primary_key=True)
+    month_key = Column(Integer, nullable=False) # YYYYMM format as integer
+    line_count = Column(Integer, nullable=False) # number of fact rows
+    quantity = Column(BigInteger, nullable=False)
+    revenue = Column(Double, nullable=False) # sum of quantity x price of the source rows
+    _insert_txstamp = Column(DateTime, nullable=False)
+
+class MonthlyRevenueAggregate(Base):
+    """Revenue summary of the transaction fact per invoice month."""
+    __tablename__ = AGG_REVENUE_MONTHLY_TABLE_NAME
+
+    month_key = Column(Integer, nullable=False, primary_key=True)
+    line_count = Column(Integer, nullable=False)
+    quantity = Column(BigInteger, nullable=False)
+    revenue = Column(Double, nullable=False)
+    _insert_txstamp = Column(DateTime, nullable=False)
+
+class CountryMonthRevenueAggregate(Base):
+    """Revenue summary of the transaction fact per customer country and invoice month.
+    The country is the one of the customer version in effect on the invoice date."""
+    __tablename__ = AGG_REVENUE_COUNTRY_MONTH_TABLE_NAME
+
+    month_key = Column(Integer, nullable=False, primary_key=True)
+    country = Column(String(100), nullable=False, primary_key=True) # bounded, so it can be part of the key
+    line_count = Column(Integer, nullable=False)
+    quantity = Column(BigInteger, nullable=False)
+    revenue = Column(Double, nullable=False)
+    _insert_txstamp = Column(DateTime, nullable=False)
+
+class ProductMonthRevenueAggregate(Base):
+    """Revenue summary of the transaction fact per product and invoice month."""
+    __tablename__ = AGG_REVENUE_PRODUCT_MONTH_TABLE_NAME
+
+    month_key = Column(Integer, nullable=False, primary_key=True)
+    product_key = Column(Integer, nullable=False, primary_key=True)
+    line_count = Column(Integer, nullable=False)
+    quantity = Column(BigInteger, nullable=False)
+    revenue = Column(Double, nullable=False)
+    _insert_txstamp = Column(DateTime, nullable=False)
+
+class TypeMonthRevenueAggregate(Base):
+    """Revenue summary of the transaction fact per invoice type and invoice month."""
+    __tablename__ = AGG_REVENUE_TYPE_MONTH_TABLE_NAME
+
+    month_key = Column(Integer, nullable=False, primary_key=True)
+    type = Column(String(32), nullable=False, primary_key=True) # bounded, so it can be part of the key
+    line_count = Column(Integer, nullable=False)
+    quantity = Column(BigInteger, nullable=False)
+    revenue = Column(Double, nullable=False)
+    _insert_txstamp = Column(DateTime, nullable=False)
@@ -1,4 +1,3 @@
-import pyodbc
 from sqlalchemy.orm import DeclarativeBase
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy import create_engine, Engine
@@ -18,6 +17,9 @@ class DBContext:
     def create_db(self, server: str, username: str, password: str, db_name: str) -> None:
         """Create database if it doesn't exist on the server."""
         try:
+            # imported here so that the SQLite stand-in works without an ODBC driver manager installed
+            import pyodbc
+
             conn = pyodbc.connect(
                 f"DRIVER={{ODBC Driver 17 for SQL Server}};SERVER={server};UID={username};PWD={password};"
             )
@@ -30,11 +32,24 @@ class DBContext:
         except Exception as e:
             self.logger.critical(f"Error connecting to the database: {e}")
 
-    def get_engine(self, server: str, username: str, password: str, db_name: str) -> Engine:
-        """Creates and returns a SQLAlchemy engine."""
+    def get_engine(self, server: str, username: str, password: str, db_name: str, echo: bool = False) -> Engine:
+        """Creates and returns a SQLAlchemy engine.
+        `echo` logs every SQL statement, which slows down large loads."""
         connection_string: str = f"mssql+pyodbc://{username}:{password}@{server}/{db_name}?driver=ODBC+Driver+17+for+SQL+Server"
         self.logger.info(f"Creating SQLAlchemy engine to connect with Microsoft SQL Server '{db_name}' database.")
-        engine: Engine = create_engine(connection_string, echo=True)
+        engine: Engine = create_engine(connection_string, echo=echo)
+        self.logger.info("SQLAlchemy engine created successfully.")
+        return engine
+
+    def get_sqlite_engine(self, db_path: str, echo: bool = False) -> Engine:
+        """Creates and returns a SQLAlchemy engine for a local SQLite database file.
+        Used as a local stand-in for Microsoft SQL Server.
+        Connections may be used from other threads, e.g. by the background writer,
+        as long as only one thread uses a connection at a time."""
+        self.logger.info(f"Creating SQLAlchemy engine to connect with SQLite database '{db_path}'.")
+        engine: Engine = create_engine(
+            f"sqlite:///{db_path}", echo=echo, connect_args={"check_same_thread": False}
+        )
         self.logger.info("SQLAlchemy engine created successfully.")
         return engine
 
@@ -1,12 +1,16 @@
-from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy import Column, Integer, BigInteger, String, Date, DateTime, Boolean
 from etl.db.core import Base
 from etl.constants import DIM_CUSTOMER_TABLE_NAME
 
 class CustomerDimension(Base):
-    """Customer dimension table."""
+    """Customer dimension table, a type 2 slowly changing dimension with a row per customer version."""
     __tablename__ = DIM_CUSTOMER_TABLE_NAME
 
     customer_key = Column(Integer, nullable=False, primary_key=True)
     customer_id = Column(Integer, nullable=False)
     country = Column(String, nullable=False)
+    effective_from = Column(Date, nullable=False)
+    effective_to = Column(Date, nullable=True) # first day of the next version, NULL for the current version
+    is_current = Column(Boolean, nullable=False)
+    hash_diff = Column(BigInteger, nullable=False) # hash of the tracked attributes
     _insert_txstamp = Column(DateTime, nullable=False)
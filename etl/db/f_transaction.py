@@ -1,10 +1,23 @@
-from sqlalchemy import Column, Integer, DateTime, Double
+from sqlalchemy import Column, Integer, DateTime, Double, Index
 from etl.db.core import Base
 from etl.constants import FACT_TRANSACTION_TABLE_NAME
 
 class TransactionFact(Base):
-    """Transactions fact table."""
+    """Transactions fact table.
+    The primary key leads with the date key, so it serves queries by date. Secondary indexes serve
+    queries by product and by customer, and on Microsoft SQL Server a nonclustered columnstore index
+    serves scans and aggregations. Full loads drop the secondary indexes and create them again afterwards."""
     __tablename__ = FACT_TRANSACTION_TABLE_NAME
+    __table_args__ = (
+        Index(f"ix_{FACT_TRANSACTION_TABLE_NAME}_product_key", "product_key", "date_key"),
+        Index(f"ix_{FACT_TRANSACTION_TABLE_NAME}_customer_key", "customer_key", "date_key"),
+        Index(
+            f"cs_{FACT_TRANSACTION_TABLE_NAME}",
+            "date_key", "invoice_key", "product_key", "customer_key", "quantity", "price",
+            mssql_clustered=False,
+            mssql_columnstore=True
+        ).ddl_if(dialect="mssql"),
+    )
 
     date_key = Column(Integer, nullable=False, primary_key=True)
     invoice_key = Column(Integer, nullable=False, primary_key=True)
@@ -0,0 +1,171 @@
+import time
+import pandas as pd
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Any, Iterator
+from sqlalchemy import Date
+from sqlalchemy.orm import Session, sessionmaker
+from etl.constants import LOAD_BATCH_SIZE
+from etl.db.core import Base
+from etl.instrumentation import RunInstrumentation
+from etl.logger import get_logger
+
+
+@dataclass
+class LoadResult:
+    """Number of rows loaded into a table and the time it took."""
+    table_name: str
+    rows: int
+    seconds: float
+
+    @property
+    def rows_per_second(self) -> float:
+        """Load throughput in rows per second."""
+        return self.rows / self.seconds if self.seconds > 0 else float("inf")
+
+
+class BulkLoader(ABC):
+    """Base class for loaders that insert a DataFrame into a table in batches.
+    Each batch is built straight from the DataFrame column buffers as a list of
+    row tuples and sent with a single DBAPI `executemany` call, so no per-row dicts
+    or ORM mappings are created.
+    If `instrumentation` is set, every load is measured as a 'load.<table name>' stage."""
+    def __init__(self, batch_size: int = LOAD_BATCH_SIZE, instrumentation: RunInstrumentation | None = None):
+        self.logger = get_logger(self.__class__.__name__)
+        self.batch_size: int = batch_size
+        self.instrumentation: RunInstrumentation | None = instrumentation
+        self.results: list[LoadResult] = []
+
+    @abstractmethod
+    def _prepare_cursor(self, cursor: Any) -> None:
+        """Configure the DBAPI cursor before the batches are sent."""
+
+    def _placeholder(self, paramstyle: str, position: int) -> str:
+        """Return the bind parameter placeholder for the driver's paramstyle."""
+        if paramstyle == "qmark":
+            return "?"
+        if paramstyle in ("format", "pyformat"):
+            return "%s"
+        if paramstyle == "numeric":
+            return f":{position}"
+        raise ValueError(f"Unsupported DBAPI paramstyle for bulk loading: {paramstyle}")
+
+    def _build_insert_statement(self, session: sessionmaker[Session], table_name: str, columns: list[str]) -> str:
+        """Build a positional INSERT statement for the given table and columns."""
+        dialect = session.get_bind().dialect
+        quote = dialect.identifier_preparer.quote
+        column_list = ", ".join(quote(column) for column in columns)
+        placeholders = ", ".join(
+            self._placeholder(dialect.paramstyle, position) for position in range(1, len(columns) + 1)
+        )
+        return f"INSERT INTO {quote(table_name)} ({column_list}) VALUES ({placeholders})"
+
+    def _to_python_values(self, series: pd.Series, is_date_column: bool) -> list:
+        """Convert a column slice to a list of values the DBAPI driver can bind."""
+        if pd.api.types.is_datetime64_any_dtype(series.dtype):
+            if is_date_column:
+                values = series.dt.date.to_numpy(dtype=object)
+            else:
+                values = pd.DatetimeIndex(series).to_pydatetime()
+        elif isinstance(series.dtype, pd.CategoricalDtype):
+            values = series.to_numpy(dtype=object)
+        else:
+            values = series.to_numpy()
+
+        if series.hasnans:
+            values = values.astype(object)
+            values[series.isna().to_numpy()] = None
+
+        return values.tolist()
+
+    def _iter_batches(self, df: pd.DataFrame, columns: list[str], date_columns: set[str]) -> Iterator[list[tuple]]:
+        """Yield the DataFrame as lists of row tuples of at most `batch_size` rows."""
+        for start in range(0, len(df), self.batch_size):
+            batch: pd.DataFrame = df.iloc[start:start + self.batch_size]
+            buffers = [self._to_python_values(batch[column], column in date_columns) for column in columns]
+            yield list(zip(*buffers))
+
+    def _execute_batches(
+        self,
+        df: pd.DataFrame,
+        columns: list[str],
+        date_columns: set[str],
+        statement: str,
+        session: sessionmaker[Session]
+    ) -> None:
+        """Send the DataFrame to the database in batches on the session's connection."""
+        cursor = session.connection().connection.cursor()
+        try:
+            self._prepare_cursor(cursor)
+            for batch in self._iter_batches(df, columns, date_columns):
+                cursor.executemany(statement, batch)
+        finally:
+            cursor.close()
+
+    def load(
+        self,
+        df: pd.DataFrame,
+        model: type[Base],
+        session: sessionmaker[Session],
+        table_name: str | None = None
+    ) -> LoadResult:
+        """Insert the model's columns of a DataFrame into `table_name` (the model's table by default).
+        Rows are written on the session's connection, so they are part of its transaction."""
+        table_name = table_name or model.__tablename__
+        columns: list[str] = [column.name for column in model.__table__.columns if column.name in df.columns]
+        date_columns: set[str] = {
+            column.name for column in model.__table__.columns if isinstance(column.type, Date)
+        }
+        statement: str = self._build_insert_statement(session, table_name, columns)
+
+        start = time.perf_counter()
+        if self.instrumentation is None:
+            self._execute_batches(df, columns, date_columns, statement, session)
+        else:
+            with self.instrumentation.stage(f"load.{table_name}", rows_in=len(df)) as stage:
+                self._execute_batches(df, columns, date_columns, statement, session)
+                stage.add_rows_out(len(df))
+                stage.add_bytes_written(int(df[columns].memory_usage(index=False, deep=True).sum()))
+
+        result = LoadResult(table_name=table_name, rows=len(df), seconds=time.perf_counter() - start)
+        self.results.append(result)
+        self.logger.info(
+            f"Loaded {result.rows} rows into '{table_name}' in {result.seconds:.2f}s "
+            f"({result.rows_per_second:,.0f} rows/sec)"
+        )
+        return result
+
+    def report(self) -> dict[str, LoadResult]:
+        """Return the loads performed so far, totalled per table."""
+        totals: dict[str, LoadResult] = {}
+        for result in self.results:
+            total = totals.setdefault(result.table_name, LoadResult(result.table_name, 0, 0.0))
+            total.rows += result.rows
+            total.seconds += result.seconds
+        return totals
+
+
+class ExecutemanyLoader(BulkLoader):
+    """Loader using the driver's plain `executemany`, e.g. for SQLite as a local stand-in."""
+    def _prepare_cursor(self, cursor: Any) -> None:
+        """Plain executemany needs no cursor configuration."""
+
+
+class PyodbcFastExecutemanyLoader(BulkLoader):
+    """Loader for SQL Server through pyodbc.
+    Enables `fast_executemany`, so each batch is bound as parameter arrays
+    and sent in one round-trip instead of one round-trip per row."""
+    def _prepare_cursor(self, cursor: Any) -> None:
+        """Enable pyodbc array binding on the cursor."""
+        cursor.fast_executemany = True
+
+
+def get_bulk_loader(
+    session: sessionmaker[Session],
+    batch_size: int = LOAD_BATCH_SIZE,
+    instrumentation: RunInstrumentation | None = None
+) -> BulkLoader:
+    """Return the fastest bulk loader available for the session's database driver."""
+    if session.get_bind().dialect.driver == "pyodbc":
+        return PyodbcFastExecutemanyLoader(batch_size=batch_size, instrumentation=instrumentation)
+    return ExecutemanyLoader(batch_size=batch_size, instrumentation=instrumentation)
@@ -0,0 +1,12 @@
+from sqlalchemy import Column, Integer, String, DateTime
+from etl.db.core import Base
+from etl.constants import PARTITION_STATE_TABLE_NAME
+
+class PartitionState(Base):
+    """Content hash of every month partition of the cleaned source, as last loaded into the star schema."""
+    __tablename__ = PARTITION_STATE_TABLE_NAME
+
+    month_key = Column(Integer, nullable=False, primary_key=True) # YYYYMM format as integer
+    row_count = Column(Integer, nullable=False)
+    content_hash = Column(String(64), nullable=False) # sha256 hex digest
+    _insert_txstamp = Column(DateTime, nullable=False)
@@ -0,0 +1,23 @@
+from sqlalchemy import Column, Integer, String, DateTime
+from etl.db.core import Base
+from etl.constants import DQ_QUARANTINE_TABLE_NAME
+
+class QuarantinedInvoice(Base):
+    """Source rows failing data-quality rules, as text, with the codes of the rules they fail.
+    Rows are tagged with the ID of the run that quarantined them and the YYYYMM month of their invoice date,
+    missing if the date cannot be parsed."""
+    __tablename__ = DQ_QUARANTINE_TABLE_NAME
+
+    quarantine_key = Column(Integer, nullable=False, primary_key=True, autoincrement=True)
+    invoice_no = Column(String, nullable=True)
+    code = Column(String, nullable=True)
+    description = Column(String, nullable=True)
+    quantity = Column(String, nullable=True)
+    invoice_date = Column(String, nullable=True)
+    price = Column(String, nullable=True)
+    customer_id = Column(String, nullable=True)
+    country = Column(String, nullable=True)
+    reason_codes = Column(String, nullable=False) # comma separated rule codes
+    month_key = Column(Integer, nullable=True)
+    run_id = Column(String(32), nullable=False)
+    _insert_txstamp = Column(DateTime, nullable=False)
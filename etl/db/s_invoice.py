@@ -0,0 +1,33 @@
+from sqlalchemy import Column, Integer, String, Date, Double
+from etl.db.core import Base
+from etl.constants import STG_INVOICE_TABLE_NAME, STG_INVOICE_CLEAN_TABLE_NAME
+
+class InvoiceStaging(Base):
+    """Staging table holding the raw invoices CSV file as text, in file order (ELT mode)."""
+    __tablename__ = STG_INVOICE_TABLE_NAME
+
+    row_id = Column(Integer, nullable=False, primary_key=True) # position in the source file
+    invoice_no = Column(String, nullable=True)
+    code = Column(String, nullable=True)
+    description = Column(String, nullable=True)
+    quantity = Column(String, nullable=True)
+    invoice_date = Column(String, nullable=True) # YYYY-MM-DD, normalised while staging
+    price = Column(String, nullable=True)
+    customer_id = Column(String, nullable=True)
+    country = Column(String, nullable=True)
+
+
+class InvoiceCleanStaging(Base):
+    """Staging table holding the cast, cleaned and classified invoices (ELT mode)."""
+    __tablename__ = STG_INVOICE_CLEAN_TABLE_NAME
+
+    row_id = Column(Integer, nullable=False, primary_key=True)
+    invoice_no = Column(String, nullable=False)
+    code = Column(String, nullable=False)
+    description = Column(String, nullable=False)
+    quantity = Column(Integer, nullable=False)
+    invoice_date = Column(Date, nullable=False)
+    price = Column(Double, nullable=False)
+    customer_id = Column(Integer, nullable=False)
+    country = Column(String, nullable=False)
+    type = Column(String, nullable=False)
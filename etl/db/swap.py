@@ -0,0 +1,64 @@
+from sqlalchemy import MetaData, Table
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.sql import text
+from etl.db.core import Base
+from etl.logger import get_logger
+
+
+class ShadowTables:
+    """Shadow copies of tables that are loaded while the live tables stay readable,
+    then swapped into place by renaming them in a single transaction.
+    SQLite renames with ALTER TABLE ... RENAME TO and Microsoft SQL Server with sp_rename,
+    both of which are transactional, so readers see either all old or all new tables.
+    Shadow tables are loaded without secondary indexes, which are created on the tables
+    once swapped into place, as SQLite index names are unique per database."""
+    def __init__(self, models: list[type[Base]], suffix: str = "_shadow"):
+        self.logger = get_logger(self.__class__.__name__)
+        self.models: list[type[Base]] = models
+        self.suffix: str = suffix
+
+    def shadow_name(self, model: type[Base]) -> str:
+        """Return the name of the shadow table of a model."""
+        return f"{model.__tablename__}{self.suffix}"
+
+    def _shadow_table(self, model: type[Base]) -> Table:
+        """Return the shadow table of a model, with the model's columns and primary key but no secondary indexes."""
+        shadow_table: Table = model.__table__.to_metadata(MetaData(), name=self.shadow_name(model))
+        shadow_table.indexes.clear()
+        return shadow_table
+
+    def create(self, session: sessionmaker[Session], copy_rows_of: list[type[Base]] | None = None) -> None:
+        """(Re-)create empty shadow tables. Tables of the models in `copy_rows_of` are copied
+        into their shadow, for tables that are extended rather than rebuilt."""
+        connection = session.connection()
+        for model in self.models:
+            shadow_table: Table = self._shadow_table(model)
+            shadow_table.drop(bind=connection, checkfirst=True)
+            shadow_table.create(bind=connection)
+            self.logger.info(f"Created shadow table '{shadow_table.name}'")
+
+        for model in copy_rows_of or []:
+            columns: str = ", ".join(column.name for column in model.__table__.columns)
+            session.execute(text(
+                f"INSERT INTO {self.shadow_name(model)} ({columns}) SELECT {columns} FROM {model.__tablename__}"
+            ))
+
+    def _rename(self, session: sessionmaker[Session], table_name: str, new_table_name: str) -> None:
+        """Rename a table in the session's transaction."""
+        if session.get_bind().dialect.name == "mssql":
+            session.execute(text(f"EXEC sp_rename '{table_name}', '{new_table_name}'"))
+        else:
+            session.execute(text(f"ALTER TABLE {table_name} RENAME TO {new_table_name}"))
+
+    def swap(self, session: sessionmaker[Session]) -> None:
+        """Swap the shadow tables into place, drop the replaced tables and create the secondary indexes
+        of the swapped tables. The swap becomes visible when the session commits."""
+        for model in self.models:
+            table_name: str = model.__tablename__
+            replaced_name: str = f"{table_name}_replaced"
+            self._rename(session, table_name, replaced_name)
+            self._rename(session, self.shadow_name(model), table_name)
+            session.execute(text(f"DROP TABLE {replaced_name}"))
+            for index in model.__table__.indexes:
+                index.create(bind=session.connection(), checkfirst=True)
+            self.logger.info(f"Swapped shadow table into '{table_name}'")
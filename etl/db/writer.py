@@ -0,0 +1,69 @@
+import queue
+import threading
+from typing import Callable
+from etl.constants import WRITER_MAX_PENDING
+from etl.logger import get_logger
+
+
+class BackgroundWriter:
+    """Runs database writes, such as truncates and bulk inserts, on a background thread in submission order,
+    so the pipeline can transform the next table or chunk while the previous one is written.
+    Writes wait in a bounded queue: once `max_pending` writes are waiting, `submit` blocks until
+    the writer catches up, which keeps the frames held for writing bounded.
+    The first failing write stops all later writes, and its exception is raised on the pipeline's
+    thread by the next `submit` or `flush`.
+    Writes run on the session of the pipeline, which must not be used by the pipeline's thread
+    until `flush` returns. SQLite connections must therefore allow use from other threads."""
+    def __init__(self, max_pending: int = WRITER_MAX_PENDING):
+        self.logger = get_logger(self.__class__.__name__)
+        self.pending: queue.Queue[Callable[[], object] | None] = queue.Queue(maxsize=max_pending)
+        self.error: BaseException | None = None
+        self.cancelled = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="writer", daemon=True)
+        self.thread.start()
+
+    def _run(self) -> None:
+        """Run submitted writes until the stop marker is received.
+        After a failure or cancellation the remaining writes are skipped."""
+        while True:
+            write = self.pending.get()
+            try:
+                if write is None:
+                    return
+                if self.error is None and not self.cancelled.is_set():
+                    write()
+            except BaseException as e:
+                self.logger.critical(f"Background write failed: {e}")
+                self.error = e
+            finally:
+                self.pending.task_done()
+
+    def _raise_error(self) -> None:
+        """Raise the exception of a failed write on the calling thread."""
+        if self.error is not None:
+            raise self.error
+
+    def submit(self, write: Callable[[], object]) -> None:
+        """Queue a write, blocking while `max_pending` writes are already waiting."""
+        self._raise_error()
+        self.pending.put(write)
+
+    def flush(self) -> None:
+        """Wait until every queued write has run, raising the exception of a failed write."""
+        self.pending.join()
+        self._raise_error()
+
+    def cancel(self) -> None:
+        """Skip the queued writes and wait for the write in progress, e.g. before rolling back."""
+        self.cancelled.set()
+        self.pending.join()
+        self.error = None
+        self.cancelled.clear()
+
+    def close(self) -> None:
+        """Skip the queued writes and stop the background thread."""
+        if not self.thread.is_alive():
+            return
+        self.cancelled.set()
+        self.pending.put(None)
+        self.thread.join()
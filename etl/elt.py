@@ -0,0 +1,382 @@
+import datetime
+import numpy as np
+import pandas as pd
+from dataclasses import dataclass
+from typing import Iterable
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.sql import text
+from etl.constants import (
+    COUNTRY_MAPPING,
+    DIM_CUSTOMER_TABLE_NAME,
+    DIM_DATE_TABLE_NAME,
+    DIM_INVOICE_TABLE_NAME,
+    DIM_PRODUCT_TABLE_NAME,
+    FACT_TRANSACTION_TABLE_NAME,
+    INVOICE_TYPE_RULES,
+    PARTITION_STATE_TABLE_NAME,
+    SOURCE_COLUMN_NAMES,
+    STG_INVOICE_CLEAN_TABLE_NAME,
+    STG_INVOICE_TABLE_NAME,
+    UNKNOWN_INVOICE_TYPE
+)
+from etl.db.f_transaction import TransactionFact
+from etl.db.loader import BulkLoader, get_bulk_loader
+from etl.db.s_invoice import InvoiceStaging
+from etl.instrumentation import RunInstrumentation
+from etl.logger import get_logger
+from etl.transformations.a_revenue import ETLRevenueAggregate, create_revenue_aggregate_steps
+from etl.transformations.d_customer import ETLCustomerDimension
+from etl.transformations.d_date import ETLDateDimension
+from etl.transformations.d_product import ETLProductDimension
+from etl.transformations.f_transaction import ETLTransactionFact
+
+
+@dataclass
+class ELTDialect:
+    """SQL fragments that differ between the databases the ELT mode runs on.
+    Each fragment is a format string taking the column expression as `{column}`."""
+    # cast text to a float, NULL if it is not a number
+    to_float: str
+    # whether the column contains the literal 'TEST', case-sensitively
+    contains_test: str
+    # strip leading and trailing whitespace, like str.strip in pandas
+    strip: str
+    # YYYYMMDD integer key of a date column
+    date_key: str
+    # collation comparing strings by code point, like Python
+    binary_collation: str
+
+
+ELT_DIALECTS: dict[str, ELTDialect] = {
+    "sqlite": ELTDialect(
+        # SQLite casts text that is not a number to 0 instead of NULL
+        to_float="CASE WHEN trim({column}) GLOB '*[0-9]*' AND trim({column}) NOT GLOB '*[^0-9.eE+-]*' "
+                 "THEN CAST({column} AS REAL) END",
+        contains_test="instr({column}, 'TEST') > 0",
+        strip="trim({column}, ' ' || char(9, 10, 11, 12, 13))",
+        date_key="CAST(strftime('%Y%m%d', {column}) AS INTEGER)",
+        binary_collation="",
+    ),
+    "mssql": ELTDialect(
+        to_float="TRY_CAST({column} AS FLOAT)",
+        contains_test="CHARINDEX('TEST', {column} COLLATE Latin1_General_CS_AS) > 0",
+        strip="TRIM(' ' + CHAR(9) + CHAR(10) + CHAR(11) + CHAR(12) + CHAR(13) FROM {column})",
+        date_key="(YEAR({column}) * 10000 + MONTH({column}) * 100 + DAY({column}))",
+        binary_collation=" COLLATE Latin1_General_BIN2",
+    ),
+}
+
+
+def _quote(value: str) -> str:
+    """Quote a string as a SQL literal."""
+    return "'" + value.replace("'", "''") + "'"
+
+
+class ELTPipeline():
+    """ELT Pipeline class that loads the invoices CSV file into the star schema with set-based SQL
+    inside the target database, producing the same tables as `ETLPipeline`:
+    1. The raw CSV file is bulk-loaded as text into a staging table, chunk by chunk.
+    Invoice dates are normalised to YYYY-MM-DD while staging, as date parsing differs between databases.
+    2. Casting, TEST filtering, invoice type classification, country mapping and code cleanup run as a
+    single INSERT ... SELECT into a cleaned staging table.
+    3. The invoice dimension and the transaction fact are built with INSERT ... SELECT.
+    4. The top description per product code is ranked in SQL. Descriptions are cleaned up in pandas,
+    on one row per product code, as regular expressions are not portable across databases.
+    5. Rows per customer, invoice date and country are counted in SQL and the customer versions
+    are created from them in pandas. The fact joins the version in effect on the invoice date.
+    6. The revenue summaries are built with INSERT ... SELECT over the fact rows and their revenue.
+    7. The staging tables are truncated in the same transaction, so no copy of the source is kept in the database.
+    Only full loads are supported."""
+    def __init__(
+        self,
+        session: sessionmaker[Session],
+        loader: BulkLoader | None = None,
+        instrumentation: RunInstrumentation | None = None
+    ):
+        self.logger = get_logger(self.__class__.__name__)
+        self.instrumentation: RunInstrumentation = instrumentation if instrumentation is not None else RunInstrumentation()
+        self.db_session: sessionmaker[Session] = session
+        self.loader: BulkLoader = loader if loader is not None else get_bulk_loader(session)
+        # loads are reported as stages of this run
+        self.loader.instrumentation = self.instrumentation
+
+        dialect_name: str = session.get_bind().dialect.name
+        if dialect_name not in ELT_DIALECTS:
+            raise ValueError(f"ELT mode does not support the '{dialect_name}' database")
+        self.dialect: ELTDialect = ELT_DIALECTS[dialect_name]
+
+        self.etl_date_dim = ETLDateDimension(table_name=DIM_DATE_TABLE_NAME, session=session, loader=self.loader)
+        self.etl_customer_dim = ETLCustomerDimension(table_name=DIM_CUSTOMER_TABLE_NAME, session=session, loader=self.loader)
+        self.etl_product_dim = ETLProductDimension(table_name=DIM_PRODUCT_TABLE_NAME, session=session, loader=self.loader)
+        self.etl_transaction_fact = ETLTransactionFact(table_name=FACT_TRANSACTION_TABLE_NAME, session=session, loader=self.loader)
+        self.etl_revenue_aggregates: list[ETLRevenueAggregate] = create_revenue_aggregate_steps(session=session, loader=self.loader)
+
+    def commit(self) -> None:
+        """Commit the pipeline session."""
+        self.db_session.commit()
+
+    def rollback(self) -> None:
+        """Roll back the pipeline session."""
+        self.db_session.rollback()
+
+    def close(self) -> None:
+        """Close the pipeline session."""
+        self.db_session.close()
+
+    def _execute(self, stage_name: str, statement: str, **params) -> int:
+        """Execute a set-based statement as an instrumented stage and return the number of rows it wrote."""
+        with self.instrumentation.stage(stage_name) as stage:
+            rows: int = self.db_session.execute(text(statement), params).rowcount
+            stage.add_rows_out(rows)
+        return rows
+
+    def _truncate_tables(self) -> None:
+        """Truncate the staging tables and the tables built in SQL.
+        The customer and product dimensions are truncated by their steps, the date dimension is persistent.
+        The stored month partition hashes are truncated too, as every month is loaded again."""
+        for table_name in [
+            STG_INVOICE_TABLE_NAME,
+            STG_INVOICE_CLEAN_TABLE_NAME,
+            FACT_TRANSACTION_TABLE_NAME,
+            DIM_INVOICE_TABLE_NAME,
+            PARTITION_STATE_TABLE_NAME,
+            *[step.table_name for step in self.etl_revenue_aggregates],
+        ]:
+            self.etl_transaction_fact.truncate_table(table_name=table_name, session=self.db_session)
+
+    def _truncate_staging_tables(self) -> None:
+        """Truncate the staging tables once the star schema is loaded from them."""
+        with self.instrumentation.stage("elt.truncate_staging"):
+            for table_name in [STG_INVOICE_TABLE_NAME, STG_INVOICE_CLEAN_TABLE_NAME]:
+                self.etl_transaction_fact.truncate_table(table_name=table_name, session=self.db_session)
+
+    def _stage_source(self, source_chunks: Iterable[pd.DataFrame]) -> None:
+        """Bulk-load the raw source chunks into the staging table, numbering rows in file order.
+        Chunks must be read as text, e.g. with `dtype=str`."""
+        row_offset = 0
+        with self.instrumentation.stage("elt.stage_source") as stage:
+            for chunk in source_chunks:
+                chunk = chunk.rename(columns=SOURCE_COLUMN_NAMES)
+                chunk["invoice_date"] = pd.to_datetime(chunk["invoice_date"]).dt.strftime("%Y-%m-%d")
+                chunk["row_id"] = np.arange(row_offset, row_offset + len(chunk))
+                row_offset += len(chunk)
+
+                self.loader.load(df=chunk, model=InvoiceStaging, session=self.db_session)
+                stage.add_rows_out(len(chunk))
+
+    def _sign_class(self, column: str) -> str:
+        """SQL expression classifying a numeric column as 'negative', 'zero' or 'positive'.
+        NULL falls through to 'zero', like NaN in `ETLPipeline._classify_sign`."""
+        return f"CASE WHEN {column} < 0 THEN 'negative' WHEN {column} > 0 THEN 'positive' ELSE 'zero' END"
+
+    def _invoice_type(self) -> str:
+        """SQL expression classifying the invoice type with INVOICE_TYPE_RULES."""
+        rules = " ".join(
+            f"WHEN quantity_class = {_quote(quantity_class)} AND price_class = {_quote(price_class)} "
+            f"THEN {_quote(invoice_type)}"
+            for (quantity_class, price_class), invoice_type in INVOICE_TYPE_RULES.items()
+        )
+        return f"CASE {rules} ELSE {_quote(UNKNOWN_INVOICE_TYPE)} END"
+
+    def _cleanup_country(self) -> str:
+        """SQL expression mapping the country column with COUNTRY_MAPPING."""
+        mapping = " ".join(f"WHEN {_quote(country)} THEN {_quote(clean)}" for country, clean in COUNTRY_MAPPING.items())
+        return f"CASE country {mapping} ELSE country END"
+
+    def _clean_source(self) -> None:
+        """Cast, filter, classify and clean the staged source into the cleaned staging table,
+        in the same way as `ETLPipeline.transform_source`. Missing strings become 'nan' as with `astype(str)`."""
+        dialect = self.dialect
+        self._execute("elt.clean_source", f"""
+            INSERT INTO {STG_INVOICE_CLEAN_TABLE_NAME}
+                (row_id, invoice_no, code, description, quantity, invoice_date, price, customer_id, country, type)
+            SELECT
+                row_id,
+                invoice_no,
+                UPPER({dialect.strip.format(column="code")}),
+                description,
+                quantity,
+                invoice_date,
+                price,
+                customer_id,
+                {self._cleanup_country()},
+                {self._invoice_type()}
+            FROM (
+                SELECT
+                    cast_source.*,
+                    {self._sign_class("quantity")} AS quantity_class,
+                    {self._sign_class("price")} AS price_class
+                FROM (
+                    SELECT
+                        row_id,
+                        COALESCE(invoice_no, 'nan') AS invoice_no,
+                        COALESCE(code, 'nan') AS code,
+                        COALESCE(description, 'nan') AS description,
+                        CAST(quantity AS INTEGER) AS quantity,
+                        invoice_date,
+                        {dialect.to_float.format(column="price")} AS price,
+                        COALESCE(CAST({dialect.to_float.format(column="customer_id")} AS INTEGER), -1) AS customer_id,
+                        COALESCE(country, 'nan') AS country
+                    FROM {STG_INVOICE_TABLE_NAME}
+                ) cast_source
+                WHERE NOT ({dialect.contains_test.format(column="code")})
+            ) classified_source
+        """)
+
+    def _load_date_dim(self) -> None:
+        """Extend the calendar with the calendar years spanned by the cleaned source."""
+        members: pd.DataFrame = pd.read_sql(
+            text(f"SELECT MIN(invoice_date) AS first_date, MAX(invoice_date) AS last_date FROM {STG_INVOICE_CLEAN_TABLE_NAME}"),
+            self.db_session.connection()
+        ).dropna()
+        members = members.apply(pd.to_datetime)
+
+        with self.instrumentation.stage("dimension.date") as stage:
+            stage.add_rows_out(len(self.etl_date_dim.run_etl_from_members(members=members)))
+
+    def _load_invoice_dim(self, insert_txstamp: datetime.datetime) -> None:
+        """Create the invoice dimension, keyed in order of first appearance like `drop_duplicates`."""
+        self._execute("dimension.invoice", f"""
+            INSERT INTO {DIM_INVOICE_TABLE_NAME} (invoice_key, invoice_no, type, _insert_txstamp)
+            SELECT ROW_NUMBER() OVER (ORDER BY MIN(row_id)), invoice_no, type, :insert_txstamp
+            FROM {STG_INVOICE_CLEAN_TABLE_NAME}
+            GROUP BY invoice_no, type
+        """, insert_txstamp=insert_txstamp)
+
+    def _load_customer_dim(self) -> None:
+        """Count the rows per customer, invoice date and country in SQL and create the customer versions
+        from the counts through the customer step, as in `ETLCustomerDimension.collect_members`."""
+        with self.instrumentation.stage("dimension.customer") as stage:
+            members: pd.DataFrame = pd.read_sql(text(f"""
+                SELECT customer_id, invoice_date, country, COUNT(*) AS size
+                FROM {STG_INVOICE_CLEAN_TABLE_NAME}
+                GROUP BY customer_id, invoice_date, country
+            """), self.db_session.connection())
+            members["invoice_date"] = pd.to_datetime(members["invoice_date"])
+
+            customer_dim: pd.DataFrame = self.etl_customer_dim.run_etl_from_members(members=members)
+            stage.add_rows_out(len(customer_dim))
+
+    def _load_product_dim(self) -> None:
+        """Rank the descriptions of each product code in SQL and load the top ones through the product step.
+        Ties go to the smallest description by code point, as in `ETLProductDimension._deduplicate_description`."""
+        with self.instrumentation.stage("dimension.product") as stage:
+            top_descriptions: pd.DataFrame = pd.read_sql(text(f"""
+                SELECT code, description
+                FROM (
+                    SELECT
+                        code,
+                        description,
+                        ROW_NUMBER() OVER (
+                            PARTITION BY code
+                            ORDER BY COUNT(*) DESC, description{self.dialect.binary_collation}
+                        ) AS description_rank
+                    FROM {STG_INVOICE_CLEAN_TABLE_NAME}
+                    GROUP BY code, description
+                ) ranked_descriptions
+                WHERE description_rank = 1
+            """), self.db_session.connection())
+
+            product_dim: pd.DataFrame = self.etl_product_dim.run_etl_from_top_descriptions(top_descriptions)
+            stage.add_rows_out(len(product_dim))
+
+    def _join_dimensions(self) -> str:
+        """FROM clause joining the cleaned source with the invoice, customer and product dimensions."""
+        return f"""
+            FROM {STG_INVOICE_CLEAN_TABLE_NAME} s
+            LEFT JOIN {DIM_INVOICE_TABLE_NAME} i ON i.invoice_no = s.invoice_no AND i.type = s.type
+            LEFT JOIN {DIM_CUSTOMER_TABLE_NAME} c ON c.customer_id = s.customer_id
+                -- anonymous customers are kept apart by country, the version in effect on the invoice date is joined
+                AND (s.customer_id >= 0 OR c.country = s.country)
+                AND c.effective_from <= s.invoice_date AND (c.effective_to IS NULL OR s.invoice_date < c.effective_to)
+            LEFT JOIN {DIM_PRODUCT_TABLE_NAME} p ON p.code = s.code
+        """
+
+    def _assert_no_missing_dim_keys(self) -> None:
+        """Assert that every cleaned source row has a key in each dimension."""
+        missing_keys: pd.Series = pd.read_sql(text(f"""
+            SELECT
+                SUM(CASE WHEN i.invoice_key IS NULL THEN 1 ELSE 0 END) AS invoice_key,
+                SUM(CASE WHEN p.product_key IS NULL THEN 1 ELSE 0 END) AS product_key,
+                SUM(CASE WHEN c.customer_key IS NULL THEN 1 ELSE 0 END) AS customer_key
+            {self._join_dimensions()}
+        """), self.db_session.connection()).iloc[0].fillna(0)
+
+        if missing_keys.any():
+            missing_cols = missing_keys[missing_keys > 0]
+            raise ValueError(f"Missing values found in the following columns: {', '.join(missing_cols.index)}")
+
+    def _load_transaction_fact(self, insert_txstamp: datetime.datetime) -> None:
+        """Create the transaction fact grouped to the fact grain.
+        Rows are inserted in primary key order without secondary indexes, which are created afterwards."""
+        self._assert_no_missing_dim_keys()
+
+        self.etl_transaction_fact.drop_indexes(model=TransactionFact)
+        date_key: str = self.dialect.date_key.format(column="s.invoice_date")
+        self._execute("fact.transaction", f"""
+            INSERT INTO {FACT_TRANSACTION_TABLE_NAME}
+                (date_key, invoice_key, product_key, customer_key, quantity, price, _insert_txstamp)
+            SELECT {date_key}, i.invoice_key, p.product_key, c.customer_key, SUM(s.quantity), SUM(s.price), :insert_txstamp
+            {self._join_dimensions()}
+            GROUP BY {date_key}, i.invoice_key, p.product_key, c.customer_key
+            ORDER BY {date_key}, i.invoice_key, p.product_key, c.customer_key
+        """, insert_txstamp=insert_txstamp)
+        with self.instrumentation.stage("fact.indexes"):
+            self.etl_transaction_fact.create_indexes(model=TransactionFact)
+
+    def _load_revenue_aggregates(self, insert_txstamp: datetime.datetime) -> None:
+        """Create the revenue summaries, grouped like `ETLRevenueAggregate.summarize`.
+        Revenue is computed per cleaned source row before rows are grouped to the fact grain."""
+        date_key: str = self.dialect.date_key.format(column="s.invoice_date")
+        revenue_lines: str = f"""
+            SELECT fact_lines.*, fact_lines.date_key / 100 AS month_key
+            FROM (
+                SELECT
+                    {date_key} AS date_key, p.product_key, i.type, c.country,
+                    SUM(s.quantity) AS quantity, SUM(s.quantity * s.price) AS revenue
+                {self._join_dimensions()}
+                GROUP BY {date_key}, i.invoice_key, p.product_key, c.customer_key, i.type, c.country
+            ) fact_lines
+        """
+        for step in self.etl_revenue_aggregates:
+            group_by: str = ", ".join(step.group_by)
+            self._execute(f"aggregate.{step.table_name}", f"""
+                INSERT INTO {step.table_name} ({group_by}, line_count, quantity, revenue, _insert_txstamp)
+                SELECT {group_by}, COUNT(*), SUM(quantity), SUM(revenue), :insert_txstamp
+                FROM ({revenue_lines}) revenue_lines
+                GROUP BY {group_by}
+            """, insert_txstamp=insert_txstamp)
+
+    def run_pipeline(self, source_chunks: Iterable[pd.DataFrame]):
+        """Run ELT pipeline to full-load the invoices CSV file, given as chunks read as text."""
+        insert_txstamp = datetime.datetime.now()
+
+        self.logger.info("Truncating staging tables and star schema for full-load")
+        self._truncate_tables()
+
+        self.logger.info("Staging raw source in the database")
+        self._stage_source(source_chunks)
+
+        self.logger.info("Cleaning staged source in the database")
+        self._clean_source()
+
+        self.logger.info("Run date dimension elt step")
+        self._load_date_dim()
+
+        self.logger.info("Run invoice dimension elt step")
+        self._load_invoice_dim(insert_txstamp)
+
+        self.logger.info("Run customer dimension elt step")
+        self._load_customer_dim()
+
+        self.logger.info("Run product dimension elt step")
+        self._load_product_dim()
+
+        self.logger.info("Run transaction fact elt step")
+        self._load_transaction_fact(insert_txstamp)
+
+        self.logger.info("Run revenue summary elt steps")
+        self._load_revenue_aggregates(insert_txstamp)
+
+        self.logger.info("Truncating staging tables")
+        self._truncate_staging_tables()
@@ -0,0 +1,140 @@
+import cProfile
+import datetime
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import Iterator
+from etl.logger import get_logger
+
+try:
+    # only available on Unix, peak memory is not reported elsewhere
+    import resource
+except ImportError:
+    resource = None
+
+
+def current_rss_bytes() -> int | None:
+    """Return the current resident set size of the process in bytes, or None where it is unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+def peak_rss_bytes() -> int | None:
+    """Return the peak resident set size of the process in bytes, or None where it is unavailable."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # reported in bytes on macOS and in kilobytes on Linux
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+@dataclass
+class StageMetrics:
+    """Measurements of a named pipeline stage, summed over all its calls."""
+    name: str
+    calls: int = 0
+    seconds: float = 0.0
+    rows_in: int | None = None
+    rows_out: int | None = None
+    bytes_written: int | None = None
+    rss_delta_bytes: int | None = None
+
+    def add_rows_in(self, rows: int) -> None:
+        """Add rows read by the stage."""
+        self.rows_in = (self.rows_in or 0) + rows
+
+    def add_rows_out(self, rows: int) -> None:
+        """Add rows produced by the stage."""
+        self.rows_out = (self.rows_out or 0) + rows
+
+    def add_bytes_written(self, n_bytes: int) -> None:
+        """Add bytes written to the database by the stage."""
+        self.bytes_written = (self.bytes_written or 0) + n_bytes
+
+
+class RunInstrumentation:
+    """Collects timings, row counts, bytes written and memory deltas of the stages of a pipeline run
+    and writes them as a structured JSON run report.
+    If `profile_stage` is set, every call of the stage with that name runs under cProfile and
+    the collected statistics are written to `profile_path`."""
+    def __init__(self, profile_stage: str | None = None, profile_path: str | None = None):
+        self.logger = get_logger(self.__class__.__name__)
+        self.stages: dict[str, StageMetrics] = {}
+        self.profile_stage: str | None = profile_stage
+        self.profile_path: str = profile_path or f"{profile_stage}.prof"
+        self.profiler: cProfile.Profile | None = cProfile.Profile() if profile_stage else None
+        # identifies the run in the run report and in the rows it writes, e.g. quarantined rows
+        self.run_id: str = uuid.uuid4().hex
+        self.started_at: datetime.datetime = datetime.datetime.now()
+        self.start: float = time.perf_counter()
+        self.status: str = "running"
+        self.wall_seconds: float | None = None
+        # stages may run concurrently on worker threads
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str, rows_in: int | None = None) -> Iterator[StageMetrics]:
+        """Measure a stage. The yielded metrics can be used to record rows produced and bytes written."""
+        with self._lock:
+            metrics = self.stages.setdefault(name, StageMetrics(name=name))
+            metrics.calls += 1
+            if rows_in is not None:
+                metrics.add_rows_in(rows_in)
+
+        profiler = self.profiler if name == self.profile_stage else None
+        rss_before = current_rss_bytes()
+        start = time.perf_counter()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield metrics
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            seconds = time.perf_counter() - start
+            rss_after = current_rss_bytes()
+            with self._lock:
+                metrics.seconds += seconds
+                if rss_before is not None and rss_after is not None:
+                    metrics.rss_delta_bytes = (metrics.rss_delta_bytes or 0) + rss_after - rss_before
+
+    def finish(self, status: str) -> None:
+        """Mark the run as finished with a status such as 'succeeded' or 'failed'."""
+        self.status = status
+        self.wall_seconds = time.perf_counter() - self.start
+
+        if self.profiler is not None and self.profile_stage not in self.stages:
+            self.logger.warning(f"Stage '{self.profile_stage}' did not run, no profile written")
+        elif self.profiler is not None:
+            self.profiler.dump_stats(self.profile_path)
+            summary = io.StringIO()
+            pstats.Stats(self.profiler, stream=summary).sort_stats("cumulative").print_stats(15)
+            self.logger.info(f"Profile of stage '{self.profile_stage}' written to '{self.profile_path}'\n{summary.getvalue()}")
+
+    def report(self) -> dict:
+        """Return the run report as a JSON-serialisable dict."""
+        return {
+            "run_id": self.run_id,
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "status": self.status,
+            "wall_seconds": self.wall_seconds if self.wall_seconds is not None else time.perf_counter() - self.start,
+            "peak_rss_bytes": peak_rss_bytes(),
+            "profile": {"stage": self.profile_stage, "path": self.profile_path} if self.profiler else None,
+            "stages": [asdict(metrics) for metrics in self.stages.values()],
+        }
+
+    def write_report(self, path: str) -> None:
+        """Write the run report as JSON."""
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2)
+        self.logger.info(f"Run report written to '{path}'")
@@ -1,10 +1,30 @@
+import argparse
+import glob
+import os
+import sys
 import pandas as pd
+from typing import Iterator
+from etl.cache import SourceCache
+from etl.checkpoint import CheckpointStore
 from etl.db.core import DBContext
-from etl.constants import DB_SERVER, DB_USERNAME, DB_PASSWORD
+from etl.constants import (
+    DB_SERVER, DB_USERNAME, DB_PASSWORD, LOAD_BATCH_SIZE, SOURCE_COLUMN_NAMES, SOURCE_WORKERS, STAGING_CHUNK_SIZE
+)
+from etl.db.loader import get_bulk_loader
+from etl.elt import ELTPipeline
+from etl.instrumentation import RunInstrumentation
 from etl.pipeline import ETLPipeline
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.exc import SQLAlchemyError
-from logger import get_logger
+from etl.logger import get_logger
+from etl.modes.base import RunMode
+from etl.modes.cached import CachedLoad
+from etl.modes.checkpointed import CheckpointedLoad
+from etl.modes.chunked import ChunkedLoad
+from etl.modes.elt import ELTLoad
+from etl.modes.files import FilesLoad
+from etl.modes.full import FullLoad
+from etl.modes.options import select_run_mode
+from etl.modes.partitions import ChangedPartitionsLoad
 
 
 def _read_csv_from_source(file_path: str) -> pd.DataFrame:
@@ -13,10 +33,229 @@ def _read_csv_from_source(file_path: str) -> pd.DataFrame:
         file_path,
         sep=",",
         encoding="unicode_escape", # was required because of unicode character issues when reading the file
+        usecols=list(SOURCE_COLUMN_NAMES), # columns not used by the pipeline are never parsed
     )
 
+def _read_csv_chunks_from_source(file_path: str, chunk_size: int, dtype: type | None = None) -> Iterator[pd.DataFrame]:
+    """Method to read from CSV file in chunks of `chunk_size` rows and yield pandas DataFrames.
+    `dtype=str` reads all columns as text instead of inferring their types."""
+    return pd.read_csv(
+        file_path,
+        sep=",",
+        encoding="unicode_escape", # was required because of unicode character issues when reading the file
+        usecols=list(SOURCE_COLUMN_NAMES), # columns not used by the pipeline are never parsed
+        chunksize=chunk_size,
+        dtype=dtype,
+    )
+
+def _resolve_source_files(source: str) -> list[str]:
+    """Return the CSV files of a directory or glob pattern, sorted by path."""
+    if os.path.isdir(source):
+        source = os.path.join(source, "*.csv")
+    return sorted(glob.glob(source))
+
+def _parse_args() -> tuple[argparse.Namespace, type[RunMode]]:
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Load invoices CSV file into the invoices star schema.")
+    parser.add_argument(
+        "--source",
+        default=None,
+        help="Directory or glob pattern of invoice CSV files to load together, "
+             "instead of the single yearly extract. Files are loaded in path order.",
+    )
+    parser.add_argument(
+        "--source-workers",
+        type=int,
+        default=None,
+        help="Number of processes reading and transforming source files in parallel when --source is given. "
+             f"Defaults to the number of files, at most {SOURCE_WORKERS}. Every process holds a whole source file "
+             "and its cleaned copy in memory, so peak memory grows with the number of processes.",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=None,
+        help="Stream the CSV file in chunks of this many rows instead of loading it into memory at once.",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only load source rows invoiced after the latest date already in the fact table, "
+             "instead of truncating and rebuilding all tables.",
+    )
+    parser.add_argument(
+        "--changed-partitions",
+        action="store_true",
+        help="Hash every invoice month of the source and only reload the months whose hash changed since "
+             "they were last loaded, replacing their fact rows. Months missing from the source are kept.",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=LOAD_BATCH_SIZE,
+        help="Number of rows sent to the database per executemany call.",
+    )
+    parser.add_argument(
+        "--dimension-workers",
+        type=int,
+        default=1,
+        help="Number of dimension steps to build concurrently. They take turns loading through the pipeline's "
+             "connection, so all dimensions are loaded in one transaction.",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=None,
+        help="Cache the cleaned source in this directory and reuse it while the CSV file is unchanged. "
+             "Not used together with --chunk-size.",
+    )
+    parser.add_argument(
+        "--checkpoint-dir",
+        default=None,
+        help="Save the output of every pipeline stage in this directory and commit the fact table in batches, "
+             "so a failed full load can be resumed with --resume. The directory must be empty or hold checkpoints.",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Resume a failed run from the checkpoints in --checkpoint-dir, skipping completed stages and fact batches.",
+    )
+    parser.add_argument(
+        "--elt",
+        action="store_true",
+        help="Stage the raw CSV file in the database and run the transforms there as set-based SQL. "
+             "Full loads only; --chunk-size sets the rows staged at a time.",
+    )
+    parser.add_argument(
+        "--swap-tables",
+        action="store_true",
+        help="Load into shadow tables and swap them into place when done, so the live tables stay readable "
+             "during the load. Full loads of the whole source only.",
+    )
+    parser.add_argument(
+        "--fact-writers",
+        type=int,
+        default=1,
+        help="Number of connections writing the fact table concurrently by invoice key range with --swap-tables.",
+    )
+    parser.add_argument(
+        "--background-writer",
+        action="store_true",
+        help="Write tables on a background thread while the next table or chunk is transformed. "
+             "Not used with --elt, which transforms inside the database.",
+    )
+    parser.add_argument(
+        "--quarantine",
+        action="store_true",
+        help="Check source rows against data-quality rules and load failing rows into the quarantine table "
+             "with the codes of the rules they fail, instead of coercing or filtering them silently.",
+    )
+    parser.add_argument(
+        "--key-registry-dir",
+        default=None,
+        help="Keep the surrogate keys of invoices, customers and products in memory-mapped registries in this "
+             "directory, so members keep their keys across runs and processes. Start a registry with a full load, "
+             "so stored and registered keys agree.",
+    )
+    parser.add_argument(
+        "--low-copy",
+        action="store_true",
+        help="Run pipeline stages with pandas copy-on-write, so renames, column selections and drops "
+             "share memory with the frames they come from instead of copying them.",
+    )
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="Transform the source with a compact schema: categoricals for repeated strings and narrow integer types.",
+    )
+    parser.add_argument(
+        "--report",
+        default=None,
+        help="Write a JSON run report with timings, row counts, bytes written and memory deltas per stage.",
+    )
+    parser.add_argument(
+        "--profile-stage",
+        default=None,
+        help="Run the stage with this name (as listed in the run report, e.g. 'fact.transaction') under cProfile.",
+    )
+    parser.add_argument(
+        "--profile-path",
+        default=None,
+        help="Path of the cProfile statistics file written for --profile-stage.",
+    )
+    parser.add_argument(
+        "--echo-sql",
+        action="store_true",
+        help="Log every SQL statement sent to the database.",
+    )
+    parser.add_argument(
+        "--sqlite-path",
+        default=None,
+        help="Load into this local SQLite database file instead of Microsoft SQL Server.",
+    )
+    args = parser.parse_args()
+    try:
+        run_mode: type[RunMode] = select_run_mode(vars(args))
+    except ValueError as e:
+        parser.error(str(e))
+    return args, run_mode
+
+def _create_run_mode(
+    run_mode: type[RunMode],
+    args: argparse.Namespace,
+    csv_file_path: str,
+    instrumentation: RunInstrumentation
+) -> RunMode:
+    """Create the run mode selected by the command line options, with the source it loads."""
+    logger = get_logger("Main")
+    if run_mode is ELTLoad:
+        return ELTLoad(lambda: _read_csv_chunks_from_source(
+            file_path=csv_file_path,
+            chunk_size=args.chunk_size or STAGING_CHUNK_SIZE,
+            dtype=str
+        ))
+    if run_mode is FilesLoad:
+        file_paths: list[str] = _resolve_source_files(args.source)
+        if not file_paths:
+            raise FileNotFoundError(f"No CSV files found for source '{args.source}'")
+        logger.info(f"Loading {len(file_paths)} CSV files from '{args.source}'")
+        return FilesLoad(
+            file_paths=file_paths,
+            read_source=_read_csv_from_source,
+            max_workers=args.source_workers or min(len(file_paths), SOURCE_WORKERS),
+            incremental=args.incremental
+        )
+    if run_mode is CheckpointedLoad:
+        return CheckpointedLoad(
+            file_path=csv_file_path,
+            read_source=_read_csv_from_source,
+            checkpoints=CheckpointStore(checkpoint_dir=args.checkpoint_dir),
+            resume=args.resume
+        )
+    if run_mode is ChunkedLoad:
+        logger.info(f"Streaming CSV file from source in chunks of {args.chunk_size} rows")
+        return ChunkedLoad(
+            lambda: _read_csv_chunks_from_source(file_path=csv_file_path, chunk_size=args.chunk_size),
+            incremental=args.incremental
+        )
+    if run_mode is CachedLoad:
+        return CachedLoad(
+            file_path=csv_file_path,
+            read_source=_read_csv_from_source,
+            cache=SourceCache(cache_dir=args.cache_dir),
+            incremental=args.incremental
+        )
+
+    logger.info("Reading CSV file from source")
+    with instrumentation.stage("read_source") as stage:
+        df: pd.DataFrame = _read_csv_from_source(file_path=csv_file_path)
+        stage.add_rows_out(len(df))
+    if run_mode is ChangedPartitionsLoad:
+        return ChangedPartitionsLoad(df)
+    return FullLoad(df, incremental=args.incremental)
+
 def main():
     logger = get_logger("Main")
+    args, run_mode = _parse_args()
     
     logger.info("Initialising variables required.")
     database_name: str = "invoices"
@@ -24,47 +263,82 @@ def main():
 
     db: DBContext = DBContext()
 
-    # create database (if not exists)
-    db.create_db(
-        server=DB_SERVER,
-        username=DB_USERNAME,
-        password=DB_PASSWORD,
-        db_name=database_name
-    )
+    if args.sqlite_path:
+        # local stand-in for Microsoft SQL Server
+        engine = db.get_sqlite_engine(db_path=args.sqlite_path, echo=args.echo_sql)
+    else:
+        # create database (if not exists)
+        db.create_db(
+            server=DB_SERVER,
+            username=DB_USERNAME,
+            password=DB_PASSWORD,
+            db_name=database_name
+        )
 
-    # connect to database using SQLAlchemy 
-    engine = db.get_engine(
-        server=DB_SERVER,
-        username=DB_USERNAME,
-        password=DB_PASSWORD,
-        db_name=database_name
-    )
+        # connect to database using SQLAlchemy 
+        engine = db.get_engine(
+            server=DB_SERVER,
+            username=DB_USERNAME,
+            password=DB_PASSWORD,
+            db_name=database_name,
+            echo=args.echo_sql
+        )
 
     # create tables
     db.create_tables(engine)
 
-    # read csv file
-    logger.info("Reading CSV file from source")
-    df: pd.DataFrame = _read_csv_from_source(file_path=csv_file_path)
-
     # create session - so that we handle the ETL pipeline as one transaction
     # need to handle as one transcation because we will do a full-load approach
     # full-load approach will truncate the tables and re-create them, hence why we need one transaction
+    # with --swap-tables, shadow tables are committed as they are loaded and only the swap is part of this transaction
+    # with --checkpoint-dir, every stage and fact batch is committed as it completes, so the run can be resumed
     Session = sessionmaker(bind=engine)
     session = Session()
 
+    # dimension steps running concurrently share this session, so they are part of the same transaction
+    instrumentation = RunInstrumentation(profile_stage=args.profile_stage, profile_path=args.profile_path)
+    if run_mode is ELTLoad:
+        pipeline = ELTPipeline(
+            session,
+            loader=get_bulk_loader(session, batch_size=args.batch_size),
+            instrumentation=instrumentation
+        )
+    else:
+        pipeline = ETLPipeline(
+            session,
+            loader=get_bulk_loader(session, batch_size=args.batch_size),
+            session_factory=Session,
+            max_workers=args.dimension_workers,
+            instrumentation=instrumentation,
+            compact=args.compact,
+            swap_tables=args.swap_tables,
+            fact_writers=args.fact_writers,
+            background_writer=args.background_writer,
+            low_copy=args.low_copy,
+            data_quality=args.quarantine,
+            key_registry_dir=args.key_registry_dir
+        )
+
     # run etl pipeline
     try:
-        pipeline = ETLPipeline(session)
         logger.info("Starting run of pipeline to load data from CSV file and create dims and facts")
-        pipeline.run_pipeline(df)
+        _create_run_mode(run_mode, args, csv_file_path, instrumentation).run(pipeline)
         logger.info("Pipeline run successful. Commiting")
-        session.commit()
-    except SQLAlchemyError as e:
-        logger.critical(f"Error running ETL pipeline: {e}")
-        session.rollback()
+        with instrumentation.stage("commit"):
+            pipeline.commit()
+        instrumentation.finish(status="succeeded")
+    except Exception as e:
+        # any failure, not only database errors, must discard the partial load and fail the process
+        logger.critical(f"Error running ETL pipeline: {e}", exc_info=True)
+        pipeline.rollback()
+        instrumentation.finish(status="failed")
+        sys.exit(1)
     finally:
-        session.close()
+        pipeline.close()
+        if instrumentation.status == "running":
+            instrumentation.finish(status="failed")
+        if args.report:
+            instrumentation.write_report(args.report)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,34 @@
+from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING
+from etl.logger import get_logger
+
+if TYPE_CHECKING:
+    from etl.elt import ELTPipeline
+    from etl.pipeline import ETLPipeline
+
+
+def option_label(option: str) -> str:
+    """Return the command line spelling of an option, as parsed by argparse."""
+    return f"--{option.replace('_', '-')}"
+
+
+class RunMode(ABC):
+    """Run mode base class: a strategy loading the star schema from the source in one way,
+    running the dimension and fact steps shared through the pipeline.
+    `option` is the command line option selecting the mode (None for the default full load),
+    `supported_options` are the options that may be combined with it."""
+    option: str | None = None
+    supported_options: frozenset[str] = frozenset()
+
+    def __init__(self):
+        self.logger = get_logger(self.__class__.__name__)
+
+    @classmethod
+    def label(cls) -> str:
+        """Name the mode by the command line option selecting it."""
+        return option_label(cls.option) if cls.option is not None else "full loads"
+
+    @abstractmethod
+    def run(self, pipeline: "ETLPipeline | ELTPipeline") -> None:
+        """Abstract method to be initialised in subclasses.
+        Subclasses load the star schema through the steps of `pipeline`."""
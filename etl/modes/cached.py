@@ -0,0 +1,58 @@
+import pandas as pd
+from typing import TYPE_CHECKING, Callable
+from etl.cache import SourceCache
+from etl.modes.base import RunMode
+
+if TYPE_CHECKING:
+    from etl.pipeline import ETLPipeline
+
+
+class CachedLoad(RunMode):
+    """Load the source file like `FullLoad`, reusing the cleaned source from `cache` when the
+    source file and transform version are unchanged. On a cache miss the file is read with
+    `read_source`, transformed and stored in the cache."""
+    option = "cache_dir"
+    supported_options = frozenset({
+        "incremental", "swap_tables", "compact", "background_writer", "low_copy", "quarantine", "key_registry_dir"
+    })
+
+    def __init__(
+        self,
+        file_path: str,
+        read_source: Callable[[str], pd.DataFrame],
+        cache: SourceCache,
+        incremental: bool = False
+    ):
+        super().__init__()
+        self.file_path: str = file_path
+        self.read_source: Callable[[str], pd.DataFrame] = read_source
+        self.cache: SourceCache = cache
+        self.incremental: bool = incremental
+
+    def run(self, pipeline: "ETLPipeline") -> None:
+        """Load the cleaned source from the cache, or transform and cache it, and load the star schema from it."""
+        high_water_mark = pipeline.read_high_water_mark(self.incremental)
+        pipeline.forget_partition_hashes(high_water_mark)
+
+        with pipeline.stage("source_cache.load") as stage:
+            cache_key: str = self.cache.make_key(self.file_path, variant=pipeline.source_variant())
+            df: pd.DataFrame | None = self.cache.load(cache_key)
+            stage.add_rows_out(0 if df is None else len(df))
+
+        if df is None:
+            self.logger.info("Reading source file")
+            with pipeline.stage("read_source") as stage:
+                source_df: pd.DataFrame = self.read_source(self.file_path)
+                stage.add_rows_out(len(source_df))
+            df = pipeline.transform_source(source_df)
+            with pipeline.stage("source_cache.store", rows_in=len(df)):
+                self.cache.store(cache_key, df)
+            pipeline.load_quarantine(incremental=self.incremental, high_water_mark=high_water_mark)
+        elif pipeline.data_quality is not None:
+            self.logger.info("Cleaned source loaded from cache, keeping the quarantined rows as loaded")
+
+        if high_water_mark is not None:
+            self.logger.info("Filtering source to rows after the high-water mark")
+            df = pipeline.filter_to_delta(df, high_water_mark)
+
+        pipeline.load_star_schema(df, incremental=self.incremental)
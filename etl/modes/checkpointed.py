@@ -0,0 +1,113 @@
+import pandas as pd
+from typing import TYPE_CHECKING, Callable
+from etl.cache import source_fingerprint
+from etl.checkpoint import CheckpointStore
+from etl.constants import FACT_CHECKPOINT_BATCH_SIZE
+from etl.modes.base import RunMode
+
+if TYPE_CHECKING:
+    from etl.pipeline import ETLPipeline
+
+
+class CheckpointedLoad(RunMode):
+    """Full-load the source file like `FullLoad`, saving the output of every stage to `checkpoints`:
+    the cleaned source, each dimension and the transaction fact rows.
+    Every dimension is committed when its stage completes and the fact is committed in numbered
+    batches of about `batch_size` rows.
+    With `resume`, a rerun over the same source file skips the completed stages and batches
+    and continues where the failed run stopped."""
+    option = "checkpoint_dir"
+    supported_options = frozenset({
+        "resume", "compact", "background_writer", "low_copy", "quarantine", "key_registry_dir"
+    })
+
+    def __init__(
+        self,
+        file_path: str,
+        read_source: Callable[[str], pd.DataFrame],
+        checkpoints: CheckpointStore,
+        resume: bool = False,
+        batch_size: int = FACT_CHECKPOINT_BATCH_SIZE
+    ):
+        super().__init__()
+        self.file_path: str = file_path
+        self.read_source: Callable[[str], pd.DataFrame] = read_source
+        self.checkpoints: CheckpointStore = checkpoints
+        self.resume: bool = resume
+        self.batch_size: int = batch_size
+
+    def _run_checkpointed_stage(
+        self,
+        pipeline: "ETLPipeline",
+        stage_name: str,
+        run_stage: Callable[[], pd.DataFrame]
+    ) -> pd.DataFrame:
+        """Return the saved output of a completed stage, or run the stage, commit it and save its output.
+        The commit comes first, so a saved stage is always in the database."""
+        df: pd.DataFrame | None = self.checkpoints.load_stage(stage_name)
+        if df is not None:
+            return df
+
+        df = run_stage()
+        pipeline.commit()
+        self.checkpoints.save_stage(stage_name, df)
+        return df
+
+    def run(self, pipeline: "ETLPipeline") -> None:
+        """Run the stages that are not completed yet, committing each one."""
+        self.checkpoints.start(
+            run_key=f"{source_fingerprint(self.file_path, variant=pipeline.source_variant())}-{self.batch_size}",
+            resume=self.resume
+        )
+        pipeline.forget_partition_hashes(high_water_mark=None)
+
+        def transform_source() -> pd.DataFrame:
+            self.logger.info("Reading source file")
+            with pipeline.stage("read_source") as stage:
+                source_df: pd.DataFrame = self.read_source(self.file_path)
+                stage.add_rows_out(len(source_df))
+            df: pd.DataFrame = pipeline.transform_source(source_df)
+            # committed with the stage, as the source is not transformed again on resume
+            pipeline.load_quarantine()
+            return df
+
+        df: pd.DataFrame = self._run_checkpointed_stage(pipeline, "source", transform_source)
+
+        # dimension steps run one at a time, so each one is committed on its own
+        dimension_dfs: dict[str, pd.DataFrame] = {}
+        for name, step in [
+            ("date", pipeline.etl_date_dim),
+            ("invoice", pipeline.etl_invoice_dim),
+            ("customer", pipeline.etl_customer_dim),
+            ("product", pipeline.etl_product_dim),
+        ]:
+            self.logger.info(f"Run {name} dimension etl step")
+            dimension_dfs[name] = self._run_checkpointed_stage(
+                pipeline,
+                f"dimension.{name}",
+                lambda step=step, name=name: pipeline.run_dimension_step(name, step, lambda step: step.run_etl(df=df))
+            )
+
+        self.logger.info("Run transaction fact etl step")
+        with pipeline.stage("fact.transaction", rows_in=len(df)):
+            fact_df: pd.DataFrame = self._run_checkpointed_stage(
+                pipeline,
+                "fact",
+                lambda: pipeline.etl_transaction_fact.create_fact(
+                    source_df=df,
+                    **pipeline.create_key_indexes(
+                        dimension_dfs["invoice"], dimension_dfs["customer"], dimension_dfs["product"]
+                    )
+                )
+            )
+            pipeline.etl_transaction_fact.run_etl_in_batches(
+                df=fact_df,
+                batch_size=self.batch_size,
+                batches_committed=self.checkpoints.fact_batches_committed,
+                record_batch=self.checkpoints.record_fact_batch
+            )
+
+        # committed with the run, the summaries are created again from the saved fact rows on resume
+        pipeline.refresh_revenue_aggregates(fact_df, dimension_dfs["invoice"], dimension_dfs["customer"])
+
+        pipeline.log_load_report()
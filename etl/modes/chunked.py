@@ -0,0 +1,35 @@
+import pandas as pd
+from typing import TYPE_CHECKING, Callable, Iterable
+from etl.modes.base import RunMode
+
+if TYPE_CHECKING:
+    from etl.pipeline import ETLPipeline
+
+
+class ChunkedLoad(RunMode):
+    """Full-load the source, streaming it in fixed-size chunks.
+    `read_chunks` must return a fresh iterator over the source chunks each time it is called,
+    as the source is read twice:
+    1. The first pass accumulates dimension members across chunks.
+    2. The second pass creates and inserts fact rows chunk by chunk.
+    Peak memory therefore depends on the chunk size and the dimension sizes, not on the file size.
+    `incremental` works as in `FullLoad`."""
+    option = "chunk_size"
+    supported_options = frozenset({
+        "incremental", "compact", "background_writer", "low_copy", "quarantine", "key_registry_dir"
+    })
+
+    def __init__(self, read_chunks: Callable[[], Iterable[pd.DataFrame]], incremental: bool = False):
+        super().__init__()
+        self.read_chunks: Callable[[], Iterable[pd.DataFrame]] = read_chunks
+        self.incremental: bool = incremental
+
+    def run(self, pipeline: "ETLPipeline") -> None:
+        """Transform the source chunks as they are read and load the star schema from them."""
+        high_water_mark = pipeline.read_high_water_mark(self.incremental)
+        pipeline.forget_partition_hashes(high_water_mark)
+        pipeline.load_star_schema_in_chunks(
+            lambda: (pipeline.transform_source(chunk, high_water_mark=high_water_mark) for chunk in self.read_chunks()),
+            incremental=self.incremental,
+            high_water_mark=high_water_mark
+        )
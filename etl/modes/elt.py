@@ -0,0 +1,22 @@
+import pandas as pd
+from typing import TYPE_CHECKING, Callable, Iterable
+from etl.modes.base import RunMode
+
+if TYPE_CHECKING:
+    from etl.elt import ELTPipeline
+
+
+class ELTLoad(RunMode):
+    """Stage the raw source in the database in chunks and load the star schema from it with set-based SQL,
+    through an `ELTPipeline`. `read_chunks` returns an iterator over the raw source chunks, read as strings."""
+    option = "elt"
+    supported_options = frozenset({"chunk_size"})
+
+    def __init__(self, read_chunks: Callable[[], Iterable[pd.DataFrame]]):
+        super().__init__()
+        self.read_chunks: Callable[[], Iterable[pd.DataFrame]] = read_chunks
+
+    def run(self, pipeline: "ELTPipeline") -> None:
+        """Stage the source chunks and run the ELT pipeline over them."""
+        self.logger.info("Staging CSV file from source in the database")
+        pipeline.run_pipeline(self.read_chunks())
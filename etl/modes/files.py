@@ -0,0 +1,69 @@
+import os
+import tempfile
+import pandas as pd
+import pyarrow.feather as feather
+from concurrent.futures import ProcessPoolExecutor
+from typing import TYPE_CHECKING, Callable
+from etl.modes.base import RunMode
+
+if TYPE_CHECKING:
+    from etl.pipeline import ETLPipeline
+
+
+class FilesLoad(RunMode):
+    """Load several source files, giving the same result as loading their concatenation in file order:
+    1. Each file is read and transformed in a pool of `max_workers` processes, and the cleaned
+    file is spilled to a temporary Arrow IPC file.
+    2. The cleaned files are streamed in file order like the chunks of `ChunkedLoad`:
+    dimension members of all files are merged into one set of surrogate keys before the fact rows are created.
+    `read_source` must be picklable, e.g. a module-level function.
+    `incremental` works as in `FullLoad`."""
+    option = "source"
+    supported_options = frozenset({
+        "incremental", "compact", "background_writer", "low_copy", "quarantine", "key_registry_dir"
+    })
+
+    def __init__(
+        self,
+        file_paths: list[str],
+        read_source: Callable[[str], pd.DataFrame],
+        max_workers: int = 1,
+        incremental: bool = False
+    ):
+        super().__init__()
+        self.file_paths: list[str] = file_paths
+        self.read_source: Callable[[str], pd.DataFrame] = read_source
+        self.max_workers: int = max_workers
+        self.incremental: bool = incremental
+
+    def run(self, pipeline: "ETLPipeline") -> None:
+        """Transform the source files in worker processes and load the star schema from the spilled files."""
+        high_water_mark = pipeline.read_high_water_mark(self.incremental)
+        pipeline.forget_partition_hashes(high_water_mark)
+
+        with tempfile.TemporaryDirectory(prefix="etl-spill-") as spill_dir:
+            spill_paths: list[str] = [
+                os.path.join(spill_dir, f"{position:05d}.arrow") for position in range(len(self.file_paths))
+            ]
+
+            self.logger.info(
+                f"Transforming {len(self.file_paths)} source files with {self.max_workers} worker processes"
+            )
+            with pipeline.stage("transform.source_files") as stage:
+                with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                    for file_path, (rows, quarantined) in zip(self.file_paths, executor.map(
+                        pipeline.transform_source_file,
+                        self.file_paths,
+                        [self.read_source] * len(self.file_paths),
+                        spill_paths,
+                        [high_water_mark] * len(self.file_paths)
+                    )):
+                        self.logger.info(f"Transformed '{file_path}': {rows} rows")
+                        stage.add_rows_out(rows)
+                        pipeline.quarantined.extend(quarantined)
+
+            pipeline.load_star_schema_in_chunks(
+                lambda: (feather.read_table(path, memory_map=True).to_pandas() for path in spill_paths),
+                incremental=self.incremental,
+                high_water_mark=high_water_mark
+            )
@@ -0,0 +1,28 @@
+import pandas as pd
+from typing import TYPE_CHECKING
+from etl.modes.base import RunMode
+
+if TYPE_CHECKING:
+    from etl.pipeline import ETLPipeline
+
+
+class FullLoad(RunMode):
+    """Full-load the star schema from the source DataFrame.
+    With `incremental`, only rows invoiced after the fact table's high-water mark are processed:
+    new members are merged into the dimensions and new fact rows are appended."""
+    supported_options = frozenset({
+        "incremental", "swap_tables", "compact", "background_writer", "low_copy", "quarantine", "key_registry_dir"
+    })
+
+    def __init__(self, df: pd.DataFrame, incremental: bool = False):
+        super().__init__()
+        self.df: pd.DataFrame = df
+        self.incremental: bool = incremental
+
+    def run(self, pipeline: "ETLPipeline") -> None:
+        """Transform the source and load the star schema from it."""
+        high_water_mark = pipeline.read_high_water_mark(self.incremental)
+        pipeline.forget_partition_hashes(high_water_mark)
+        df: pd.DataFrame = pipeline.transform_source(self.df, high_water_mark=high_water_mark)
+        pipeline.load_quarantine(incremental=self.incremental, high_water_mark=high_water_mark)
+        pipeline.load_star_schema(df, incremental=self.incremental)
@@ -0,0 +1,44 @@
+from etl.modes.base import RunMode, option_label
+from etl.modes.cached import CachedLoad
+from etl.modes.checkpointed import CheckpointedLoad
+from etl.modes.chunked import ChunkedLoad
+from etl.modes.elt import ELTLoad
+from etl.modes.files import FilesLoad
+from etl.modes.full import FullLoad
+from etl.modes.partitions import ChangedPartitionsLoad
+
+# run modes in order of precedence: the first one whose option is given runs,
+# e.g. --chunk-size sets the staging chunk size of --elt runs
+RUN_MODES: list[type[RunMode]] = [
+    ELTLoad, FilesLoad, CheckpointedLoad, ChunkedLoad, CachedLoad, ChangedPartitionsLoad, FullLoad
+]
+
+# options that cannot be used together in any run mode
+EXCLUSIVE_OPTIONS: list[tuple[str, str]] = [
+    # shadow tables are only swapped in by full loads
+    ("swap_tables", "incremental"),
+]
+
+
+def select_run_mode(options: dict[str, object]) -> type[RunMode]:
+    """Return the run mode selected by the command line `options` (names as parsed by argparse),
+    after checking that every other option given is supported by it.
+    Options that no run mode selects or lists as supported are not checked.
+    Raises ValueError for combinations of options that cannot be used together."""
+    run_mode: type[RunMode] = next(mode for mode in RUN_MODES if mode.option is None or options.get(mode.option))
+
+    mode_options: set[str] = {mode.option for mode in RUN_MODES if mode.option is not None}
+    checked_options: set[str] = mode_options.union(*(mode.supported_options for mode in RUN_MODES))
+    for option in sorted(checked_options - {run_mode.option}):
+        if options.get(option) and option not in run_mode.supported_options:
+            message: str = f"{option_label(option)} cannot be used with {run_mode.label()}"
+            # options selecting a run mode of their own can be used on their own
+            if option not in mode_options:
+                supporting: list[str] = [mode.label() for mode in RUN_MODES if option in mode.supported_options]
+                message += f", only with {' or '.join(supporting)}"
+            raise ValueError(message)
+
+    for option, other_option in EXCLUSIVE_OPTIONS:
+        if options.get(option) and options.get(other_option):
+            raise ValueError(f"{option_label(option)} cannot be used with {option_label(other_option)}")
+    return run_mode
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+from typing import TYPE_CHECKING
+from etl.modes.base import RunMode
+from etl.transformations.d_date import create_month_key
+
+if TYPE_CHECKING:
+    from etl.pipeline import ETLPipeline
+
+
+class ChangedPartitionsLoad(RunMode):
+    """Load the source DataFrame, reloading only the months whose content changed:
+    1. The cleaned source is split by invoice month and every month partition is hashed.
+    2. Partitions whose hash matches the hash stored when they were last loaded are skipped.
+    3. Members of the changed partitions are merged into the dimensions, keeping existing surrogate keys.
+    4. Fact rows of the changed months are deleted and created again from the source.
+    5. The hashes of the changed partitions are stored with the load.
+    Months missing from the source are kept as loaded, so the source may cover recent months only."""
+    option = "changed_partitions"
+    supported_options = frozenset({"compact", "background_writer", "low_copy", "quarantine", "key_registry_dir"})
+
+    def __init__(self, df: pd.DataFrame):
+        super().__init__()
+        self.df: pd.DataFrame = df
+
+    def run(self, pipeline: "ETLPipeline") -> None:
+        """Transform the source and reload its changed month partitions."""
+        df: pd.DataFrame = pipeline.transform_source(self.df)
+
+        with pipeline.stage("partitions.hash", rows_in=len(df)) as stage:
+            month_keys: np.ndarray = create_month_key(pd.DatetimeIndex(df["invoice_date"]))
+            hashes: pd.DataFrame = pipeline.etl_partition_state.hash_partitions(
+                df, month_keys, variant=pipeline.source_variant()
+            )
+            changed: pd.DataFrame = pipeline.etl_partition_state.find_changed_partitions(hashes)
+            stage.add_rows_out(len(changed))
+
+        if changed.empty:
+            self.logger.info(f"None of the {len(hashes)} month partitions changed, nothing to load")
+            # rows quarantined from the unchanged months were loaded with them
+            pipeline.quarantined = []
+            return
+
+        self.logger.info(
+            f"Reloading {len(changed)} of {len(hashes)} month partitions: "
+            + ", ".join(str(month_key) for month_key in changed["month_key"])
+        )
+        df = pipeline.run_transform(
+            "partitions.select_changed", lambda df: df[np.isin(month_keys, changed["month_key"].to_numpy())], df
+        )
+        changed_month_keys: list[int] = [int(month_key) for month_key in changed["month_key"]]
+        pipeline.load_quarantine(month_keys=changed_month_keys)
+
+        _, invoice_dim, customer_dim, product_dim = pipeline.run_dimension_steps({
+            "date": (pipeline.etl_date_dim, lambda step: step.run_etl(df=df, incremental=True)),
+            "invoice": (pipeline.etl_invoice_dim, lambda step: step.run_etl(df=df, incremental=True)),
+            "customer": (pipeline.etl_customer_dim, lambda step: step.run_etl(df=df, incremental=True)),
+            "product": (pipeline.etl_product_dim, lambda step: step.run_etl(df=df, incremental=True)),
+        })
+
+        self.logger.info("Run transaction fact etl step for changed months")
+        with pipeline.stage("fact.transaction", rows_in=len(df)):
+            fact_df: pd.DataFrame = pipeline.etl_transaction_fact.run_etl_for_months(
+                source_df=df,
+                month_keys=changed_month_keys,
+                **pipeline.create_key_indexes(invoice_dim, customer_dim, product_dim)
+            )
+
+        pipeline.refresh_revenue_aggregates(fact_df, invoice_dim, customer_dim, month_keys=changed_month_keys)
+
+        with pipeline.stage("partitions.store_hashes", rows_in=len(changed)):
+            pipeline.etl_partition_state.run_etl(changed)
+
+        pipeline.log_load_report()
@@ -1,52 +1,200 @@
+import datetime
+import threading
+from contextlib import contextmanager, nullcontext
+import numpy as np
 import pandas as pd
+import pyarrow.feather as feather
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from typing import Callable, Iterable, Iterator
+from etl.cache import SourceCache
+from etl.checkpoint import CheckpointStore
 from etl.constants import (
+    COUNTRY_MAPPING,
     DIM_CUSTOMER_TABLE_NAME,
     DIM_DATE_TABLE_NAME,
     DIM_INVOICE_TABLE_NAME,
     DIM_PRODUCT_TABLE_NAME,
-    FACT_TRANSACTION_TABLE_NAME
+    DQ_QUARANTINE_TABLE_NAME,
+    FACT_CHECKPOINT_BATCH_SIZE,
+    FACT_TRANSACTION_TABLE_NAME,
+    INVOICE_TYPE_RULES,
+    PARTITION_STATE_TABLE_NAME,
+    SOURCE_COLUMN_NAMES,
+    UNKNOWN_INVOICE_TYPE
 )
+from etl.db.d_customer import CustomerDimension
+from etl.db.d_date import DateDimension
+from etl.db.d_invoice import InvoiceDimension
+from etl.db.d_product import ProductDimension
+from etl.db.f_transaction import TransactionFact
+from etl.db.loader import BulkLoader, get_bulk_loader
+from etl.db.q_quarantine import QuarantinedInvoice
+from etl.db.swap import ShadowTables
+from etl.db.writer import BackgroundWriter
+from etl.instrumentation import RunInstrumentation, StageMetrics
 from etl.logger import get_logger
+from etl.modes.base import RunMode
+from etl.modes.cached import CachedLoad
+from etl.modes.checkpointed import CheckpointedLoad
+from etl.modes.chunked import ChunkedLoad
+from etl.modes.files import FilesLoad
+from etl.modes.full import FullLoad
+from etl.modes.partitions import ChangedPartitionsLoad
+from etl.quality import DataQualityCheck
+from etl.registry import KeyRegistry
+from etl.transformations.a_revenue import (
+    ETLRevenueAggregate,
+    attribute_by_key,
+    create_revenue_aggregate_steps,
+    create_revenue_lines
+)
+from etl.transformations.base import ETLBase, EffectiveKeyIndex, KeyIndex
 from etl.transformations.d_date import ETLDateDimension
 from etl.transformations.d_invoice import ETLInvoiceDimension
 from etl.transformations.d_customer import ETLCustomerDimension
 from etl.transformations.d_product import ETLProductDimension
 from etl.transformations.f_transaction import ETLTransactionFact
+from etl.transformations.p_partition import ETLPartitionState
+from sqlalchemy import bindparam
 from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.sql import text
+
+SIGN_CLASSES = ["negative", "zero", "positive"]
 
 
 class ETLPipeline():
-    """ETL Pipeline class that will invoke ETL steps required to full-load invoices CSV file."""
-    def __init__(self, session: sessionmaker[Session]):
+    """ETL Pipeline class that will invoke ETL steps required to full-load invoices CSV file.
+    The pipeline holds the source transforms and the dimension and fact steps shared by all run modes
+    (etl.modes), which decide how the source is read and the steps are run."""
+    def __init__(
+        self,
+        session: sessionmaker[Session],
+        loader: BulkLoader | None = None,
+        session_factory: sessionmaker[Session] | None = None,
+        max_workers: int = 1,
+        instrumentation: RunInstrumentation | None = None,
+        compact: bool = False,
+        swap_tables: bool = False,
+        fact_writers: int = 1,
+        background_writer: bool = False,
+        low_copy: bool = False,
+        data_quality: bool = False,
+        key_registry_dir: str | None = None
+    ):
         self.logger = get_logger(self.__class__.__name__)
-        self.etl_date_dim = ETLDateDimension(table_name=DIM_DATE_TABLE_NAME, session=session)
-        self.etl_invoice_dim = ETLInvoiceDimension(table_name=DIM_INVOICE_TABLE_NAME, session=session)
-        self.etl_customer_dim = ETLCustomerDimension(table_name=DIM_CUSTOMER_TABLE_NAME, session=session)
-        self.etl_product_dim = ETLProductDimension(table_name=DIM_PRODUCT_TABLE_NAME, session=session)
-        self.etl_transaction_fact = ETLTransactionFact(table_name=FACT_TRANSACTION_TABLE_NAME, session=session)
+        # compact schema: categoricals for repeated strings and narrow integer types
+        self.compact: bool = compact
+        # stages run with pandas copy-on-write, so renames, column selections and drops share memory until written
+        self.low_copy: bool = low_copy
+        self.copy_on_write_lock = threading.Lock()
+        self.copy_on_write_stages: int = 0
+        # source rows failing data-quality rules are quarantined instead of coerced or failing the run
+        self.data_quality: DataQualityCheck | None = DataQualityCheck() if data_quality else None
+        self.quarantined: list[pd.DataFrame] = []
+        self.instrumentation: RunInstrumentation = instrumentation if instrumentation is not None else RunInstrumentation()
+        self.db_session: sessionmaker[Session] = session
+        # dimension steps run concurrently when more than one worker is given, sharing the pipeline session,
+        # so they are committed or rolled back in its transaction
+        self.max_workers: int = max_workers
+        # fact writers of a swap-table load commit their key ranges on sessions of this factory
+        self.session_factory: sessionmaker[Session] | None = session_factory
+        # full loads write into shadow tables that are swapped into place, with the fact split across writers
+        self.swap_tables: bool = swap_tables
+        self.fact_writers: int = fact_writers
+        self.loader: BulkLoader = loader if loader is not None else get_bulk_loader(session)
+        # loads are reported as stages of this run
+        self.loader.instrumentation = self.instrumentation
+        self.etl_date_dim = ETLDateDimension(table_name=DIM_DATE_TABLE_NAME, session=session, loader=self.loader)
+        self.etl_invoice_dim = ETLInvoiceDimension(table_name=DIM_INVOICE_TABLE_NAME, session=session, loader=self.loader)
+        self.etl_customer_dim = ETLCustomerDimension(table_name=DIM_CUSTOMER_TABLE_NAME, session=session, loader=self.loader)
+        self.etl_product_dim = ETLProductDimension(table_name=DIM_PRODUCT_TABLE_NAME, session=session, loader=self.loader)
+        self.etl_transaction_fact = ETLTransactionFact(table_name=FACT_TRANSACTION_TABLE_NAME, session=session, loader=self.loader)
+        self.etl_partition_state = ETLPartitionState(table_name=PARTITION_STATE_TABLE_NAME, session=session, loader=self.loader)
+        # revenue summaries of the transaction fact, refreshed from the fact rows of every load
+        self.etl_revenue_aggregates: list[ETLRevenueAggregate] = create_revenue_aggregate_steps(session=session, loader=self.loader)
+        self.invoice_types, self.invoice_type_lookup = self._compile_invoice_type_rules()
+        # truncates and inserts of the steps run on a background thread while the next frame is transformed
+        self.writer: BackgroundWriter | None = BackgroundWriter() if background_writer else None
+        for step in [
+            self.etl_date_dim, self.etl_invoice_dim, self.etl_customer_dim, self.etl_product_dim, self.etl_transaction_fact,
+            self.etl_partition_state, *self.etl_revenue_aggregates
+        ]:
+            step.writer = self.writer
+        # surrogate keys of invoices, customers and products are kept in memory-mapped registries,
+        # so they are the same across runs and processes sharing the registry directory
+        self.key_registries: list[KeyRegistry] = []
+        if key_registry_dir is not None:
+            for step in [self.etl_invoice_dim, self.etl_customer_dim, self.etl_product_dim]:
+                step.key_registry = KeyRegistry(registry_dir=key_registry_dir, name=step.table_name)
+                self.key_registries.append(step.key_registry)
 
     def _rename_columns(self, df: pd.DataFrame) -> pd.DataFrame:
         """Rename columns inside a pandas DataFrame"""
-        return df.rename(
-            columns={
-                "Invoice": "invoice_no",
-                "StockCode": "code",
-                "Description": "description",
-                "Quantity": "quantity",
-                "InvoiceDate": "invoice_date",
-                "Price": "price",
-                "Customer ID": "customer_id",
-                "Country": "country",
-            }
+        return df.rename(columns=SOURCE_COLUMN_NAMES)
+
+    def _map_categories(
+        self,
+        series: pd.Series,
+        mapper: Callable[[pd.Index], pd.Index],
+        missing_value: str | None = None
+    ) -> pd.Series:
+        """Apply `mapper` once to the distinct values of a categorical column instead of once per row.
+        Categories mapped to the same value are merged. If `missing_value` is given, missing values take it."""
+        categories: pd.Index = mapper(series.cat.categories)
+        codes: np.ndarray = series.cat.codes.to_numpy()
+        if missing_value is not None:
+            codes = np.where(codes < 0, len(categories), codes)
+            categories = categories.append(pd.Index([missing_value]))
+
+        category_codes, unique_categories = pd.factorize(categories)
+        new_codes = np.where(codes < 0, -1, category_codes[codes])
+        return pd.Series(
+            pd.Categorical.from_codes(new_codes, categories=unique_categories),
+            index=series.index,
+            name=series.name
         )
 
+    def _to_string_category(self, series: pd.Series) -> pd.Series:
+        """Cast a column to a categorical of strings, converting each distinct value once.
+        Missing values become 'nan', the same as `astype(str)`."""
+        return self._map_categories(
+            series.astype("category"),
+            lambda categories: categories.astype(str),
+            missing_value="nan"
+        )
+
+    def _cast_columns_compact(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Cast columns inside a pandas DataFrame to a compact schema:
+        1. Dictionary-encoded categoricals for the repeated strings.
+        2. The narrowest integer type fitting quantity and customer ID."""
+        df["invoice_no"] = self._to_string_category(df["invoice_no"])
+        df["code"] = self._to_string_category(df["code"])
+        df["description"] = self._to_string_category(df["description"])
+        df["quantity"] = pd.to_numeric(df["quantity"].astype(int), downcast="integer")
+        df["invoice_date"] = pd.to_datetime(df["invoice_date"]).dt.normalize()
+        df["price"] = df["price"].astype(float)
+
+        # convert to int, coerce errors to NULL then default NULL with -1
+        df["customer_id"] = pd.to_numeric(
+            pd.to_numeric(df["customer_id"], errors='coerce').fillna(-1).astype(int),
+            downcast="integer"
+        )
+
+        df["country"] = self._to_string_category(df["country"])
+
+        return df
+
     def _cast_columns(self, df: pd.DataFrame) -> pd.DataFrame:
         """Cast columns inside a pandas DataFrame"""
+        if self.compact:
+            return self._cast_columns_compact(df)
+
         df["invoice_no"] = df["invoice_no"].astype(str)
         df["code"] = df["code"].astype(str)
         df["description"] = df["description"].astype(str)
         df["quantity"] = df["quantity"].astype(int)
-        df["invoice_date"] = pd.to_datetime(df["invoice_date"]).dt.date
+        # datetime64 at day precision, date keys are computed from it arithmetically
+        df["invoice_date"] = pd.to_datetime(df["invoice_date"]).dt.normalize()
         df["price"] = df["price"].astype(float)
 
         # convert to int, coerce errors to NULL then default NULL with -1
@@ -61,37 +209,53 @@ class ETLPipeline():
         # 'na = False' does not filter out null values
         return df[~df["code"].str.contains('TEST', na=False)]
     
+    def _classify_sign(self, series: pd.Series) -> pd.Categorical:
+        """Classify every value of a numeric column as 'negative', 'zero' or 'positive' in one vectorized pass"""
+        # NaN compares False on both sides, so it falls through to 'zero'
+        values = series.to_numpy()
+        codes = np.select([values < 0, values > 0], [0, 2], default=1).astype(np.int8)
+        return pd.Categorical.from_codes(codes, categories=SIGN_CLASSES)
+
     def _create_quantity_class_column(self, df: pd.DataFrame):
         """Create new column `quantity_class` inside DataFrame"""
-        # if x > 0, positive
-        # if x < 0, negative
-        # if x = 0, zero
-        df['quantity_class'] = df['quantity'].apply(lambda x: 'positive' if x > 0 else ('negative' if x < 0 else 'zero'))
+        df['quantity_class'] = self._classify_sign(df['quantity'])
         return df
     
     def _create_price_class_column(self, df: pd.DataFrame):
         """Create new column `price_class` inside DataFrame"""
-        # if x > 0, positive
-        # if x < 0, negative
-        # if x = 0, zero
-        df['price_class'] = df['price'].apply(lambda x: 'positive' if x > 0 else ('negative' if x < 0 else 'zero'))
+        df['price_class'] = self._classify_sign(df['price'])
+        return df
+
+    def _compile_invoice_type_rules(self) -> tuple[list[str], np.ndarray]:
+        """Compile INVOICE_TYPE_RULES into the list of invoice types and a
+        (quantity_class x price_class) lookup array of positions in that list."""
+        invoice_types: list[str] = list(dict.fromkeys([*INVOICE_TYPE_RULES.values(), UNKNOWN_INVOICE_TYPE]))
+        lookup = np.full(
+            (len(SIGN_CLASSES), len(SIGN_CLASSES)),
+            invoice_types.index(UNKNOWN_INVOICE_TYPE),
+            dtype=np.int8
+        )
+        for (quantity_class, price_class), invoice_type in INVOICE_TYPE_RULES.items():
+            lookup[SIGN_CLASSES.index(quantity_class), SIGN_CLASSES.index(price_class)] = invoice_types.index(invoice_type)
+
+        return invoice_types, lookup
+
+    def _create_type_column(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Create new categorical column `type` from the quantity and price classes.
+        Each row is classified with a single lookup into the compiled INVOICE_TYPE_RULES."""
+        codes = self.invoice_type_lookup[
+            df['quantity_class'].cat.codes.to_numpy(),
+            df['price_class'].cat.codes.to_numpy()
+        ]
+        df['type'] = pd.Categorical.from_codes(codes, categories=self.invoice_types)
         return df
-    
-    def _categorize_invoice(self, row):
-        """Logic to create new column 'type'."""
-        if row['quantity_class'] == 'negative' and row['price_class'] == 'positive':
-            return 'Purchase'
-        elif row['quantity_class'] == 'negative' and row['price_class'] == 'zero':
-            return 'Free Stock'
-        elif row['quantity_class'] == 'positive' and row['price_class'] == 'negative':
-            return 'Adjustment'
-        elif row['quantity_class'] == 'positive' and row['price_class'] == 'positive':
-            return 'Sale'
-        elif row['quantity_class'] == 'positive' and row['price_class'] == 'zero':
-            return 'Donation'
-        else:
-            return 'Unknown'
         
+    def _classify_invoice_type(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Create the `quantity_class`, `price_class` and `type` columns"""
+        df = self._create_quantity_class_column(df)
+        df = self._create_price_class_column(df)
+        return self._create_type_column(df)
+
     def _cleanup_country_column(self, df: pd.DataFrame) -> pd.DataFrame:
         """Clean up the country column by
         1. Mapping 'EIRE' to 'Ireland' (assuming correct).
@@ -99,17 +263,13 @@ class ETLPipeline():
         3. Mapping 'U.K' to 'United Kindgdom
         4. Mapping 'nan', 'Unspecified', 'West Indies' to 'Unknown'.
         5. Else, leave as is."""
-        country_mapping = {
-            "EIRE": "Ireland",
-            "RSA": "South Africa",
-            "U.K.": "United Kingdom",
-            "Unspecified": "Unknown",
-            "West Indies": "Unknown",
-            'nan': "Unknown",
-        }
-
         # replace values in the country column based on mapping
-        df["country"] = df["country"].replace(country_mapping)
+        if isinstance(df["country"].dtype, pd.CategoricalDtype):
+            df["country"] = self._map_categories(df["country"], lambda categories: categories.map(
+                lambda country: COUNTRY_MAPPING.get(country, country)
+            ))
+        else:
+            df["country"] = df["country"].replace(COUNTRY_MAPPING)
 
         return df
     
@@ -119,49 +279,557 @@ class ETLPipeline():
         But from initial data profiling these seem to be the same product 
         because of the description.
         """
-        df["code"] = df["code"].str.upper().str.strip()
+        if isinstance(df["code"].dtype, pd.CategoricalDtype):
+            df["code"] = self._map_categories(df["code"], lambda categories: categories.str.upper().str.strip())
+        else:
+            df["code"] = df["code"].str.upper().str.strip()
         return df
 
 
-    def run_pipeline(self, df: pd.DataFrame):
-        """Run ETL pipeline to full-load invoices CSV file."""
+    def commit(self) -> None:
+        """Commit the pipeline session, once the background writes are done."""
+        if self.writer is not None:
+            self.writer.flush()
+        self.db_session.commit()
+
+    def rollback(self) -> None:
+        """Roll back the pipeline session, skipping queued background writes."""
+        if self.writer is not None:
+            self.writer.cancel()
+        self.db_session.rollback()
+
+    def close(self) -> None:
+        """Stop the background writer, unmap the key registries and close the pipeline session."""
+        if self.writer is not None:
+            self.writer.close()
+        for key_registry in self.key_registries:
+            key_registry.close()
+        self.db_session.close()
+
+    def run_dimension_steps(
+        self,
+        dimension_steps: dict[str, tuple[ETLBase, Callable[[ETLBase], pd.DataFrame]]]
+    ) -> list[pd.DataFrame]:
+        """Run the dimension steps and return their dimension DataFrames in the given order.
+        `dimension_steps` maps a dimension name to its ETL step and a function running that step.
+        When running concurrently, the steps transform their dimensions in parallel and share the pipeline
+        session for their reads and writes, taking turns on it under a lock. All dimensions are thereby
+        loaded in the pipeline's transaction and committed or rolled back together with the fact."""
+        if self.max_workers <= 1:
+            dimension_dfs: list[pd.DataFrame] = []
+            for name, (step, run_step) in dimension_steps.items():
+                self.logger.info(f"Run {name} dimension etl step")
+                dimension_dfs.append(self.run_dimension_step(name, step, run_step))
+            return dimension_dfs
+
+        self.logger.info(f"Run {', '.join(dimension_steps)} dimension etl steps with {self.max_workers} workers")
+        session_lock = threading.Lock()
+        for step, _ in dimension_steps.values():
+            step.session_lock = session_lock
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="dimension") as executor:
+                futures = [
+                    executor.submit(self.run_dimension_step, name, step, run_step)
+                    for name, (step, run_step) in dimension_steps.items()
+                ]
+
+                # stop steps that did not start yet as soon as one step fails
+                _, not_done = wait(futures, return_when=FIRST_EXCEPTION)
+                for future in not_done:
+                    future.cancel()
+        finally:
+            for step, _ in dimension_steps.values():
+                step.session_lock = None
+
+        for future in futures:
+            if not future.cancelled() and future.exception() is not None:
+                raise future.exception()
+
+        return [future.result() for future in futures]
+
+    @contextmanager
+    def _copy_on_write(self) -> Iterator[None]:
+        """Enable pandas copy-on-write while any stage is running.
+        The pandas option is global, so it is counted across stages running on worker threads
+        and only restored when the last one finishes."""
+        with self.copy_on_write_lock:
+            if self.copy_on_write_stages == 0:
+                self.copy_on_write_before = pd.get_option("mode.copy_on_write")
+                pd.set_option("mode.copy_on_write", True)
+            self.copy_on_write_stages += 1
+        try:
+            yield
+        finally:
+            with self.copy_on_write_lock:
+                self.copy_on_write_stages -= 1
+                if self.copy_on_write_stages == 0:
+                    pd.set_option("mode.copy_on_write", self.copy_on_write_before)
+
+    @contextmanager
+    def stage(self, name: str, rows_in: int | None = None) -> Iterator[StageMetrics]:
+        """Measure a stage of the run. In low-copy mode the stage runs with pandas copy-on-write."""
+        copy_mode = self._copy_on_write() if self.low_copy else nullcontext()
+        with self.instrumentation.stage(name, rows_in=rows_in) as stage, copy_mode:
+            yield stage
+
+    def run_transform(
+        self,
+        stage_name: str,
+        transform: Callable[[pd.DataFrame], pd.DataFrame],
+        df: pd.DataFrame
+    ) -> pd.DataFrame:
+        """Run a transform as an instrumented stage, recording rows in and out."""
+        with self.stage(stage_name, rows_in=len(df)) as stage:
+            df = transform(df)
+            stage.add_rows_out(len(df))
+        return df
+
+    def run_dimension_step(self, name: str, step: ETLBase, run_step: Callable[[ETLBase], pd.DataFrame]) -> pd.DataFrame:
+        """Run a dimension step as an instrumented stage, recording the dimension rows produced."""
+        with self.stage(f"dimension.{name}") as stage:
+            dimension_df: pd.DataFrame = run_step(step)
+            stage.add_rows_out(len(dimension_df))
+        return dimension_df
+
+    def log_load_report(self) -> None:
+        """Log rows loaded and load throughput for each table."""
+        if self.writer is not None:
+            self.writer.flush()
+        for result in self.loader.report().values():
+            self.logger.info(
+                f"Table '{result.table_name}': {result.rows} rows in {result.seconds:.2f}s "
+                f"({result.rows_per_second:,.0f} rows/sec)"
+            )
+
+    def _check_data_quality(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Check the renamed source against the data-quality rules, keep failing rows for
+        the quarantine table and return the clean rows."""
+        result = self.data_quality.run(df)
+        if not result.quarantined.empty:
+            self.quarantined.append(result.quarantined)
+        return result.clean
+
+    def load_quarantine(
+        self,
+        incremental: bool = False,
+        high_water_mark: datetime.date | None = None,
+        month_keys: list[int] | None = None
+    ) -> None:
+        """Load the source rows quarantined so far into the quarantine table as part of the load,
+        tagged with the run ID, so the table holds the rejected rows of the loaded source once:
+        - full loads replace the rows of the table,
+        - incremental loads add the rows invoiced after the high-water mark, as kept by `filter_to_delta`,
+        - changed-partition loads replace the rows of the reloaded `month_keys` and the rows without
+        a valid invoice date, which belong to no month."""
+        if self.data_quality is None:
+            return
+
+        quarantined: list[pd.DataFrame] = self.quarantined
+        self.quarantined = []
+        df: pd.DataFrame | None = pd.concat(quarantined, ignore_index=True) if quarantined else None
+        if df is not None:
+            invoice_dates = pd.to_datetime(df["parsed_invoice_date"])
+            df["month_key"] = (invoice_dates.dt.year * 100 + invoice_dates.dt.month).astype("Int32")
+
+        if month_keys is not None:
+            if df is not None:
+                df = df[df["month_key"].isin(month_keys) | df["month_key"].isna()]
+            self.etl_transaction_fact.write(lambda: self.db_session.execute(
+                text(f"DELETE FROM {DQ_QUARANTINE_TABLE_NAME} WHERE month_key IN :month_keys OR month_key IS NULL")
+                .bindparams(bindparam("month_keys", expanding=True)),
+                {"month_keys": month_keys}
+            ))
+        elif not incremental:
+            self.etl_transaction_fact.truncate_table(table_name=DQ_QUARANTINE_TABLE_NAME, session=self.db_session)
+        elif high_water_mark is not None and df is not None:
+            df = df[df["parsed_invoice_date"] > pd.Timestamp(high_water_mark)]
+
+        if df is None or df.empty:
+            return
+
+        counts = df["reason_codes"].str.split(",").explode().value_counts()
+        self.logger.warning(
+            f"Quarantining {len(df)} source rows: "
+            + ", ".join(f"{code} ({count})" for code, count in counts.items())
+        )
+        df = df.drop(columns=["parsed_invoice_date"]).assign(
+            run_id=self.instrumentation.run_id,
+            _insert_txstamp=datetime.datetime.now()
+        )
+
+        load = lambda: self.loader.load(df=df, model=QuarantinedInvoice, session=self.db_session)
+        if self.writer is None:
+            load()
+        else:
+            self.writer.submit(load)
+
+    def source_variant(self) -> str | None:
+        """Name the transforms applied to the cleaned source besides the default ones, if any."""
+        variants = [
+            name for name, enabled in [("compact", self.compact), ("quality", self.data_quality is not None)] if enabled
+        ]
+        return "-".join(variants) or None
+
+    def filter_to_delta(self, df: pd.DataFrame, high_water_mark: datetime.date) -> pd.DataFrame:
+        """Keep only the source rows invoiced after the high-water mark."""
+        return df[df["invoice_date"] > pd.Timestamp(high_water_mark)]
+
+    def read_high_water_mark(self, incremental: bool) -> datetime.date | None:
+        """Return the high-water mark for incremental runs, None for full loads."""
+        if not incremental:
+            return None
+
+        high_water_mark = self.etl_transaction_fact.read_high_water_mark()
+        self.logger.info(f"Incremental load: processing source rows invoiced after {high_water_mark}")
+        return high_water_mark
+
+    def forget_partition_hashes(self, high_water_mark: datetime.date | None) -> None:
+        """Forget the stored month partition hashes a load outside changed-partition runs invalidates:
+        all of them for full loads, those from the month of the high-water mark on for incremental loads."""
+        from_month_key: int | None = None
+        if high_water_mark is not None:
+            from_month_key = high_water_mark.year * 100 + high_water_mark.month
+        self.etl_partition_state.forget(from_month_key=from_month_key)
+
+    def transform_source(self, df: pd.DataFrame, high_water_mark: datetime.date | None = None) -> pd.DataFrame:
+        """Rename, cast, clean and classify the source DataFrame (or a chunk of it).
+        If a high-water mark is given, rows invoiced on or before it are dropped right after casting."""
         self.logger.info("Renaming columns inside DataFrame")
-        df = self._rename_columns(df)
+        df = self.run_transform("transform.rename_columns", self._rename_columns, df)
+
+        if self.data_quality is not None:
+            self.logger.info("Checking data-quality rules")
+            df = self.run_transform("transform.data_quality", self._check_data_quality, df)
 
         self.logger.info("Cast columns inside DataFrame")
-        df = self._cast_columns(df)
+        df = self.run_transform("transform.cast_columns", self._cast_columns, df)
 
-        self.logger.info("Performing data cleaning")
-        df = self._perform_data_cleaning(df)
+        if high_water_mark is not None:
+            self.logger.info("Filtering source to rows after the high-water mark")
+            df = self.run_transform(
+                "transform.filter_to_delta", lambda df: self.filter_to_delta(df, high_water_mark), df
+            )
+
+        # test stock codes are quarantined by the data-quality rules
+        if self.data_quality is None:
+            self.logger.info("Performing data cleaning")
+            df = self.run_transform("transform.data_cleaning", self._perform_data_cleaning, df)
 
         self.logger.info("Creating 'type' column for different types of invoices")
-        df = self._create_quantity_class_column(df)
-        df = self._create_price_class_column(df)
-        df["type"] = df.apply(self._categorize_invoice, axis=1)
+        df = self.run_transform("transform.invoice_type", self._classify_invoice_type, df)
 
         self.logger.info("Cleaning up customer country column")
-        df = self._cleanup_country_column(df)
+        df = self.run_transform("transform.cleanup_country", self._cleanup_country_column, df)
 
         self.logger.info("Uppercasing and trimming whitespace from stock codes")
-        df = self._upper_case_and_trim_code(df)
+        df = self.run_transform("transform.cleanup_code", self._upper_case_and_trim_code, df)
+
+        return df
+
+    def run(self, run_mode: RunMode) -> None:
+        """Run the pipeline in a run mode, which loads the star schema through the pipeline's steps."""
+        run_mode.run(self)
+
+    def run_pipeline(self, df: pd.DataFrame, incremental: bool = False):
+        """Run ETL pipeline to full-load invoices CSV file, as described in `FullLoad`."""
+        self.run(FullLoad(df=df, incremental=incremental))
+
+    def run_pipeline_changed_partitions(self, df: pd.DataFrame):
+        """Run ETL pipeline over invoices CSV file, reloading only the months whose content changed,
+        as described in `ChangedPartitionsLoad`."""
+        self.run(ChangedPartitionsLoad(df=df))
+
+    def run_pipeline_cached(
+        self,
+        file_path: str,
+        read_source: Callable[[str], pd.DataFrame],
+        cache: SourceCache,
+        incremental: bool = False
+    ):
+        """Run ETL pipeline like `run_pipeline`, reusing the cleaned source from `cache`, as described in `CachedLoad`."""
+        self.run(CachedLoad(file_path=file_path, read_source=read_source, cache=cache, incremental=incremental))
+
+    def run_pipeline_checkpointed(
+        self,
+        file_path: str,
+        read_source: Callable[[str], pd.DataFrame],
+        checkpoints: CheckpointStore,
+        resume: bool = False,
+        batch_size: int = FACT_CHECKPOINT_BATCH_SIZE
+    ):
+        """Run ETL pipeline to full-load invoices CSV file, saving the output of every stage to `checkpoints`,
+        as described in `CheckpointedLoad`."""
+        self.run(CheckpointedLoad(
+            file_path=file_path, read_source=read_source, checkpoints=checkpoints, resume=resume, batch_size=batch_size
+        ))
+
+    def create_key_indexes(
+        self,
+        invoice_dim: pd.DataFrame,
+        customer_dim: pd.DataFrame,
+        product_dim: pd.DataFrame
+    ) -> dict[str, KeyIndex | EffectiveKeyIndex]:
+        """Create the natural key to surrogate key lookups the transaction fact step resolves its keys with."""
+        return {
+            "invoice_keys": self.etl_invoice_dim.create_key_index(invoice_dim),
+            "customer_keys": self.etl_customer_dim.create_key_index(customer_dim),
+            "product_keys": self.etl_product_dim.create_key_index(product_dim),
+        }
+
+    def _revenue_attributes(self, invoice_dim: pd.DataFrame, customer_dim: pd.DataFrame) -> dict[str, pd.Series]:
+        """Create the lookups of the invoice type and the customer country by surrogate key,
+        which the revenue summaries group fact rows by."""
+        return {
+            "invoice_types": attribute_by_key(invoice_dim, "invoice_key", "type"),
+            "customer_countries": attribute_by_key(customer_dim, "customer_key", "country"),
+        }
+
+    def _summarize_revenue(
+        self,
+        fact_df: pd.DataFrame,
+        attributes: dict[str, pd.Series],
+        summaries: list[pd.DataFrame | None] | None = None
+    ) -> list[pd.DataFrame]:
+        """Summarize fact rows for every revenue summary table, adding them up with `summaries` if given."""
+        lines: pd.DataFrame = create_revenue_lines(fact_df, **attributes)
+        return [
+            step.collect_summary(lines, summary=summary)
+            for step, summary in zip(self.etl_revenue_aggregates, summaries or [None] * len(self.etl_revenue_aggregates))
+        ]
 
-        self.logger.info("Run date dimension etl step")
-        date_dim = self.etl_date_dim.run_etl()
+    def _load_revenue_aggregates(
+        self,
+        summaries: list[pd.DataFrame | None],
+        incremental: bool = False,
+        month_keys: list[int] | None = None,
+        steps: list[ETLRevenueAggregate] | None = None
+    ) -> None:
+        """Refresh the revenue summary tables with the summaries of the fact rows of the load:
+        replacing them for full loads, adding to the stored months for incremental loads,
+        or replacing the `month_keys` the fact rows were reloaded for.
+        `steps` are the revenue summary steps, e.g. writing into shadow tables."""
+        for step, summary in zip(steps or self.etl_revenue_aggregates, summaries):
+            if month_keys is not None:
+                step.run_etl_for_months(summary=summary, month_keys=month_keys)
+            else:
+                step.run_etl(summary=summary, incremental=incremental)
 
-        self.logger.info("Run invoice dimension etl step")
-        invoice_dim = self.etl_invoice_dim.run_etl(df=df)
+    def refresh_revenue_aggregates(
+        self,
+        fact_df: pd.DataFrame,
+        invoice_dim: pd.DataFrame,
+        customer_dim: pd.DataFrame,
+        incremental: bool = False,
+        month_keys: list[int] | None = None,
+        steps: list[ETLRevenueAggregate] | None = None
+    ) -> None:
+        """Summarize the fact rows of the load while they are in memory and refresh the revenue summary tables,
+        as in `_load_revenue_aggregates`."""
+        self.logger.info("Run revenue summary etl steps")
+        with self.stage("aggregate.revenue", rows_in=len(fact_df)):
+            summaries: list[pd.DataFrame] = self._summarize_revenue(
+                fact_df, self._revenue_attributes(invoice_dim, customer_dim)
+            )
+            self._load_revenue_aggregates(summaries, incremental=incremental, month_keys=month_keys, steps=steps)
 
-        self.logger.info("Run customer dimension etl step")
-        customer_dim = self.etl_customer_dim.run_etl(df=df)
+    def _fact_writer_count(self) -> int:
+        """Number of concurrent fact writers for loads into shadow tables."""
+        if self.fact_writers > 1 and self.db_session.get_bind().dialect.name == "sqlite":
+            self.logger.warning("SQLite does not support concurrent writers. Writing the fact table with one writer")
+            return 1
+        return self.fact_writers
 
-        self.logger.info("Run product dimension etl step")
-        product_dim = self.etl_product_dim.run_etl(df=df)
+    def _load_star_schema_with_swap(self, df: pd.DataFrame):
+        """Full-load the dimensions and the transaction fact into shadow tables and swap them into place:
+        1. Shadow tables are created, the persistent date dimension is copied into its shadow.
+        2. Dimensions are loaded into their shadows and committed, as no reader uses them yet.
+        3. The fact is split by invoice key range across concurrent writers, each committing its own range.
+        4. The revenue summaries are loaded into their shadows from the fact rows.
+        5. The shadow tables are renamed into place in the pipeline session's transaction,
+        so the live tables are replaced all at once when the pipeline commits."""
+        shadow_tables = ShadowTables(
+            models=[DateDimension, InvoiceDimension, CustomerDimension, ProductDimension, TransactionFact]
+            + [step.model for step in self.etl_revenue_aggregates]
+        )
+        with self.stage("swap.create_shadow_tables"):
+            shadow_tables.create(self.db_session, copy_rows_of=[DateDimension])
+            self.db_session.commit()
+
+        # the same steps, writing into the shadow tables
+        date_dim, invoice_dim, customer_dim, product_dim, transaction_fact = [
+            type(step)(table_name=shadow_tables.shadow_name(model), session=self.db_session, loader=self.loader)
+            for step, model in [
+                (self.etl_date_dim, DateDimension),
+                (self.etl_invoice_dim, InvoiceDimension),
+                (self.etl_customer_dim, CustomerDimension),
+                (self.etl_product_dim, ProductDimension),
+                (self.etl_transaction_fact, TransactionFact),
+            ]
+        ]
+        _, invoice_df, customer_df, product_df = self.run_dimension_steps({
+            "date": (date_dim, lambda step: step.run_etl(df=df)),
+            "invoice": (invoice_dim, lambda step: step.run_etl(df=df)),
+            "customer": (customer_dim, lambda step: step.run_etl(df=df)),
+            "product": (product_dim, lambda step: step.run_etl(df=df)),
+        })
+        self.commit()
 
         self.logger.info("Run transaction fact etl step")
-        self.etl_transaction_fact.run_etl(
-            source_df=df,
-            date_dim=date_dim,
-            invoice_dim=invoice_dim,
-            product_dim=product_dim,
-            customer_dim=customer_dim
+        with self.stage("fact.transaction", rows_in=len(df)):
+            fact_df: pd.DataFrame = transaction_fact.run_etl_by_key_range(
+                source_df=df,
+                **self.create_key_indexes(invoice_df, customer_df, product_df),
+                session_factory=self.session_factory or sessionmaker(bind=self.db_session.get_bind()),
+                n_writers=self._fact_writer_count()
+            )
+
+        self.refresh_revenue_aggregates(
+            fact_df, invoice_df, customer_df,
+            steps=[
+                type(step)(table_name=shadow_tables.shadow_name(step.model), session=self.db_session, loader=self.loader)
+                for step in self.etl_revenue_aggregates
+            ]
         )
+
+        self.logger.info("Swapping shadow tables into place")
+        with self.stage("swap.rename_tables"):
+            shadow_tables.swap(self.db_session)
+
+        self.log_load_report()
+
+    def load_star_schema(self, df: pd.DataFrame, incremental: bool):
+        """Create and load the dimensions and the transaction fact from the cleaned source."""
+        if self.swap_tables and not incremental:
+            return self._load_star_schema_with_swap(df)
+
+        # date keys are computed from the invoice date, so the fact step does not need the calendar
+        _, invoice_dim, customer_dim, product_dim = self.run_dimension_steps({
+            "date": (self.etl_date_dim, lambda step: step.run_etl(df=df, incremental=incremental)),
+            "invoice": (self.etl_invoice_dim, lambda step: step.run_etl(df=df, incremental=incremental)),
+            "customer": (self.etl_customer_dim, lambda step: step.run_etl(df=df, incremental=incremental)),
+            "product": (self.etl_product_dim, lambda step: step.run_etl(df=df, incremental=incremental)),
+        })
+
+        self.logger.info("Run transaction fact etl step")
+        with self.stage("fact.transaction", rows_in=len(df)):
+            fact_df: pd.DataFrame = self.etl_transaction_fact.run_etl(
+                source_df=df,
+                **self.create_key_indexes(invoice_dim, customer_dim, product_dim),
+                incremental=incremental
+            )
+
+        self.refresh_revenue_aggregates(fact_df, invoice_dim, customer_dim, incremental=incremental)
+
+        self.log_load_report()
+
+    def run_pipeline_in_chunks(self, read_chunks: Callable[[], Iterable[pd.DataFrame]], incremental: bool = False):
+        """Run ETL pipeline to full-load invoices CSV file, streaming it in fixed-size chunks,
+        as described in `ChunkedLoad`."""
+        self.run(ChunkedLoad(read_chunks=read_chunks, incremental=incremental))
+
+    def __getstate__(self) -> dict:
+        """Pickle only the transform configuration, so source transforms can run in worker processes.
+        Sessions, the loader and the ETL steps stay in the parent process."""
+        return {"compact": self.compact, "low_copy": self.low_copy, "data_quality": self.data_quality is not None}
+
+    def __setstate__(self, state: dict) -> None:
+        """Restore a pipeline that can only run source transforms, in a worker process."""
+        self.logger = get_logger(self.__class__.__name__)
+        self.compact = state["compact"]
+        self.low_copy = state["low_copy"]
+        self.copy_on_write_lock = threading.Lock()
+        self.copy_on_write_stages = 0
+        self.data_quality = DataQualityCheck() if state["data_quality"] else None
+        self.quarantined = []
+        self.instrumentation = RunInstrumentation()
+        self.invoice_types, self.invoice_type_lookup = self._compile_invoice_type_rules()
+
+    def transform_source_file(
+        self,
+        file_path: str,
+        read_source: Callable[[str], pd.DataFrame],
+        spill_path: str,
+        high_water_mark: datetime.date | None = None
+    ) -> tuple[int, list[pd.DataFrame]]:
+        """Read, transform and spill a single source file to `spill_path` as an Arrow IPC file.
+        Runs in a worker process. Returns the number of cleaned rows and the quarantined rows."""
+        df: pd.DataFrame = self.transform_source(read_source(file_path), high_water_mark=high_water_mark)
+        feather.write_feather(df.reset_index(drop=True), spill_path, compression="uncompressed")
+        return len(df), self.quarantined
+
+    def run_pipeline_from_files(
+        self,
+        file_paths: list[str],
+        read_source: Callable[[str], pd.DataFrame],
+        max_workers: int = 1,
+        incremental: bool = False
+    ):
+        """Run ETL pipeline over several source files, giving the same result as loading their
+        concatenation in file order, as described in `FilesLoad`."""
+        self.run(FilesLoad(file_paths=file_paths, read_source=read_source, max_workers=max_workers, incremental=incremental))
+
+    def load_star_schema_in_chunks(
+        self,
+        read_clean_chunks: Callable[[], Iterable[pd.DataFrame]],
+        incremental: bool,
+        high_water_mark: datetime.date | None = None
+    ):
+        """Create and load the dimensions and the transaction fact from cleaned source chunks,
+        in two passes over `read_clean_chunks` as described in `ChunkedLoad`.
+        `high_water_mark` is the one the chunks were filtered with, if any."""
+        date_members: pd.DataFrame | None = None
+        invoice_members: pd.DataFrame | None = None
+        customer_members: pd.DataFrame | None = None
+        product_members: pd.DataFrame | None = None
+
+        self.logger.info("Collecting dimension members from source chunks")
+        for chunk in read_clean_chunks():
+            date_members = self.etl_date_dim.collect_members(df=chunk, members=date_members)
+            invoice_members = self.etl_invoice_dim.collect_members(df=chunk, members=invoice_members)
+            customer_members = self.etl_customer_dim.collect_members(df=chunk, members=customer_members)
+            product_members = self.etl_product_dim.collect_members(df=chunk, members=product_members)
+        self.load_quarantine(incremental=incremental, high_water_mark=high_water_mark)
+
+        _, invoice_dim, customer_dim, product_dim = self.run_dimension_steps({
+            "date": (
+                self.etl_date_dim,
+                lambda step: step.run_etl_from_members(members=date_members, incremental=incremental)
+            ),
+            "invoice": (
+                self.etl_invoice_dim,
+                lambda step: step.run_etl_from_members(members=invoice_members, incremental=incremental)
+            ),
+            "customer": (
+                self.etl_customer_dim,
+                lambda step: step.run_etl_from_members(members=customer_members, incremental=incremental)
+            ),
+            "product": (
+                self.etl_product_dim,
+                lambda step: step.run_etl_from_members(members=product_members, incremental=incremental)
+            ),
+        })
+
+        # the fact rows of every chunk are summarized for the revenue summaries as they are created
+        revenue_attributes: dict[str, pd.Series] = self._revenue_attributes(invoice_dim, customer_dim)
+        summaries: list[pd.DataFrame | None] = [None] * len(self.etl_revenue_aggregates)
+
+        def collect_fact(fact_df: pd.DataFrame) -> None:
+            summaries[:] = self._summarize_revenue(fact_df, revenue_attributes, summaries)
+
+        self.logger.info("Run transaction fact etl step over source chunks")
+        # includes reading (and for CSV chunks, transforming) the source chunks a second time
+        with self.stage("fact.transaction"):
+            self.etl_transaction_fact.run_etl_in_chunks(
+                source_chunks=read_clean_chunks(),
+                **self.create_key_indexes(invoice_dim, customer_dim, product_dim),
+                incremental=incremental,
+                collect_fact=collect_fact
+            )
+        # rows quarantined again by the second pass were loaded after the first one
+        self.quarantined = []
+
+        self.logger.info("Run revenue summary etl steps")
+        with self.stage("aggregate.revenue"):
+            self._load_revenue_aggregates(summaries, incremental=incremental)
+
+        self.log_load_report()
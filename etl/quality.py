@@ -0,0 +1,122 @@
+import numpy as np
+import pandas as pd
+from dataclasses import dataclass
+from typing import Callable
+from etl.logger import get_logger
+
+
+@dataclass
+class DataQualityRule:
+    """Data-quality rule over the renamed source. `check` is given the source and its parsed numeric
+    and date columns, and returns True for every row failing the rule."""
+    code: str
+    description: str
+    check: Callable[[pd.DataFrame, pd.DataFrame], np.ndarray]
+
+
+DATA_QUALITY_RULES: list[DataQualityRule] = [
+    DataQualityRule(
+        code="MISSING_INVOICE_NO",
+        description="Invoice number is missing",
+        check=lambda source, parsed: source["invoice_no"].isna().to_numpy()
+    ),
+    DataQualityRule(
+        code="MISSING_STOCK_CODE",
+        description="Stock code is missing",
+        check=lambda source, parsed: source["code"].isna().to_numpy()
+    ),
+    DataQualityRule(
+        code="TEST_STOCK_CODE",
+        description="Stock code of a test product, containing 'TEST'",
+        check=lambda source, parsed: source["code"].astype(str).str.contains("TEST").to_numpy()
+    ),
+    DataQualityRule(
+        code="INVALID_QUANTITY",
+        description="Quantity is missing or not a whole number",
+        check=lambda source, parsed: (parsed["quantity"].isna() | (parsed["quantity"] % 1 != 0)).to_numpy()
+    ),
+    DataQualityRule(
+        code="INVALID_PRICE",
+        description="Price is missing or not a number",
+        check=lambda source, parsed: parsed["price"].isna().to_numpy()
+    ),
+    DataQualityRule(
+        code="INVALID_INVOICE_DATE",
+        description="Invoice date is missing or cannot be parsed",
+        check=lambda source, parsed: parsed["invoice_date"].isna().to_numpy()
+    ),
+    DataQualityRule(
+        code="INVALID_CUSTOMER_ID",
+        description="Customer ID is given but not a number (missing customer IDs are allowed)",
+        check=lambda source, parsed: (source["customer_id"].notna() & parsed["customer_id"].isna()).to_numpy()
+    ),
+]
+
+
+@dataclass
+class DataQualityResult:
+    """Rows passing all data-quality rules, quarantined rows and the number of rows failing each rule."""
+    clean: pd.DataFrame
+    quarantined: pd.DataFrame
+    counts: dict[str, int]
+
+
+class DataQualityCheck:
+    """Checks the renamed source against data-quality rules in one vectorized pass.
+    Numeric and date columns are parsed once, every rule gives a boolean mask over all rows,
+    and rows failing any rule are split off with the codes of the rules they fail.
+    Clean rows keep their parsed quantity, price and invoice date, so casting does not parse them again."""
+    def __init__(self, rules: list[DataQualityRule] | None = None):
+        self.logger = get_logger(self.__class__.__name__)
+        self.rules: list[DataQualityRule] = rules if rules is not None else DATA_QUALITY_RULES
+
+    def _parse_columns(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Parse the numeric and date columns of the source, unparsable values become missing."""
+        return pd.DataFrame({
+            "quantity": pd.to_numeric(df["quantity"], errors="coerce"),
+            "price": pd.to_numeric(df["price"], errors="coerce"),
+            "invoice_date": pd.to_datetime(df["invoice_date"], errors="coerce"),
+            "customer_id": pd.to_numeric(df["customer_id"], errors="coerce"),
+        }, index=df.index)
+
+    def _reason_codes(self, failures: np.ndarray) -> np.ndarray:
+        """Return the comma separated codes of the rules failed by each row of a (rows x rules) mask."""
+        reason_codes = np.full(len(failures), "", dtype=object)
+        for position, rule in enumerate(self.rules):
+            failed = failures[:, position]
+            reason_codes[failed] = reason_codes[failed] + f"{rule.code},"
+        return np.array([codes[:-1] for codes in reason_codes], dtype=object)
+
+    def _quarantine_frame(self, df: pd.DataFrame, invoice_dates: pd.Series, failures: np.ndarray) -> pd.DataFrame:
+        """Return failing rows as text, as read from the source, with their reason codes
+        and their parsed invoice date (missing if it cannot be parsed), to place them in a load."""
+        quarantined = pd.DataFrame(index=df.index)
+        for column in df.columns:
+            quarantined[column] = df[column].astype(str).where(df[column].notna())
+        quarantined["reason_codes"] = self._reason_codes(failures)
+        quarantined["parsed_invoice_date"] = invoice_dates
+        return quarantined.reset_index(drop=True)
+
+    def run(self, df: pd.DataFrame) -> DataQualityResult:
+        """Check every row of the renamed source against every rule."""
+        parsed: pd.DataFrame = self._parse_columns(df)
+        failures = np.column_stack([rule.check(df, parsed) for rule in self.rules])
+        failed_rows = failures.any(axis=1)
+
+        counts: dict[str, int] = {
+            rule.code: int(count) for rule, count in zip(self.rules, failures.sum(axis=0)) if count
+        }
+        for code, count in counts.items():
+            self.logger.warning(f"{count} source rows fail data-quality rule {code}")
+
+        clean = df[~failed_rows]
+        clean = clean.assign(
+            quantity=parsed["quantity"][~failed_rows],
+            price=parsed["price"][~failed_rows],
+            invoice_date=parsed["invoice_date"][~failed_rows],
+        )
+        return DataQualityResult(
+            clean=clean,
+            quarantined=self._quarantine_frame(df[failed_rows], parsed["invoice_date"][failed_rows], failures[failed_rows]),
+            counts=counts
+        )
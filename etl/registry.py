@@ -0,0 +1,380 @@
+import os
+import re
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Iterator
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from etl.constants import KEY_REGISTRY_INITIAL_CAPACITY, KEY_REGISTRY_MAX_LOAD
+from etl.logger import get_logger
+
+try:
+    import fcntl
+except ImportError:  # Windows has no fcntl, allocations are locked with msvcrt instead
+    fcntl = None
+    import msvcrt
+
+# header fields of a registry file, stored as 64-bit integers in front of the slots
+HEADER_FIELDS: list[str] = ["format_version", "capacity", "count", "next_key", "superseded"]
+HEADER_BYTES: int = 64
+REGISTRY_FORMAT_VERSION = 2
+
+# arrays of slot fields following the header of a registry file, in file order: the hash of the natural key,
+# the offset and length of the natural key in the key file, and the surrogate key
+SLOT_FIELDS: list[tuple[str, type]] = [
+    ("hashes", np.uint64), ("key_offsets", np.int64), ("key_lengths", np.int32), ("surrogate_keys", np.int32)
+]
+# separates the columns of a natural key in its serialized form
+KEY_SEPARATOR = "\x1f"
+
+
+def serialize_natural_keys(columns: list[pd.Series]) -> pd.Series:
+    """Serialize every row of the natural key `columns` to a string in one vectorized pass.
+    Integer and date columns are widened first, so the compact and default schemas serialize alike."""
+    serialized: pd.Series | None = None
+    for column in columns:
+        if pd.api.types.is_integer_dtype(column.dtype) and not isinstance(column.dtype, pd.CategoricalDtype):
+            column = column.astype(np.int64)
+        elif pd.api.types.is_datetime64_any_dtype(column.dtype):
+            # dates are written as nanoseconds, as their text form depends on the other dates of the column
+            column = column.astype("datetime64[ns]").astype(np.int64)
+        column = column.astype(str).reset_index(drop=True)
+        serialized = column if serialized is None else serialized + KEY_SEPARATOR + column
+    return serialized
+
+
+@dataclass
+class EncodedNaturalKeys:
+    """Serialized natural keys encoded as UTF-8: the bytes of all keys back to back,
+    with the start and length of every key."""
+    data: np.ndarray
+    starts: np.ndarray
+    lengths: np.ndarray
+
+    @classmethod
+    def encode(cls, keys: np.ndarray) -> "EncodedNaturalKeys":
+        """Encode serialized natural keys in one vectorized pass, through an Arrow string array."""
+        array: pa.LargeStringArray = pa.array(keys, type=pa.large_string())
+        _, offsets_buffer, data_buffer = array.buffers()
+        offsets: np.ndarray = np.frombuffer(offsets_buffer, dtype=np.int64)[:len(keys) + 1]
+        # keys that are all empty have no data buffer
+        data: np.ndarray = np.frombuffer(data_buffer if data_buffer is not None else b"", dtype=np.uint8)
+        return cls(data=data, starts=offsets[:-1], lengths=np.diff(offsets))
+
+    def bytes_at(self, rows: np.ndarray, length: int) -> np.ndarray:
+        """Return the bytes of the keys at `rows`, which are all `length` bytes long, as a (rows x length) array."""
+        return self.data[self.starts[rows, np.newaxis] + np.arange(length)]
+
+    def packed(self, rows: np.ndarray) -> bytes:
+        """Return the bytes of the keys at `rows`, back to back."""
+        lengths: np.ndarray = self.lengths[rows]
+        ends: np.ndarray = np.cumsum(lengths)
+        # every byte is taken from its key's start, shifted by the key's position in the packed bytes
+        shifts: np.ndarray = np.repeat(self.starts[rows] - (ends - lengths), lengths)
+        return self.data[np.arange(len(shifts)) + shifts].tobytes()
+
+
+def natural_key_hashes(keys: np.ndarray) -> np.ndarray:
+    """Hash serialized natural keys to 64-bit values in one vectorized pass.
+    0 marks empty registry slots, so it is never returned."""
+    hashes: np.ndarray = pd.util.hash_array(keys, categorize=False)
+    hashes[hashes == 0] = 1
+    return hashes
+
+
+class KeyRegistry:
+    """Persistent map from the natural keys of a dimension to their surrogate keys, shared by processes and runs.
+    The map is an open addressing hash table with linear probing in a memory-mapped file: every slot holds
+    the 64-bit hash of a natural key, the position of the serialized natural key in an append-only key file
+    and a 32-bit surrogate key, so a lookup is a few vectorized probes over the mapped slots and never loads
+    the whole map. A slot matches a natural key if both its hash and its stored key bytes are equal,
+    so natural keys with colliding hashes get their own slots and surrogate keys.
+    Lookups take no lock. New keys are allocated under an exclusive file lock, appending the natural keys
+    to the key file and writing the other fields of a slot before the hash that publishes it,
+    so concurrent readers never see half-written slots.
+    When the table fills up, it is rehashed into a new generation file and the old one is marked
+    superseded, which readers check before every lookup. The key file is shared by all generations."""
+    def __init__(self, registry_dir: str, name: str, initial_capacity: int = KEY_REGISTRY_INITIAL_CAPACITY):
+        self.logger = get_logger(self.__class__.__name__)
+        self.registry_dir: str = registry_dir
+        self.name: str = name
+        self.initial_capacity: int = initial_capacity
+        self.generation: int | None = None
+        self.header: np.memmap | None = None
+        self.hashes: np.memmap | None = None
+        self.key_offsets: np.memmap | None = None
+        self.key_lengths: np.memmap | None = None
+        self.surrogate_keys: np.memmap | None = None
+        self.stored_keys: np.memmap | None = None
+        os.makedirs(registry_dir, exist_ok=True)
+
+    def _lock_path(self) -> str:
+        """Return the path of the file locked while keys are allocated."""
+        return os.path.join(self.registry_dir, f"{self.name}.lock")
+
+    def _generation_path(self, generation: int) -> str:
+        """Return the path of a generation of the registry file."""
+        return os.path.join(self.registry_dir, f"{self.name}.{generation}.keys")
+
+    def _key_file_path(self) -> str:
+        """Return the path of the file holding the serialized natural keys."""
+        return os.path.join(self.registry_dir, f"{self.name}.natural_keys")
+
+    def _latest_generation(self) -> int | None:
+        """Return the newest generation of the registry file on disk, or None if there is none yet."""
+        pattern = re.compile(rf"^{re.escape(self.name)}\.(\d+)\.keys$")
+        generations = [int(match.group(1)) for match in map(pattern.match, os.listdir(self.registry_dir)) if match]
+        return max(generations, default=None)
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        """Hold the exclusive allocation lock of the registry, across threads and processes."""
+        with open(self._lock_path(), "a+b") as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def _header_value(self, field: str) -> int:
+        """Return a header field of the mapped registry file."""
+        return int(self.header[HEADER_FIELDS.index(field)])
+
+    def _set_header_value(self, field: str, value: int) -> None:
+        """Set a header field of the mapped registry file."""
+        self.header[HEADER_FIELDS.index(field)] = value
+
+    @staticmethod
+    def _map_slots(f, capacity: int) -> list[np.memmap]:
+        """Memory-map the arrays of slot fields of an open registry file with `capacity` slots, in `SLOT_FIELDS` order."""
+        slot_arrays: list[np.memmap] = []
+        offset: int = HEADER_BYTES
+        for _, dtype in SLOT_FIELDS:
+            slot_arrays.append(np.memmap(f, dtype=dtype, mode="r+", offset=offset, shape=(capacity,)))
+            offset += np.dtype(dtype).itemsize * capacity
+        return slot_arrays
+
+    def _map(self, generation: int) -> None:
+        """Memory-map a generation of the registry file.
+        The file is opened once, so it is mapped whole or, if it was removed, not at all (FileNotFoundError)."""
+        with open(self._generation_path(generation), "r+b") as f:
+            header = np.memmap(f, dtype=np.int64, mode="r+", shape=(HEADER_BYTES // 8,))
+            format_version = int(header[HEADER_FIELDS.index("format_version")])
+            if format_version != REGISTRY_FORMAT_VERSION:
+                raise ValueError(
+                    f"Key registry '{self.name}' in '{self.registry_dir}' has format version {format_version}, "
+                    f"expected {REGISTRY_FORMAT_VERSION}"
+                )
+            slot_arrays = self._map_slots(f, capacity=int(header[HEADER_FIELDS.index("capacity")]))
+        self.close()
+        self.generation = generation
+        self.header = header
+        for (field, _), slot_array in zip(SLOT_FIELDS, slot_arrays):
+            setattr(self, field, slot_array)
+
+    def _slot_arrays(self) -> list[np.memmap]:
+        """Return the arrays of slot fields of the mapped generation, in `SLOT_FIELDS` order."""
+        return [getattr(self, field) for field, _ in SLOT_FIELDS]
+
+    def _write_generation(self, generation: int, capacity: int, slots: list[np.ndarray], next_key: int) -> None:
+        """Write a new generation of the registry file holding the given slot fields, in `SLOT_FIELDS` order.
+        It is written to a temporary file first, so readers never map a partial generation."""
+        path: str = self._generation_path(generation)
+        tmp_path = f"{path}.tmp"
+        size = HEADER_BYTES + sum(np.dtype(dtype).itemsize for _, dtype in SLOT_FIELDS) * capacity
+        with open(tmp_path, "wb") as f:
+            f.truncate(size)
+
+        with open(tmp_path, "r+b") as f:
+            header = np.memmap(f, dtype=np.int64, mode="r+", shape=(HEADER_BYTES // 8,))
+            slot_arrays = self._map_slots(f, capacity)
+        header[:len(HEADER_FIELDS)] = [REGISTRY_FORMAT_VERSION, capacity, len(slots[0]), next_key, 0]
+        self._insert_slots(slot_arrays, slots)
+        for mapped in [header, *slot_arrays]:
+            mapped.flush()
+        del header, slot_arrays
+        os.replace(tmp_path, path)
+
+    def _append_natural_keys(self, keys: EncodedNaturalKeys, rows: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Append the encoded natural keys at `rows` to the key file and return their offsets and lengths in it.
+        Must hold the allocation lock."""
+        key_lengths: np.ndarray = keys.lengths[rows]
+        with open(self._key_file_path(), "ab") as f:
+            start: int = f.seek(0, os.SEEK_END)
+            f.write(keys.packed(rows))
+        key_offsets: np.ndarray = start + np.cumsum(key_lengths) - key_lengths
+        return key_offsets, key_lengths.astype(np.int32)
+
+    def _stored_keys_equal(self, slots: np.ndarray, keys: EncodedNaturalKeys, rows: np.ndarray) -> np.ndarray:
+        """Compare the natural keys stored for `slots` with the encoded natural keys at `rows`, byte for byte.
+        Keys are compared in one vectorized pass per distinct key length."""
+        key_lengths: np.ndarray = keys.lengths[rows]
+        key_offsets: np.ndarray = self.key_offsets[slots]
+        equal: np.ndarray = self.key_lengths[slots] == key_lengths
+        # empty keys of equal length are equal
+        compared: np.ndarray = equal & (key_lengths > 0)
+        if not compared.any():
+            return equal
+
+        # the key file only grows, it is mapped again once it holds keys beyond the mapped part
+        key_file_end: int = int((key_offsets + key_lengths)[compared].max())
+        if self.stored_keys is None or len(self.stored_keys) < key_file_end:
+            self.stored_keys = np.memmap(self._key_file_path(), dtype=np.uint8, mode="r")
+
+        for length in np.unique(key_lengths[compared]):
+            same_length: np.ndarray = np.flatnonzero(compared & (key_lengths == length))
+            stored: np.ndarray = self.stored_keys[key_offsets[same_length, np.newaxis] + np.arange(length)]
+            equal[same_length] = (stored == keys.bytes_at(rows[same_length], length)).all(axis=1)
+        return equal
+
+    def _refresh(self) -> None:
+        """Map the newest generation if no generation is mapped yet or the mapped one was superseded.
+        The first generation is created under the allocation lock.
+        Another process may grow the registry and remove the newest generation between listing and mapping it,
+        in which case the newer generation is looked up again."""
+        while self.header is None or self._header_value("superseded"):
+            generation: int | None = self._latest_generation()
+            if generation is None:
+                with self._locked():
+                    generation = self._latest_generation()
+                    if generation is None:
+                        self.logger.info(f"Creating key registry '{self.name}' in '{self.registry_dir}'")
+                        generation = 0
+                        self._write_generation(
+                            generation, self.initial_capacity, [np.empty(0, dtype=dtype) for _, dtype in SLOT_FIELDS], 1
+                        )
+            try:
+                self._map(generation)
+            except FileNotFoundError:
+                continue
+
+    def _probe(self, hashes: np.ndarray, keys: EncodedNaturalKeys) -> np.ndarray:
+        """Return the slot holding each encoded natural key with its hash, or -1 if it is not registered.
+        All keys probe their next slot together until they hit a slot with their own hash and key bytes
+        or an empty slot. Keys whose hash collides with the one of another key move on to the next slot."""
+        mask: int = len(self.hashes) - 1
+        slots: np.ndarray = (hashes & np.uint64(mask)).astype(np.int64)
+        found_slots: np.ndarray = np.full(len(hashes), -1, dtype=np.int64)
+        pending: np.ndarray = np.arange(len(hashes))
+        while pending.size:
+            stored: np.ndarray = self.hashes[slots[pending]]
+            found: np.ndarray = stored == hashes[pending]
+            candidates: np.ndarray = pending[found]
+            found[found] = self._stored_keys_equal(slots[candidates], keys, candidates)
+            found_slots[pending[found]] = slots[pending[found]]
+            pending = pending[~found & (stored != 0)]
+            slots[pending] = (slots[pending] + 1) & mask
+        return found_slots
+
+    @staticmethod
+    def _insert_slots(slot_arrays: list[np.ndarray], slots: list[np.ndarray]) -> None:
+        """Insert the slot fields of distinct natural keys that are not in the slots yet, in `SLOT_FIELDS` order.
+        Keys probe together from their hash, the first key of each free slot claims it and the others move on.
+        The other fields of a slot are written before its hash, which publishes it to readers."""
+        slot_hashes, hashes = slot_arrays[0], slots[0]
+        mask: int = len(slot_hashes) - 1
+        positions: np.ndarray = (hashes & np.uint64(mask)).astype(np.int64)
+        pending: np.ndarray = np.arange(len(hashes))
+        while pending.size:
+            free: np.ndarray = pending[slot_hashes[positions[pending]] == 0]
+            _, first = np.unique(positions[free], return_index=True)
+            claimed: np.ndarray = free[first]
+            for slot_array, values in reversed(list(zip(slot_arrays, slots))):
+                slot_array[positions[claimed]] = values[claimed]
+
+            pending = pending[~np.isin(pending, claimed, assume_unique=True)]
+            positions[pending] = (positions[pending] + 1) & mask
+
+    def _lookup_keys(self, hashes: np.ndarray, keys: EncodedNaturalKeys) -> np.ndarray:
+        """Return the surrogate key of each encoded natural key with its hash, -1 if it is not registered."""
+        self._refresh()
+        slots: np.ndarray = self._probe(hashes, keys)
+        return np.where(slots >= 0, self.surrogate_keys[np.maximum(slots, 0)], -1).astype(np.int32)
+
+    def lookup(self, columns: list[pd.Series]) -> np.ndarray:
+        """Return the registered surrogate key for every row of the natural key `columns`,
+        -1 for natural keys that are not registered. Every distinct natural key is probed once."""
+        codes, distinct_keys = pd.factorize(serialize_natural_keys(columns).to_numpy(dtype=object))
+        return self._lookup_keys(natural_key_hashes(distinct_keys), EncodedNaturalKeys.encode(distinct_keys))[codes]
+
+    def _grow(self, required: int) -> None:
+        """Rehash the registered keys into a new generation large enough for `required` keys
+        and mark the mapped generation superseded. Must hold the allocation lock."""
+        capacity: int = len(self.hashes)
+        while required > capacity * KEY_REGISTRY_MAX_LOAD:
+            capacity *= 2
+
+        occupied: np.ndarray = np.flatnonzero(self.hashes)
+        self.logger.info(f"Growing key registry '{self.name}' to {capacity} slots")
+        old_generation: int = self.generation
+        self._write_generation(
+            old_generation + 1, capacity,
+            [np.asarray(slot_array[occupied]) for slot_array in self._slot_arrays()],
+            self._header_value("next_key")
+        )
+        self._set_header_value("superseded", 1)
+        self.header.flush()
+        self._map(old_generation + 1)
+
+        # readers may still map the old generation, which cannot be removed while mapped on Windows
+        try:
+            os.remove(self._generation_path(old_generation))
+        except OSError:
+            pass
+
+    def get_or_create(self, columns: list[pd.Series], start: int = 1) -> np.ndarray:
+        """Return the surrogate key for every row of the natural key `columns`, registering the natural keys
+        that are not registered yet. New keys are allocated atomically across processes, in order of
+        first appearance, from the registry's next key or `start`, whichever is higher."""
+        codes, distinct_keys = pd.factorize(serialize_natural_keys(columns).to_numpy(dtype=object))
+        distinct_hashes: np.ndarray = natural_key_hashes(distinct_keys)
+        encoded_keys = EncodedNaturalKeys.encode(distinct_keys)
+        surrogate_keys: np.ndarray = self._lookup_keys(distinct_hashes, encoded_keys)
+        if (surrogate_keys >= 0).all():
+            return surrogate_keys[codes]
+
+        with self._locked():
+            # another process may have registered some of the keys or grown the registry since the lookup
+            self._refresh()
+            surrogate_keys = self._lookup_keys(distinct_hashes, encoded_keys)
+            missing: np.ndarray = np.flatnonzero(surrogate_keys < 0)
+            if missing.size:
+                count: int = self._header_value("count")
+                if count + missing.size > len(self.hashes) * KEY_REGISTRY_MAX_LOAD:
+                    self._grow(count + missing.size)
+
+                next_key: int = max(self._header_value("next_key"), start)
+                surrogate_keys[missing] = np.arange(next_key, next_key + missing.size, dtype=np.int32)
+                key_offsets, key_lengths = self._append_natural_keys(encoded_keys, missing)
+                self._insert_slots(
+                    self._slot_arrays(),
+                    [distinct_hashes[missing], key_offsets, key_lengths, surrogate_keys[missing]]
+                )
+                self._set_header_value("count", count + missing.size)
+                self._set_header_value("next_key", next_key + missing.size)
+                for mapped in [*reversed(self._slot_arrays()), self.header]:
+                    mapped.flush()
+                self.logger.info(f"Registered {missing.size} new keys in key registry '{self.name}'")
+
+        return surrogate_keys[codes]
+
+    def __len__(self) -> int:
+        """Number of registered natural keys."""
+        self._refresh()
+        return self._header_value("count")
+
+    def close(self) -> None:
+        """Unmap the registry file and the key file."""
+        self.header = None
+        for field, _ in SLOT_FIELDS:
+            setattr(self, field, None)
+        self.stored_keys = None
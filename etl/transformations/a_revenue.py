@@ -0,0 +1,187 @@
+import pandas as pd
+from sqlalchemy import bindparam
+from sqlalchemy.sql import text
+from etl.constants import (
+    AGG_REVENUE_COUNTRY_MONTH_TABLE_NAME,
+    AGG_REVENUE_DAILY_TABLE_NAME,
+    AGG_REVENUE_MONTHLY_TABLE_NAME,
+    AGG_REVENUE_PRODUCT_MONTH_TABLE_NAME,
+    AGG_REVENUE_TYPE_MONTH_TABLE_NAME
+)
+from etl.transformations.base import ETLBase
+from etl.logger import get_logger
+from sqlalchemy.orm import Session, sessionmaker
+from etl.db.a_revenue import (
+    CountryMonthRevenueAggregate,
+    DailyRevenueAggregate,
+    MonthlyRevenueAggregate,
+    ProductMonthRevenueAggregate,
+    TypeMonthRevenueAggregate
+)
+from etl.db.core import Base
+from etl.db.loader import BulkLoader, get_bulk_loader
+
+# measures of every revenue summary, all of them add up across summaries of disjoint fact rows
+MEASURES: list[str] = ["line_count", "quantity", "revenue"]
+
+
+def attribute_by_key(dim_df: pd.DataFrame, surrogate_key_name: str, attribute: str) -> pd.Series:
+    """Return an attribute of the members of a dimension DataFrame as a categorical indexed by surrogate key,
+    to look it up for fact rows with `create_revenue_lines`."""
+    return pd.Series(pd.Categorical(dim_df[attribute]), index=pd.Index(dim_df[surrogate_key_name]), name=attribute)
+
+
+def create_revenue_lines(fact_df: pd.DataFrame, invoice_types: pd.Series, customer_countries: pd.Series) -> pd.DataFrame:
+    """Return the transaction fact rows with the columns the revenue summaries group by:
+    the YYYYMM month of the date key, the invoice type and the country of the customer version.
+    The types and countries are looked up once per row by surrogate key, see `attribute_by_key`."""
+    date_keys = fact_df["date_key"].to_numpy()
+    return pd.DataFrame({
+        "date_key": date_keys,
+        "month_key": date_keys // 100,
+        "product_key": fact_df["product_key"].to_numpy(),
+        "type": invoice_types.array.take(invoice_types.index.get_indexer(fact_df["invoice_key"])),
+        "country": customer_countries.array.take(customer_countries.index.get_indexer(fact_df["customer_key"])),
+        "quantity": fact_df["quantity"].to_numpy(),
+        "revenue": fact_df["revenue"].to_numpy(),
+    })
+
+
+class ETLRevenueAggregate(ETLBase):
+    """ETL logic used to create a revenue summary table of the transaction fact, grouped by `group_by`.
+    Summary rows hold the number of fact rows, the quantity and the revenue, which all add up, so the
+    summaries of chunks or of new fact rows are added to each other. Every summary is grouped by month,
+    so the rows of changed months are replaced without touching the other months."""
+    model: type[Base]
+    group_by: list[str] = []
+
+    def __init__(self, table_name: str, session: sessionmaker[Session], loader: BulkLoader | None = None):
+        self.logger = get_logger(self.__class__.__name__)
+        self.table_name: str = table_name
+        self.db_session: sessionmaker[Session] = session
+        self.loader: BulkLoader = loader if loader is not None else get_bulk_loader(session)
+
+    def summarize(self, lines: pd.DataFrame) -> pd.DataFrame:
+        """Summarize revenue lines created with `create_revenue_lines`."""
+        return lines.groupby(self.group_by, as_index=False, observed=True).agg(
+            line_count=("quantity", "size"),
+            quantity=("quantity", "sum"),
+            revenue=("revenue", "sum")
+        )
+
+    def _add_up(self, summaries: list[pd.DataFrame]) -> pd.DataFrame:
+        """Add up summaries of disjoint fact rows."""
+        return pd.concat(summaries, ignore_index=True).groupby(self.group_by, as_index=False, observed=True)[MEASURES].sum()
+
+    def collect_summary(self, lines: pd.DataFrame, summary: pd.DataFrame | None = None) -> pd.DataFrame:
+        """Accumulate the summary of the revenue lines of a chunk of fact rows.
+        Summaries are added up across chunks, so they match the summary of all fact rows."""
+        chunk_summary: pd.DataFrame = self.summarize(lines)
+        if summary is None:
+            return chunk_summary
+        return self._add_up([summary, chunk_summary])
+
+    def _read_months(self, month_keys: list[int]) -> pd.DataFrame:
+        """Read the stored summary rows of the YYYYMM `month_keys`."""
+        self.flush_writes()
+        return pd.read_sql(
+            text(
+                f"SELECT {', '.join(self.group_by + MEASURES)} FROM {self.table_name} WHERE month_key IN :month_keys"
+            ).bindparams(bindparam("month_keys", expanding=True)),
+            self.db_session.connection(),
+            params={"month_keys": month_keys}
+        )
+
+    def _delete_months(self, month_keys: list[int]) -> None:
+        """Delete the stored summary rows of the YYYYMM `month_keys`."""
+        self.write(lambda: self.db_session.execute(
+            text(f"DELETE FROM {self.table_name} WHERE month_key IN :month_keys").bindparams(
+                bindparam("month_keys", expanding=True)
+            ),
+            {"month_keys": month_keys}
+        ))
+
+    def _insert_summary(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Insert summary rows into table"""
+        df = self.create_insert_txstamp(df=df.copy())
+        self.insert_dataframe(df=df, model=self.model)
+        return df
+
+    def run_etl(self, summary: pd.DataFrame | None, incremental: bool = False) -> pd.DataFrame | None:
+        """Concrete implementation of run_etl abstract method.
+        `summary` summarizes the fact rows of the load, it is None if there are none.
+        Incremental runs add it to the stored rows of its months instead of replacing the table."""
+        if not incremental:
+            self.logger.info("Truncating table for full-load")
+            self.truncate_table(table_name=self.table_name, session=self.db_session)
+        if summary is None or summary.empty:
+            return summary
+
+        if incremental:
+            month_keys: list[int] = [int(month_key) for month_key in summary["month_key"].unique()]
+            self.logger.info(f"Adding new fact rows to the summary of {len(month_keys)} months")
+            summary = self._add_up([self._read_months(month_keys), summary])
+            self._delete_months(month_keys)
+
+        self.logger.info("Inserting dataframe into table")
+        df: pd.DataFrame = self._insert_summary(summary)
+
+        self.logger.info(f"Revenue summary '{self.table_name}' ETL step successful")
+
+        return df
+
+    def run_etl_for_months(self, summary: pd.DataFrame, month_keys: list[int]) -> pd.DataFrame:
+        """Replace the stored rows of the YYYYMM `month_keys` with `summary`,
+        which must summarize all fact rows of those months."""
+        self.logger.info(f"Replacing the summary of {len(month_keys)} months")
+        if month_keys:
+            self._delete_months(month_keys)
+        df: pd.DataFrame = self._insert_summary(summary)
+
+        self.logger.info(f"Revenue summary '{self.table_name}' ETL step successful")
+
+        return df
+
+
+class ETLDailyRevenue(ETLRevenueAggregate):
+    """ETL logic used to create the daily revenue summary"""
+    model = DailyRevenueAggregate
+    group_by = ["month_key", "date_key"]
+
+
+class ETLMonthlyRevenue(ETLRevenueAggregate):
+    """ETL logic used to create the monthly revenue summary"""
+    model = MonthlyRevenueAggregate
+    group_by = ["month_key"]
+
+
+class ETLCountryMonthRevenue(ETLRevenueAggregate):
+    """ETL logic used to create the revenue summary per customer country and month"""
+    model = CountryMonthRevenueAggregate
+    group_by = ["month_key", "country"]
+
+
+class ETLProductMonthRevenue(ETLRevenueAggregate):
+    """ETL logic used to create the revenue summary per product and month"""
+    model = ProductMonthRevenueAggregate
+    group_by = ["month_key", "product_key"]
+
+
+class ETLTypeMonthRevenue(ETLRevenueAggregate):
+    """ETL logic used to create the revenue summary per invoice type and month"""
+    model = TypeMonthRevenueAggregate
+    group_by = ["month_key", "type"]
+
+
+def create_revenue_aggregate_steps(
+    session: sessionmaker[Session],
+    loader: BulkLoader | None = None
+) -> list[ETLRevenueAggregate]:
+    """Create the steps of all revenue summary tables."""
+    return [
+        ETLDailyRevenue(table_name=AGG_REVENUE_DAILY_TABLE_NAME, session=session, loader=loader),
+        ETLMonthlyRevenue(table_name=AGG_REVENUE_MONTHLY_TABLE_NAME, session=session, loader=loader),
+        ETLCountryMonthRevenue(table_name=AGG_REVENUE_COUNTRY_MONTH_TABLE_NAME, session=session, loader=loader),
+        ETLProductMonthRevenue(table_name=AGG_REVENUE_PRODUCT_MONTH_TABLE_NAME, session=session, loader=loader),
+        ETLTypeMonthRevenue(table_name=AGG_REVENUE_TYPE_MONTH_TABLE_NAME, session=session, loader=loader),
+    ]
@@ -1,24 +1,235 @@
+import numpy as np
 import pandas as pd
 import datetime
 from abc import ABC, abstractmethod
+from contextlib import AbstractContextManager
+from dataclasses import dataclass
+from typing import Callable
 from sqlalchemy.orm import Session, sessionmaker
 from sqlalchemy.sql import text
+from etl.db.core import Base
+from etl.db.loader import BulkLoader, LoadResult
+from etl.db.writer import BackgroundWriter
+from etl.registry import KeyRegistry
+
+
+def natural_key_index(columns: list[pd.Series]) -> pd.Index:
+    """Build an index over one or more natural key columns."""
+    if len(columns) == 1:
+        return pd.Index(columns[0])
+    return pd.MultiIndex.from_arrays(columns)
+
+
+@dataclass
+class KeyIndex:
+    """Lookup from the natural key of a dimension to its surrogate key."""
+    index: pd.Index
+    surrogate_keys: np.ndarray
+
+    def positions(self, columns: list[pd.Series]) -> np.ndarray:
+        """Return the position in the index of every row of the natural key `columns` in one vectorized pass.
+        Positions encode the natural keys as integers. Rows whose natural key is not in the dimension get -1."""
+        return self.index.get_indexer(natural_key_index(columns))
+
+    def surrogate_keys_at(self, positions: np.ndarray) -> np.ndarray:
+        """Return the surrogate keys at index positions, -1 for missing natural keys."""
+        return np.where(positions >= 0, self.surrogate_keys[positions], -1)
+
+    def resolve(self, columns: list[pd.Series]) -> np.ndarray:
+        """Return the surrogate key for every row of the natural key `columns` in one vectorized pass.
+        Rows whose natural key is not in the dimension get -1."""
+        return self.surrogate_keys_at(self.positions(columns))
+
+
+@dataclass
+class EffectiveKeyIndex:
+    """Lookup from the natural key of a slowly changing dimension and a date to the surrogate key
+    of the member version in effect on that date. `versions` holds the natural key position in `index`,
+    the start date and the position in `surrogate_keys` of every version, ordered by start date."""
+    index: pd.Index
+    versions: pd.DataFrame
+    surrogate_keys: np.ndarray
+
+    def _lookup_versions(self, pairs: pd.DataFrame, direction: str) -> np.ndarray:
+        """Return the position of the version of every (key_code, date) pair found with an as-of merge
+        on the version start dates in `direction`, -1 if there is none."""
+        matched: pd.DataFrame = pd.merge_asof(
+            pairs.sort_values("date"),
+            self.versions,
+            left_on="date",
+            right_on="effective_from",
+            by="key_code",
+            direction=direction
+        ).sort_values("pair")
+        return matched["position"].fillna(-1).to_numpy(dtype=np.int64)
+
+    def positions(self, columns: list[pd.Series], dates: pd.Series) -> np.ndarray:
+        """Return the position of the version in effect on `dates` for every row of the natural key `columns`.
+        The as-of lookup runs once per distinct (natural key, date) pair. Rows dated before the first version
+        of their natural key get that first version, rows whose natural key is not in the dimension
+        or without a date get -1. Positions sort like the surrogate keys."""
+        key_codes: np.ndarray = self.index.get_indexer(natural_key_index(columns))
+        date_codes, distinct_dates = pd.factorize(dates)
+        pair_codes, distinct_pairs = pd.factorize(key_codes.astype(np.int64) * (len(distinct_dates) + 1) + date_codes + 1)
+        pair_key_codes, pair_date_codes = np.divmod(distinct_pairs, len(distinct_dates) + 1)
+
+        pairs = pd.DataFrame({
+            "pair": np.arange(len(distinct_pairs)),
+            "key_code": pair_key_codes,
+            # date code 0 stands for rows without a date
+            "date": pd.DatetimeIndex(distinct_dates).insert(0, pd.NaT).take(pair_date_codes),
+        })
+        pairs = pairs[(pair_key_codes >= 0) & (pair_date_codes > 0)]
+
+        pair_positions: np.ndarray = np.full(len(distinct_pairs), -1, dtype=np.int64)
+        found: np.ndarray = self._lookup_versions(pairs, direction="backward")
+        # rows dated before the first version of their natural key
+        early: np.ndarray = found < 0
+        if early.any():
+            found[early] = self._lookup_versions(pairs[early], direction="forward")
+        pair_positions[pairs["pair"].to_numpy()] = found
+        return pair_positions[pair_codes]
+
+    def surrogate_keys_at(self, positions: np.ndarray) -> np.ndarray:
+        """Return the surrogate keys at version positions, -1 for missing natural keys."""
+        return np.where(positions >= 0, self.surrogate_keys[positions], -1)
+
 
 class ETLBase(ABC):
-    """ETL base class that will house different etl steps."""
+    """ETL base class that will house different etl steps.
+    Dimension steps set `natural_keys` and `surrogate_key_name`, so they can publish a `KeyIndex`.
+    If `writer` is set, truncates and inserts are handed to it and run in the background,
+    and reads wait for the queued writes first.
+    If `key_registry` is set, surrogate keys are taken from it instead of numbering the members.
+    If `session_lock` is set, the step shares its session with steps running on other threads,
+    and every read and write holds the lock, so only one thread uses the session at a time."""
+    natural_keys: list[str] = []
+    surrogate_key_name: str | None = None
+    writer: BackgroundWriter | None = None
+    key_registry: KeyRegistry | None = None
+    session_lock: AbstractContextManager | None = None
+
+    def _serialized(self, database_call: Callable[[], object]) -> Callable[[], object]:
+        """Wrap a call using the step's session to hold the session lock, if the step has one."""
+        if self.session_lock is None:
+            return database_call
+
+        def serialized_call() -> object:
+            with self.session_lock:
+                return database_call()
+        return serialized_call
+
+    def write(self, write: Callable[[], object]) -> None:
+        """Run a database write, or queue it on the background writer if the step has one."""
+        write = self._serialized(write)
+        if self.writer is None:
+            write()
+        else:
+            self.writer.submit(write)
+
+    def flush_writes(self) -> None:
+        """Wait for the writes queued on the background writer, if the step has one."""
+        if self.writer is not None:
+            self.writer.flush()
+
     def create_insert_txstamp(self, df: pd.DataFrame) -> pd.DataFrame:
         """Method to create _insert_txstamp column to a DataFrame."""
         df['_insert_txstamp'] = datetime.datetime.now()
         return df
 
     def truncate_table(self, table_name: str, session: sessionmaker[Session]) -> None:
-        """Method to truncate table."""
-        session.execute(text(f"TRUNCATE TABLE {table_name};"))
+        """Method to truncate table.
+        SQLite has no TRUNCATE statement, so all rows are deleted instead."""
+        if session.get_bind().dialect.name == "sqlite":
+            statement = text(f"DELETE FROM {table_name};")
+        else:
+            statement = text(f"TRUNCATE TABLE {table_name};")
+        self.write(lambda: session.execute(statement))
+
+    def drop_indexes(self, model: type[Base]) -> None:
+        """Method to drop the secondary indexes declared on the model's table, e.g. before a full load,
+        so inserts do not maintain them row by row. Indexes that do not exist are skipped."""
+        for index in sorted(model.__table__.indexes, key=lambda index: index.name):
+            self.write(lambda index=index: index.drop(bind=self.db_session.connection(), checkfirst=True))
+
+    def create_indexes(self, model: type[Base]) -> None:
+        """Method to create the secondary indexes declared on the model's table, e.g. after a full load,
+        each one built in a single sorted pass over the loaded rows. Existing indexes are skipped."""
+        for index in sorted(model.__table__.indexes, key=lambda index: index.name):
+            self.write(lambda index=index: index.create(bind=self.db_session.connection(), checkfirst=True))
 
-    def create_surrogate_key(self, surrogate_key_name: str, df: pd.DataFrame) -> pd.DataFrame:
-        """Create a surrogate key inside the DataFrame"""
-        df[surrogate_key_name] = range(1, len(df) + 1)
+    def insert_dataframe(self, df: pd.DataFrame, model: type[Base]) -> LoadResult | None:
+        """Method to insert a DataFrame into the step's table using the step's bulk loader.
+        Returns None if the insert is queued on the background writer, the DataFrame must not be changed afterwards."""
+        loader: BulkLoader = self.loader
+        load = self._serialized(
+            lambda: loader.load(df=df, model=model, session=self.db_session, table_name=self.table_name)
+        )
+        if self.writer is not None:
+            self.writer.submit(load)
+            return None
+        return load()
+
+    def read_table(self, columns: list[str]) -> pd.DataFrame:
+        """Method to read columns of the step's table into a DataFrame."""
+        self.flush_writes()
+        return self._serialized(lambda: pd.read_sql(
+            text(f"SELECT {', '.join(columns)} FROM {self.table_name}"),
+            self.db_session.connection()
+        ))()
+
+    def registry_key_columns(self, df: pd.DataFrame) -> list[pd.Series]:
+        """Return the columns identifying the members of a DataFrame in the key registry, their natural keys."""
+        return [df[column] for column in self.natural_keys]
+
+    def create_surrogate_key(self, surrogate_key_name: str, df: pd.DataFrame, start: int = 1) -> pd.DataFrame:
+        """Create a surrogate key inside the DataFrame.
+        With a key registry, members keep the key registered for them by earlier runs or other processes,
+        and new members are registered with keys from `start` on."""
+        if self.key_registry is not None:
+            df[surrogate_key_name] = self.key_registry.get_or_create(self.registry_key_columns(df), start=start)
+            return df
+        df[surrogate_key_name] = np.arange(start, start + len(df), dtype=np.int32)
         return df
+
+    def create_key_index(self, df: pd.DataFrame) -> KeyIndex:
+        """Create the natural key to surrogate key lookup of a dimension DataFrame.
+        Members are indexed in surrogate key order, so positions in the index sort like the surrogate keys."""
+        if not df[self.surrogate_key_name].is_monotonic_increasing:
+            df = df.sort_values(self.surrogate_key_name)
+        return KeyIndex(
+            index=natural_key_index([df[column] for column in self.natural_keys]),
+            # surrogate keys are created as 32-bit integers, as stored in the dimension tables
+            surrogate_keys=df[self.surrogate_key_name].to_numpy(dtype=np.int32)
+        )
+
+    def create_new_members(
+        self,
+        existing_df: pd.DataFrame,
+        candidates_df: pd.DataFrame,
+        natural_keys: list[str],
+        surrogate_key_name: str
+    ) -> pd.DataFrame:
+        """Return the candidate members that are not in the existing dimension yet,
+        with surrogate keys continuing after the highest existing key."""
+        if existing_df.empty:
+            new_df: pd.DataFrame = candidates_df.copy()
+            return self.create_surrogate_key(surrogate_key_name=surrogate_key_name, df=new_df)
+
+        merged_df: pd.DataFrame = pd.merge(
+            candidates_df,
+            existing_df[natural_keys].drop_duplicates(),
+            on=natural_keys,
+            how="left",
+            indicator=True
+        )
+        new_df = merged_df[merged_df["_merge"] == "left_only"].drop(columns=["_merge"])
+
+        return self.create_surrogate_key(
+            surrogate_key_name=surrogate_key_name,
+            df=new_df,
+            start=int(existing_df[surrogate_key_name].max()) + 1
+        )
     
     @abstractmethod
     def run_etl(self) -> None:
@@ -1,41 +1,250 @@
+import numpy as np
 import pandas as pd
-from etl.transformations.base import ETLBase
+from sqlalchemy.sql import text
+from etl.transformations.base import ETLBase, EffectiveKeyIndex, natural_key_index
 from etl.logger import get_logger
 from sqlalchemy.orm import Session, sessionmaker
 from etl.db.d_customer import CustomerDimension
+from etl.db.loader import BulkLoader, get_bulk_loader
+
+DIM_COLUMNS: list[str] = [
+    "customer_key", "customer_id", "country", "effective_from", "effective_to", "is_current", "hash_diff"
+]
+
+
+def customer_natural_key(customer_id: pd.Series, country: pd.Series) -> list[pd.Series]:
+    """Return the natural key columns of the customer dimension: the customer ID and, for anonymous
+    customers (customer ID -1), the country. Anonymous customers are kept apart by country,
+    the country of other customers is tracked."""
+    anonymous_country = np.where(customer_id.to_numpy() < 0, country.to_numpy(dtype=object), "")
+    return [customer_id, pd.Series(anonymous_country, index=customer_id.index, name="anonymous_country")]
 
 
 class ETLCustomerDimension(ETLBase):
-    """ETL logic used to create customer dimension"""
-    def __init__(self, table_name: str, session: sessionmaker[Session]):
+    """ETL logic used to create customer dimension.
+    The dimension is a type 2 slowly changing dimension: a customer gets a new version, effective from
+    the invoice date it is first seen with them, whenever its tracked attributes change.
+    Changes are found by comparing a hash of the tracked attributes (`hash_diff`) between consecutive
+    days of a customer, and with the stored current version in incremental runs.
+    Versions start on a day, so a customer invoiced from several countries on one day gets a single version
+    for that day, and the rows of its other countries are attributed to it. Such days are logged."""
+    natural_keys: list[str] = ["customer_id", "anonymous_country"]
+    tracked_attributes: list[str] = ["country"]
+    surrogate_key_name: str = "customer_key"
+
+    def __init__(self, table_name: str, session: sessionmaker[Session], loader: BulkLoader | None = None):
         self.logger = get_logger(self.__class__.__name__)
         self.table_name: str = table_name
         self.db_session: sessionmaker[Session] = session
+        self.loader: BulkLoader = loader if loader is not None else get_bulk_loader(session)
 
     def _select_required_columns(self, df: pd.DataFrame) -> pd.DataFrame:
         """Select only the required columns for the customer dimension."""
-        return df[["customer_id", "country"]]
+        return df[["customer_id", "invoice_date", "country"]]
+
+    def registry_key_columns(self, df: pd.DataFrame) -> list[pd.Series]:
+        """Return the columns identifying the customer versions of a DataFrame in the key registry:
+        the natural key and the start date of the version."""
+        return [df[column] for column in self.natural_keys] + [df["effective_from"]]
+
+    def _hash_tracked_attributes(self, df: pd.DataFrame) -> np.ndarray:
+        """Hash the tracked attributes of every row in one vectorized pass."""
+        return pd.util.hash_pandas_object(df[self.tracked_attributes], index=False).to_numpy().view(np.int64)
+
+    def _attributes_by_day(self, members: pd.DataFrame) -> pd.DataFrame:
+        """Pick the attributes of every customer on every day it is invoiced: the country with the most rows,
+        ties going to the smallest country, so the result does not depend on row order.
+        Days are returned ordered by natural key and date, with the hash of their tracked attributes."""
+        _, anonymous_country = customer_natural_key(members["customer_id"], members["country"])
+        df: pd.DataFrame = members.assign(anonymous_country=anonymous_country)
+        df = df.sort_values(
+            ["customer_id", "anonymous_country", "invoice_date", "size", "country"],
+            ascending=[True, True, True, False, True]
+        )
+        other_countries: np.ndarray = df.duplicated(subset=["customer_id", "anonymous_country", "invoice_date"]).to_numpy()
+        if other_countries.any():
+            self._log_other_countries(df[other_countries])
+        df = df[~other_countries]
+        df = df.rename(columns={"invoice_date": "effective_from"}).drop(columns=["size"]).reset_index(drop=True)
+        df["hash_diff"] = self._hash_tracked_attributes(df)
+        return df
+
+    def _log_other_countries(self, other_countries: pd.DataFrame) -> None:
+        """Log the customer days with rows from more countries than the one picked for their version."""
+        days: pd.DataFrame = other_countries.drop_duplicates(subset=["customer_id", "invoice_date"])
+        examples: str = ", ".join(
+            f"{customer_id} on {invoice_date:%Y-%m-%d}"
+            for customer_id, invoice_date in zip(days["customer_id"].head(5), days["invoice_date"].head(5))
+        )
+        self.logger.warning(
+            f"{len(days)} customer days have rows from several countries (e.g. customer {examples}). "
+            f"{int(other_countries['size'].sum())} rows are attributed to the version of the day's most invoiced country"
+        )
+
+    def _same_customer_as_previous(self, df: pd.DataFrame) -> np.ndarray:
+        """Flag the rows whose natural key is the same as the one of the previous row."""
+        same_customer = np.zeros(len(df), dtype=bool)
+        same_customer[1:] = True
+        for column in self.natural_keys:
+            values = df[column].to_numpy()
+            same_customer[1:] &= values[1:] == values[:-1]
+        return same_customer
+
+    def _create_versions(self, days: pd.DataFrame) -> pd.DataFrame:
+        """Collapse consecutive days of a customer with the same `hash_diff` into versions.
+        A version takes effect on its first day and ends on the first day of the customer's next version.
+        `days` must be ordered by natural key and date."""
+        hash_diff: np.ndarray = days["hash_diff"].to_numpy()
+        same_customer: np.ndarray = self._same_customer_as_previous(days)
+        changed = np.ones(len(days), dtype=bool)
+        changed[1:] = hash_diff[1:] != hash_diff[:-1]
 
-    def _create_customer_dim(self, df: pd.DataFrame) -> pd.DataFrame:
+        versions: pd.DataFrame = days[~same_customer | changed].reset_index(drop=True)
+        has_next_version = np.zeros(len(versions), dtype=bool)
+        has_next_version[:-1] = self._same_customer_as_previous(versions)[1:]
+        versions["effective_to"] = versions["effective_from"].shift(-1).where(has_next_version)
+        versions["is_current"] = ~has_next_version
+        return versions
+
+    def _create_customer_dim(self, members: pd.DataFrame) -> pd.DataFrame:
         """Create customer dimension"""
-        df = self._select_required_columns(df)
-        distinct_df: pd.DataFrame = df.drop_duplicates()
-        distinct_df = self.create_surrogate_key(surrogate_key_name="customer_key", df=distinct_df)
-        return distinct_df
+        versions: pd.DataFrame = self._create_versions(self._attributes_by_day(members))
+        versions = self.create_surrogate_key(surrogate_key_name="customer_key", df=versions)
+        return versions[DIM_COLUMNS]
+
+    def create_key_index(self, df: pd.DataFrame) -> EffectiveKeyIndex:
+        """Create the natural key and date to surrogate key lookup of the customer versions.
+        Versions are indexed in surrogate key order, so positions sort like the surrogate keys."""
+        if not df[self.surrogate_key_name].is_monotonic_increasing:
+            df = df.sort_values(self.surrogate_key_name)
+        natural_keys: pd.Index = natural_key_index(customer_natural_key(df["customer_id"], df["country"]))
+        index: pd.Index = natural_keys.drop_duplicates()
+        key_codes: np.ndarray = index.get_indexer(natural_keys)
+        versions = pd.DataFrame({
+            "key_code": key_codes.astype(np.int64),
+            "effective_from": pd.to_datetime(df["effective_from"]).to_numpy(dtype="datetime64[ns]"),
+            "position": np.arange(len(df)),
+        })
+        return EffectiveKeyIndex(
+            index=index,
+            versions=versions.sort_values("effective_from", kind="stable", ignore_index=True),
+            surrogate_keys=df[self.surrogate_key_name].to_numpy(dtype=np.int32)
+        )
+
+    def collect_members(self, df: pd.DataFrame, members: pd.DataFrame | None = None) -> pd.DataFrame:
+        """Accumulate the number of rows of every (customer ID, invoice date, country) from a chunk of the source DataFrame.
+        Counts are summed across chunks, so the country picked for a customer on each day matches a full load."""
+        count_df: pd.DataFrame = self._select_required_columns(df).groupby(
+            ["customer_id", "invoice_date", "country"], as_index=False, observed=True
+        ).size()
 
-    def run_etl(self, df: pd.DataFrame) -> pd.DataFrame:
+        # categorical columns are counted per category, the counts are kept as plain strings
+        count_df = count_df.astype({"country": str})
+        if members is None:
+            return count_df
+        return (
+            pd.concat([members, count_df])
+            .groupby(["customer_id", "invoice_date", "country"], as_index=False)["size"]
+            .sum()
+        )
+
+    def run_etl(self, df: pd.DataFrame, incremental: bool = False) -> pd.DataFrame:
         """Concrete implementation of run_etl abstract method."""
+        return self.run_etl_from_members(members=self.collect_members(df=df), incremental=incremental)
+
+    def run_etl_from_members(self, members: pd.DataFrame, incremental: bool = False) -> pd.DataFrame:
+        """Create and insert the customer dimension from row counts accumulated with `collect_members`."""
+        if incremental:
+            return self._run_incremental_etl(members=members)
+
         self.logger.info("Truncating table for full-load")
         self.truncate_table(table_name=self.table_name, session=self.db_session)
 
         self.logger.info("Creating customer dimension in pandas")
-        df: pd.DataFrame = self._create_customer_dim(df=df)
+        df: pd.DataFrame = self._create_customer_dim(members=members)
         df = self.create_insert_txstamp(df=df)
 
         self.logger.info("Inserting dataframe into table")
-        records = df.to_dict(orient="records")
-        self.db_session.bulk_insert_mappings(CustomerDimension, records)
+        self.insert_dataframe(df=df, model=CustomerDimension)
 
         self.logger.info("customer dimension ETL step successful")
 
         return df
+
+    def _read_versions(self) -> pd.DataFrame:
+        """Read the stored customer versions."""
+        df: pd.DataFrame = self.read_table(columns=DIM_COLUMNS)
+        return df.astype({"customer_key": np.int32, "is_current": bool, "hash_diff": np.int64}).assign(
+            effective_from=pd.to_datetime(df["effective_from"]),
+            effective_to=pd.to_datetime(df["effective_to"])
+        )
+
+    def _close_versions(self, closed_df: pd.DataFrame) -> None:
+        """Close stored current versions superseded by new versions, in one batch of updates."""
+        parameters: list[dict] = [
+            {"customer_key": int(customer_key), "effective_to": effective_to, "is_current": False}
+            for customer_key, effective_to in zip(closed_df["customer_key"], closed_df["effective_to"].dt.date)
+        ]
+        self.write(lambda: self.db_session.execute(
+            text(
+                f"UPDATE {self.table_name} SET effective_to = :effective_to, is_current = :is_current "
+                "WHERE customer_key = :customer_key"
+            ),
+            parameters
+        ))
+
+    def _run_incremental_etl(self, members: pd.DataFrame) -> pd.DataFrame:
+        """Merge new members into the existing customer dimension, keeping existing versions and surrogate keys.
+        Days after the start of a customer's current version are compared with it through `hash_diff`:
+        a change closes the current version and opens a new one. Earlier days do not rewrite the history.
+        New customers get their versions as in a full load."""
+        self.logger.info("Reading existing customer dimension versions")
+        existing_df: pd.DataFrame = self._read_versions()
+        current_df: pd.DataFrame = existing_df[existing_df["is_current"]]
+        _, anonymous_country = customer_natural_key(current_df["customer_id"], current_df["country"])
+        current_df = current_df.assign(anonymous_country=anonymous_country)
+
+        self.logger.info("Comparing customer attributes with the current versions in pandas")
+        days: pd.DataFrame = self._attributes_by_day(members)
+        days = pd.merge(
+            days,
+            current_df[["customer_id", "anonymous_country", "effective_from"]].rename(
+                columns={"effective_from": "current_from"}
+            ),
+            on=["customer_id", "anonymous_country"],
+            how="left"
+        )
+        days = days[days["current_from"].isna() | (days["effective_from"] > days["current_from"])]
+
+        # every stored current version starts the days of its customer
+        sequence: pd.DataFrame = pd.concat([
+            current_df[["customer_key", "customer_id", "anonymous_country", "country", "effective_from", "hash_diff"]],
+            days.drop(columns=["current_from"]),
+        ], ignore_index=True).sort_values(["customer_id", "anonymous_country", "effective_from"], kind="stable")
+        versions: pd.DataFrame = self._create_versions(sequence)
+
+        closed_df: pd.DataFrame = versions[versions["customer_key"].notna() & ~versions["is_current"]].astype(
+            {"customer_key": np.int32}
+        )
+        new_df: pd.DataFrame = versions[versions["customer_key"].isna()].drop(columns=["customer_key"])
+        new_df = self.create_surrogate_key(
+            surrogate_key_name="customer_key",
+            df=new_df,
+            start=int(existing_df["customer_key"].max()) + 1 if not existing_df.empty else 1
+        )
+        new_df = self.create_insert_txstamp(df=new_df[DIM_COLUMNS])
+
+        if not closed_df.empty:
+            self.logger.info(f"Closing {len(closed_df)} current versions with changed attributes")
+            self._close_versions(closed_df)
+            closed_effective_to: pd.Series = closed_df.set_index("customer_key")["effective_to"]
+            is_closed: pd.Series = existing_df["customer_key"].isin(closed_effective_to.index)
+            existing_df.loc[is_closed, "effective_to"] = existing_df.loc[is_closed, "customer_key"].map(closed_effective_to)
+            existing_df.loc[is_closed, "is_current"] = False
+
+        self.logger.info(f"Inserting {len(new_df)} new versions into table")
+        self.insert_dataframe(df=new_df, model=CustomerDimension)
+
+        self.logger.info("Customer dimension incremental ETL step successful")
+
+        return pd.concat([existing_df, new_df[DIM_COLUMNS]], ignore_index=True)
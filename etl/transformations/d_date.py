@@ -1,23 +1,47 @@
+import datetime
+import numpy as np
 import pandas as pd
 from etl.transformations.base import ETLBase
 from etl.logger import get_logger
 from sqlalchemy.orm import Session, sessionmaker
 from etl.db.d_date import DateDimension
+from etl.db.loader import BulkLoader, get_bulk_loader
+
+
+def create_date_key(dates: pd.DatetimeIndex) -> np.ndarray:
+    """Create YYYYMMDD integer date keys from dates with integer arithmetic."""
+    return (dates.year * 10_000 + dates.month * 100 + dates.day).to_numpy(dtype=np.int32)
+
+
+def create_month_key(dates: pd.DatetimeIndex) -> np.ndarray:
+    """Create YYYYMM integer month keys from dates with integer arithmetic."""
+    return (dates.year * 100 + dates.month).to_numpy(dtype=np.int32)
+
+
+def date_from_date_key(date_key: int) -> datetime.date:
+    """Return the date of a YYYYMMDD integer date key."""
+    return datetime.date(date_key // 10_000, date_key // 100 % 100, date_key % 100)
 
 
 class ETLDateDimension(ETLBase):
-    """ETL logic used to create date dimension"""
-    def __init__(self, table_name: str, session: sessionmaker[Session]):
+    """ETL logic used to create date dimension.
+    The calendar is derived from the invoice dates in the source: it covers every day of the calendar years
+    the source spans. The stored calendar is kept across loads and only extended with the days it is missing."""
+    natural_keys: list[str] = ["date"]
+    surrogate_key_name: str = "date_key"
+
+    def __init__(self, table_name: str, session: sessionmaker[Session], loader: BulkLoader | None = None):
         self.logger = get_logger(self.__class__.__name__)
         self.table_name: str = table_name
         self.db_session: sessionmaker[Session] = session
+        self.loader: BulkLoader = loader if loader is not None else get_bulk_loader(session)
 
     def _create_date_dim(self, start_date: str, end_date: str) -> pd.DataFrame:
         """Create date dimension"""
         date_range = pd.date_range(start=start_date, end=end_date)
 
         dim_date = pd.DataFrame({
-            "date_key": date_range.strftime("%Y%m%d").astype(int),  # YYYYMMDD format as integer
+            "date_key": create_date_key(date_range),  # YYYYMMDD format as integer
             "date": date_range,
             "year": date_range.year,
             "month": date_range.strftime("%B"),  # full month name
@@ -27,19 +51,45 @@ class ETLDateDimension(ETLBase):
 
         return dim_date
 
+    def collect_members(self, df: pd.DataFrame, members: pd.DataFrame | None = None) -> pd.DataFrame:
+        """Accumulate the first and last invoice date from a chunk of the source DataFrame."""
+        new_members = pd.DataFrame({
+            "first_date": [df["invoice_date"].min()],
+            "last_date": [df["invoice_date"].max()],
+        }).dropna()
+        if members is None:
+            return new_members
+        combined_df: pd.DataFrame = pd.concat([members, new_members])
+        return pd.DataFrame({
+            "first_date": [combined_df["first_date"].min()],
+            "last_date": [combined_df["last_date"].max()],
+        }).dropna()
 
-    def run_etl(self) -> pd.DataFrame:
+    def run_etl(self, df: pd.DataFrame, incremental: bool = False) -> pd.DataFrame:
         """Concrete implementation of run_etl abstract method."""
-        self.logger.info("Truncating table for full-load")
-        self.truncate_table(table_name=self.table_name, session=self.db_session)
+        return self.run_etl_from_members(members=self.collect_members(df=df), incremental=incremental)
+
+    def run_etl_from_members(self, members: pd.DataFrame, incremental: bool = False) -> pd.DataFrame:
+        """Extend the stored calendar with the missing days of the calendar years spanned by the
+        invoice dates accumulated with `collect_members`, and return the inserted days.
+        Full and incremental loads behave the same, as the calendar does not depend on previous loads."""
+        if members.empty:
+            self.logger.info("No invoice dates in source, date dimension left unchanged")
+            return pd.DataFrame(columns=[column.name for column in DateDimension.__table__.columns])
+
+        first_year: int = members["first_date"].iloc[0].year
+        last_year: int = members["last_date"].iloc[0].year
+
+        self.logger.info(f"Creating date dimension for {first_year} to {last_year} in pandas")
+        df: pd.DataFrame = self._create_date_dim(start_date=f"{first_year}-01-01", end_date=f"{last_year}-12-31")
 
-        self.logger.info("Creating date dimension in pandas")
-        df: pd.DataFrame = self._create_date_dim(start_date="2009-01-01", end_date="2010-12-31")
+        self.logger.info("Reading existing date keys")
+        existing_keys: pd.DataFrame = self.read_table(columns=["date_key"])
+        df = df[~np.isin(df["date_key"].to_numpy(), existing_keys["date_key"].to_numpy())].reset_index(drop=True)
         df = self.create_insert_txstamp(df=df)
 
-        self.logger.info("Inserting dataframe into table")
-        records = df.to_dict(orient="records")
-        self.db_session.bulk_insert_mappings(DateDimension, records)
+        self.logger.info(f"Inserting {len(df)} missing days into table")
+        self.insert_dataframe(df=df, model=DateDimension)
 
         self.logger.info("Date dimension ETL step successful")
 
@@ -3,14 +3,19 @@ from etl.transformations.base import ETLBase
 from etl.logger import get_logger
 from sqlalchemy.orm import Session, sessionmaker
 from etl.db.d_invoice import InvoiceDimension
+from etl.db.loader import BulkLoader, get_bulk_loader
 
 
 class ETLInvoiceDimension(ETLBase):
     """ETL logic used to create invoice dimension"""
-    def __init__(self, table_name: str, session: sessionmaker[Session]):
+    natural_keys: list[str] = ["invoice_no", "type"]
+    surrogate_key_name: str = "invoice_key"
+
+    def __init__(self, table_name: str, session: sessionmaker[Session], loader: BulkLoader | None = None):
         self.logger = get_logger(self.__class__.__name__)
         self.table_name: str = table_name
         self.db_session: sessionmaker[Session] = session
+        self.loader: BulkLoader = loader if loader is not None else get_bulk_loader(session)
 
     def _select_required_columns(self, df: pd.DataFrame) -> pd.DataFrame:
         """Select only the required columns for the invoice dimension."""
@@ -23,19 +28,54 @@ class ETLInvoiceDimension(ETLBase):
         distinct_df = self.create_surrogate_key(surrogate_key_name="invoice_key", df=distinct_df)
         return distinct_df
 
-    def run_etl(self, df: pd.DataFrame) -> pd.DataFrame:
+    def collect_members(self, df: pd.DataFrame, members: pd.DataFrame | None = None) -> pd.DataFrame:
+        """Accumulate distinct invoice dimension members from a chunk of the source DataFrame.
+        Members keep their order of first appearance, so surrogate keys match a full load."""
+        new_members: pd.DataFrame = self._select_required_columns(df).drop_duplicates()
+        if members is None:
+            return new_members
+        return pd.concat([members, new_members]).drop_duplicates()
+
+    def run_etl(self, df: pd.DataFrame, incremental: bool = False) -> pd.DataFrame:
         """Concrete implementation of run_etl abstract method."""
+        return self.run_etl_from_members(members=self.collect_members(df=df), incremental=incremental)
+
+    def run_etl_from_members(self, members: pd.DataFrame, incremental: bool = False) -> pd.DataFrame:
+        """Create and insert the invoice dimension from members accumulated with `collect_members`."""
+        if incremental:
+            return self._run_incremental_etl(members=members)
+
         self.logger.info("Truncating table for full-load")
         self.truncate_table(table_name=self.table_name, session=self.db_session)
 
         self.logger.info("Creating invoice dimension in pandas")
-        df: pd.DataFrame = self._create_invoice_dim(df=df)
+        df: pd.DataFrame = self._create_invoice_dim(df=members)
         df = self.create_insert_txstamp(df=df)
 
         self.logger.info("Inserting dataframe into table")
-        records = df.to_dict(orient="records")
-        self.db_session.bulk_insert_mappings(InvoiceDimension, records)
+        self.insert_dataframe(df=df, model=InvoiceDimension)
 
         self.logger.info("Invoice dimension ETL step successful")
 
         return df
+
+    def _run_incremental_etl(self, members: pd.DataFrame) -> pd.DataFrame:
+        """Merge new members into the existing invoice dimension, keeping existing surrogate keys."""
+        self.logger.info("Reading existing invoice dimension members")
+        existing_df: pd.DataFrame = self.read_table(columns=["invoice_key", "invoice_no", "type"])
+
+        self.logger.info("Creating new invoice dimension members in pandas")
+        new_df: pd.DataFrame = self.create_new_members(
+            existing_df=existing_df,
+            candidates_df=self._select_required_columns(members).drop_duplicates(),
+            natural_keys=["invoice_no", "type"],
+            surrogate_key_name="invoice_key"
+        )
+        new_df = self.create_insert_txstamp(df=new_df)
+
+        self.logger.info(f"Inserting {len(new_df)} new members into table")
+        self.insert_dataframe(df=new_df, model=InvoiceDimension)
+
+        self.logger.info("Invoice dimension incremental ETL step successful")
+
+        return pd.concat([existing_df, new_df[existing_df.columns]], ignore_index=True)
@@ -1,36 +1,42 @@
 import pandas as pd
-import re
 from etl.transformations.base import ETLBase
 from etl.logger import get_logger
 from sqlalchemy.orm import Session, sessionmaker
 from etl.db.d_product import ProductDimension
+from etl.db.loader import BulkLoader, get_bulk_loader
 
 
 class ETLProductDimension(ETLBase):
     """ETL logic used to create product dimension"""
-    def __init__(self, table_name: str, session: sessionmaker[Session]):
+    natural_keys: list[str] = ["code"]
+    surrogate_key_name: str = "product_key"
+
+    def __init__(self, table_name: str, session: sessionmaker[Session], loader: BulkLoader | None = None):
         self.logger = get_logger(self.__class__.__name__)
         self.table_name: str = table_name
         self.db_session: sessionmaker[Session] = session
+        self.loader: BulkLoader = loader if loader is not None else get_bulk_loader(session)
 
     def _select_required_columns(self, df: pd.DataFrame) -> pd.DataFrame:
         """Select only the required columns for the product dimension."""
         return df[["code", "description"]]
     
-    def _deduplicate_description(self, df: pd.DataFrame) -> pd.DataFrame:
-        """For each code, select the description with the highest count"""
-        # group by stock_code and description, then count occurrences
-        count_df = df.groupby(["code", "description"], as_index=False).size()
-
-        # sort by stock_code (asc) and size (desc)
-        # then drop_duplicates will keep only the first appearance
-        # first appearance should be the one with the highest count due to sort
-        top_descriptions = (
-            count_df.sort_values(["code", "size"], ascending=[True, False])
-            .drop_duplicates(subset=["code"])
-        )
+    def _count_descriptions(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Count occurrences of each (code, description) pair"""
+        count_df = df.groupby(["code", "description"], as_index=False, observed=True).size()
+
+        # categorical columns are counted per category, the counts are kept as plain strings
+        return count_df.astype({"code": str, "description": str})
 
-        return top_descriptions.drop(columns=["size"])
+    def _deduplicate_description(self, count_df: pd.DataFrame) -> pd.DataFrame:
+        """For each code, select the description with the highest count.
+        Ties go to the lexicographically smallest description, so the result does not depend on row order.
+        Both steps are hash-based groupbys over the distinct (code, description) pairs,
+        only the distinct codes of the result are sorted."""
+        max_size = count_df.groupby("code", sort=False)["size"].transform("max")
+        top_descriptions: pd.DataFrame = count_df[count_df["size"] == max_size]
+
+        return top_descriptions.groupby("code", as_index=False)["description"].min()
     
     def _uppercase_description(self, df: pd.DataFrame) -> pd.DataFrame:
         """Upper case description column for consistency"""
@@ -47,36 +53,105 @@ class ETLProductDimension(ETLBase):
 
         # trim whitespace
         df["description"] = df["description"].str.strip()
-        
-        # remove non-alphanumeric characters using regex
-        df["description"] = df["description"].apply(
-            lambda x: re.sub(r"[^a-zA-Z0-9\s]", "", x) if isinstance(x, str) else x
-        )
+
+        # remove any non-alphanumeric characters
+        df["description"] = df["description"].str.replace(r"[^a-zA-Z0-9\s]", "", regex=True)
         
         return df
 
-    def _create_product_dim(self, df: pd.DataFrame) -> pd.DataFrame:
-        """Create product dimension"""
-        df = self._select_required_columns(df)
+    def _normalize_descriptions(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Upper case and clean up the description column, processing each distinct description once"""
+        positions, distinct_descriptions = pd.factorize(df["description"])
+        distinct_df = pd.DataFrame({"description": distinct_descriptions})
+        distinct_df = self._uppercase_description(distinct_df)
+        distinct_df = self._cleanup_description(distinct_df)
+
+        df["description"] = distinct_df["description"].to_numpy()[positions]
+        return df
+
+    def _create_products(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Create the products, without surrogate keys, from (code, description) counts"""
         distinct_df: pd.DataFrame = self._deduplicate_description(df)
-        processed_df: pd.DataFrame = self._uppercase_description(distinct_df)
-        processed_df = self._cleanup_description(processed_df)
+        return self._normalize_descriptions(distinct_df)
+
+    def _create_product_dim(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Create product dimension from (code, description) counts"""
+        processed_df: pd.DataFrame = self._create_products(df)
         processed_df = self.create_surrogate_key(surrogate_key_name="product_key", df=processed_df)
-        return distinct_df
+        return processed_df
 
-    def run_etl(self, df: pd.DataFrame) -> pd.DataFrame:
+    def collect_members(self, df: pd.DataFrame, members: pd.DataFrame | None = None) -> pd.DataFrame:
+        """Accumulate (code, description) counts from a chunk of the source DataFrame.
+        Counts are summed across chunks, so the most frequent description matches a full load."""
+        count_df: pd.DataFrame = self._count_descriptions(self._select_required_columns(df))
+        if members is None:
+            return count_df
+        return (
+            pd.concat([members, count_df])
+            .groupby(["code", "description"], as_index=False)["size"]
+            .sum()
+        )
+
+    def run_etl(self, df: pd.DataFrame, incremental: bool = False) -> pd.DataFrame:
         """Concrete implementation of run_etl abstract method."""
+        return self.run_etl_from_members(members=self.collect_members(df=df), incremental=incremental)
+
+    def run_etl_from_members(self, members: pd.DataFrame, incremental: bool = False) -> pd.DataFrame:
+        """Create and insert the product dimension from counts accumulated with `collect_members`."""
+        if incremental:
+            return self._run_incremental_etl(members=members)
+
         self.logger.info("Truncating table for full-load")
         self.truncate_table(table_name=self.table_name, session=self.db_session)
 
         self.logger.info("Creating product dimension in pandas")
-        df: pd.DataFrame = self._create_product_dim(df=df)
+        df: pd.DataFrame = self._create_product_dim(df=members)
         df = self.create_insert_txstamp(df=df)
 
         self.logger.info("Inserting dataframe into table")
-        records = df.to_dict(orient="records")
-        self.db_session.bulk_insert_mappings(ProductDimension, records)
+        self.insert_dataframe(df=df, model=ProductDimension)
 
         self.logger.info("Product dimension ETL step successful")
 
         return df
+
+    def run_etl_from_top_descriptions(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Create and insert the product dimension from the top description of each code,
+        e.g. as ranked inside the database in ELT mode. Products are keyed in code order."""
+        self.logger.info("Truncating table for full-load")
+        self.truncate_table(table_name=self.table_name, session=self.db_session)
+
+        self.logger.info("Creating product dimension in pandas")
+        df = self._normalize_descriptions(df.sort_values("code", ignore_index=True))
+        df = self.create_surrogate_key(surrogate_key_name="product_key", df=df)
+        df = self.create_insert_txstamp(df=df)
+
+        self.logger.info("Inserting dataframe into table")
+        self.insert_dataframe(df=df, model=ProductDimension)
+
+        self.logger.info("Product dimension ETL step successful")
+
+        return df
+
+    def _run_incremental_etl(self, members: pd.DataFrame) -> pd.DataFrame:
+        """Merge new products into the existing product dimension, keeping existing surrogate keys.
+        Existing products keep their stored description."""
+        self.logger.info("Reading existing product dimension members")
+        existing_df: pd.DataFrame = self.read_table(columns=["product_key", "code", "description"])
+
+        self.logger.info("Creating new product dimension members in pandas")
+        candidates_df: pd.DataFrame = self._create_products(df=members)
+        new_df: pd.DataFrame = self.create_new_members(
+            existing_df=existing_df,
+            candidates_df=candidates_df,
+            natural_keys=["code"],
+            surrogate_key_name="product_key"
+        )
+        new_df = self.create_insert_txstamp(df=new_df)
+
+        self.logger.info(f"Inserting {len(new_df)} new members into table")
+        self.insert_dataframe(df=new_df, model=ProductDimension)
+
+        self.logger.info("Product dimension incremental ETL step successful")
+
+        return pd.concat([existing_df, new_df[existing_df.columns]], ignore_index=True)
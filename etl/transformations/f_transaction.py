@@ -1,78 +1,117 @@
+import datetime
+import math
+import numpy as np
 import pandas as pd
-from etl.transformations.base import ETLBase
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable
+from sqlalchemy.sql import text
+from etl.transformations.base import ETLBase, EffectiveKeyIndex, KeyIndex
+from etl.transformations.d_customer import customer_natural_key
+from etl.transformations.d_date import create_date_key, date_from_date_key
 from etl.logger import get_logger
 from sqlalchemy.orm import Session, sessionmaker
 from etl.db.f_transaction import TransactionFact
+from etl.db.loader import BulkLoader, get_bulk_loader
 
 
 class ETLTransactionFact(ETLBase):
     """ETL logic used to create transaction fact table"""
-    def __init__(self, table_name: str, session: sessionmaker[Session]):
+    def __init__(self, table_name: str, session: sessionmaker[Session], loader: BulkLoader | None = None):
         self.logger = get_logger(self.__class__.__name__)
         self.table_name: str = table_name
         self.db_session: sessionmaker[Session] = session
+        self.loader: BulkLoader = loader if loader is not None else get_bulk_loader(session)
+
+    def read_high_water_mark(self) -> datetime.date | None:
+        """Return the latest invoice date already loaded into the fact table, or None if it is empty."""
+        self.flush_writes()
+        max_date_key = self.db_session.execute(text(f"SELECT MAX(date_key) FROM {self.table_name}")).scalar()
+        if max_date_key is None:
+            return None
+        return date_from_date_key(int(max_date_key))
 
     def _select_required_columns(self, df: pd.DataFrame) -> pd.DataFrame:
         """Select only the required columns for the transaction fact table."""
         return df[["invoice_no", "type", "code", "invoice_date", "customer_id", "country", "quantity", "price"]]
     
-    def _join_with_date_dim(self, df: pd.DataFrame, date_dim: pd.DataFrame) -> pd.DataFrame:
-        """Join dataframe with date dim and drop redundant columns"""
-        df["invoice_date"] = pd.to_datetime(df["invoice_date"]).dt.date
-        date_dim["date"] = pd.to_datetime(date_dim["date"]).dt.date
-        date_dim = date_dim[["date_key", "date"]]
-        joined_df: pd.DataFrame = pd.merge(
-            df,
-            date_dim,
-            left_on="invoice_date",
-            right_on="date",
-            how="left"
-        )
+    def _encode_dim_keys(
+        self,
+        df: pd.DataFrame,
+        invoice_keys: KeyIndex,
+        product_keys: KeyIndex,
+        customer_keys: EffectiveKeyIndex
+    ) -> tuple[pd.DataFrame, pd.DatetimeIndex]:
+        """Encode the natural keys of every row as integers, in the columns of the surrogate keys they stand for.
+        Invoice dates are encoded as positions in the sorted distinct invoice dates, which are returned as well.
+        Customers are encoded as positions of the customer version in effect on the invoice date.
+        The other natural keys are encoded as positions in their dimension's key index, -1 if missing,
+        in one vectorized pass each. All codes sort like the surrogate keys they stand for.
+        The revenue of every row (quantity x price) is computed before rows are grouped to the fact grain."""
+        date_codes, invoice_dates = pd.factorize(df["invoice_date"], sort=True)
+        encoded_df = pd.DataFrame({
+            "date_key": date_codes,
+            "invoice_key": invoice_keys.positions([df["invoice_no"], df["type"]]),
+            "customer_key": customer_keys.positions(
+                customer_natural_key(df["customer_id"], df["country"]), dates=df["invoice_date"]
+            ),
+            "product_key": product_keys.positions([df["code"]]),
+            "quantity": df["quantity"].to_numpy(),
+            "price": df["price"].to_numpy(),
+            "revenue": df["quantity"].to_numpy() * df["price"].to_numpy(),
+        })
+        return encoded_df, pd.DatetimeIndex(invoice_dates)
 
-        return joined_df.drop(columns=["date", "invoice_date"])
-    
-    def _join_with_invoice_dim(self, df: pd.DataFrame, invoice_dim: pd.DataFrame) -> pd.DataFrame:
-        """Join dataframe with invoice dim and drop redundant columns"""
-        invoice_dim = invoice_dim[["invoice_key", "invoice_no", "type"]]
-        joined_df: pd.DataFrame = pd.merge(
-            df,
-            invoice_dim,
-            on=["invoice_no", "type"],
-            how="left"
-        )
+    def _group_to_fact_grain(self, df: pd.DataFrame, code_counts: list[int]) -> pd.DataFrame:
+        """Group to fact grain as there are some duplicate entries.
+        Rows are grouped on their encoded natural keys: every natural key has exactly one surrogate key,
+        so the groups and their order are the same as on the surrogate keys, which are then resolved
+        for the grouped rows only. `code_counts` is the number of codes of each grain key column.
+        Groups are keyed in primary key order, so the fact rows come out ordered like the clustered index
+        and are inserted in index order."""
+        key_columns = ["date_key", "invoice_key", "product_key", "customer_key"]
 
-        return joined_df.drop(columns=["invoice_no", "type"])
-    
-    def _join_with_customer_dim(self, df: pd.DataFrame, customer_dim: pd.DataFrame) -> pd.DataFrame:
-        """Join dataframe with customer dim and drop redundant columns"""
-        customer_dim = customer_dim[["customer_key", "customer_id", "country"]]
-        joined_df: pd.DataFrame = pd.merge(
-            df,
-            customer_dim,
-            on=["customer_id", "country"],
-            how="left"
-        )
+        # the codes of a row are combined into one integer (shifted by one, for missing keys) when it fits
+        # into 64 bits, as grouping on one integer column is faster than grouping on four
+        if math.prod(count + 1 for count in code_counts) >= 2 ** 63:
+            return df.groupby(key_columns, as_index=False)[["quantity", "price", "revenue"]].sum()
 
-        return joined_df.drop(columns=["customer_id", "country"])
-    
-    def _join_with_product_dim(self, df: pd.DataFrame, product_dim: pd.DataFrame) -> pd.DataFrame:
-        """Join dataframe with product dim and drop redundant columns"""
-        product_dim = product_dim[["product_key", "code"]]
-        joined_df: pd.DataFrame = pd.merge(
-            df,
-            product_dim,
-            on="code",
-            how="left"
-        )
+        grain_codes: np.ndarray = np.zeros(len(df), dtype=np.int64)
+        for column, count in zip(key_columns, code_counts):
+            grain_codes = grain_codes * (count + 1) + (df[column].to_numpy() + 1)
+        grouped_df: pd.DataFrame = df[["quantity", "price", "revenue"]].groupby(grain_codes).sum()
+
+        # split the combined codes of the groups back into the grain key columns
+        grain_codes = grouped_df.index.to_numpy()
+        for column, count in reversed(list(zip(key_columns, code_counts))):
+            grain_codes, codes = np.divmod(grain_codes, count + 1)
+            grouped_df[column] = codes - 1
+        return grouped_df[key_columns + ["quantity", "price", "revenue"]].reset_index(drop=True)
+
+    def _resolve_dim_keys(
+        self,
+        df: pd.DataFrame,
+        invoice_dates: pd.DatetimeIndex,
+        invoice_keys: KeyIndex,
+        product_keys: KeyIndex,
+        customer_keys: EffectiveKeyIndex
+    ) -> pd.DataFrame:
+        """Replace the encoded natural keys of every row with dimension surrogate keys.
+        Date keys are computed once per distinct invoice date, the other keys are taken
+        from the dimension's key index at the encoded positions. Missing keys become -1."""
+        date_codes: np.ndarray = df["date_key"].to_numpy()
+        # rows without an invoice date have no date key
+        df["date_key"] = np.where(date_codes >= 0, create_date_key(invoice_dates)[date_codes], -1).astype(np.int32)
+        df["invoice_key"] = invoice_keys.surrogate_keys_at(df["invoice_key"].to_numpy())
+        df["customer_key"] = customer_keys.surrogate_keys_at(df["customer_key"].to_numpy())
+        df["product_key"] = product_keys.surrogate_keys_at(df["product_key"].to_numpy())
+        return df
 
-        return joined_df.drop(columns=["code"])
-    
     def _assert_no_missing_dim_keys(self, df: pd.DataFrame) -> pd.DataFrame:
         """Assert that there are no integrity issues"""
         column_names = ["date_key", "invoice_key", "product_key", "customer_key"]
 
-        # check for missing values in any of the dimension key columns
-        missing_keys = df[column_names].isnull().sum()
+        # keys not found in their dimension are resolved to -1
+        missing_keys = (df[column_names] < 0).sum()
         
         # if any column has missing values, raise an exception
         if missing_keys.any():
@@ -80,81 +119,316 @@ class ETLTransactionFact(ETLBase):
             raise ValueError(f"Missing values found in the following columns: {', '.join(missing_cols.index)}")
         
         return df
-    
-    def _group_to_fact_grain(self, df: pd.DataFrame) -> pd.DataFrame:
-        """Group to fact grain as there are some duplicate entries"""
-        grouped_df = df.groupby(
-            ["date_key", "customer_key", "invoice_key", "product_key"]
-        )[['quantity', 'price']].sum().reset_index()
-
-        return grouped_df
 
     def _create_transaction_fact(
         self,
         source_df: pd.DataFrame,
-        date_dim: pd.DataFrame,
-        invoice_dim: pd.DataFrame,
-        product_dim: pd.DataFrame,
-        customer_dim: pd.DataFrame
+        invoice_keys: KeyIndex,
+        product_keys: KeyIndex,
+        customer_keys: EffectiveKeyIndex
     ) -> pd.DataFrame:
         """Create transaction fact table"""
         df: pd.DataFrame = self._select_required_columns(source_df)
 
-        # join with date dim
-        final_df: pd.DataFrame = self._join_with_date_dim(
+        # group on the encoded natural keys, so surrogate keys are only resolved for the grouped rows
+        encoded_df, invoice_dates = self._encode_dim_keys(
             df=df,
-            date_dim=date_dim
+            invoice_keys=invoice_keys,
+            product_keys=product_keys,
+            customer_keys=customer_keys
         )
-
-        # join with invoice dim
-        final_df = self._join_with_invoice_dim(
-            df=final_df,
-            invoice_dim=invoice_dim
+        grouped_df: pd.DataFrame = self._group_to_fact_grain(
+            encoded_df,
+            code_counts=[
+                len(invoice_dates), len(invoice_keys.index), len(product_keys.index), len(customer_keys.surrogate_keys)
+            ]
         )
 
-        # join with customer dim
-        final_df = self._join_with_customer_dim(
-            df=final_df,
-            customer_dim=customer_dim
-        )
-
-        # join with product dim
-        final_df = self._join_with_product_dim(
-            df=final_df,
-            product_dim=product_dim
+        # resolve dim keys
+        final_df: pd.DataFrame = self._resolve_dim_keys(
+            df=grouped_df,
+            invoice_dates=invoice_dates,
+            invoice_keys=invoice_keys,
+            product_keys=product_keys,
+            customer_keys=customer_keys
         )
 
         # assert no missing dim keys
         final_df = self._assert_no_missing_dim_keys(final_df)
-
-        final_df = self._group_to_fact_grain(final_df)
         
         return final_df
 
     def run_etl(
         self,
         source_df: pd.DataFrame,
-        date_dim: pd.DataFrame,
-        invoice_dim: pd.DataFrame,
-        product_dim: pd.DataFrame,
-        customer_dim: pd.DataFrame
-    ) -> None:
-        """Concrete implementation of run_etl abstract method."""
-        self.logger.info("Truncating table for full-load")
-        self.truncate_table(table_name=self.table_name, session=self.db_session)
+        invoice_keys: KeyIndex,
+        product_keys: KeyIndex,
+        customer_keys: EffectiveKeyIndex,
+        incremental: bool = False
+    ) -> pd.DataFrame:
+        """Concrete implementation of run_etl abstract method.
+        Incremental runs append to the fact table instead of truncating it, full loads insert
+        without secondary indexes and create them afterwards.
+        Returns the fact rows, with the revenue of their source rows."""
+        if not incremental:
+            self.logger.info("Truncating table for full-load")
+            self.truncate_table(table_name=self.table_name, session=self.db_session)
+            self.drop_indexes(model=TransactionFact)
 
         self.logger.info("Creating transaction fact table in pandas")
         df: pd.DataFrame = self._create_transaction_fact(
             source_df=source_df,
-            date_dim=date_dim,
-            invoice_dim=invoice_dim,
-            product_dim=product_dim,
-            customer_dim=customer_dim
+            invoice_keys=invoice_keys,
+            product_keys=product_keys,
+            customer_keys=customer_keys
         )
+        self._insert_fact(df=df)
+        if not incremental:
+            self._create_indexes()
+
+        self.logger.info("Transaction fact table ETL step successful")
+
+        return df
+
+    def run_etl_for_months(
+        self,
+        source_df: pd.DataFrame,
+        month_keys: list[int],
+        invoice_keys: KeyIndex,
+        product_keys: KeyIndex,
+        customer_keys: EffectiveKeyIndex
+    ) -> pd.DataFrame:
+        """Replace the fact rows of the YYYYMM `month_keys` with the fact rows created from `source_df`,
+        which must hold all source rows of those months. Fact rows of other months are kept.
+        Every month is deleted by its date key range, so the deletes can seek on the primary key.
+        Returns the fact rows created, as `run_etl`."""
+        for month_key in month_keys:
+            self.logger.info(f"Deleting fact rows of month {month_key}")
+            self.write(lambda month_key=month_key: self.db_session.execute(
+                text(f"DELETE FROM {self.table_name} WHERE date_key BETWEEN :first_date_key AND :last_date_key"),
+                {"first_date_key": month_key * 100 + 1, "last_date_key": month_key * 100 + 31}
+            ))
+
+        self.logger.info("Creating transaction fact table in pandas")
+        df: pd.DataFrame = self._create_transaction_fact(
+            source_df=source_df,
+            invoice_keys=invoice_keys,
+            product_keys=product_keys,
+            customer_keys=customer_keys
+        )
+        self._insert_fact(df=df)
+
+        self.logger.info("Transaction fact table ETL step successful")
+
+        return df
+
+    def _create_indexes(self) -> None:
+        """Create the secondary indexes of the fact table after a full load"""
+        self.logger.info("Creating secondary indexes")
+        self.create_indexes(model=TransactionFact)
+
+    def _insert_fact(self, df: pd.DataFrame) -> None:
+        """Insert transaction fact rows into table"""
         df = self.create_insert_txstamp(df=df)
 
         self.logger.info("Inserting dataframe into table")
-        records = df.to_dict(orient="records")
-        self.db_session.bulk_insert_mappings(TransactionFact, records)
+        self.insert_dataframe(df=df, model=TransactionFact)
+
+    def create_fact(
+        self,
+        source_df: pd.DataFrame,
+        invoice_keys: KeyIndex,
+        product_keys: KeyIndex,
+        customer_keys: EffectiveKeyIndex
+    ) -> pd.DataFrame:
+        """Create the transaction fact rows without inserting them, ordered by invoice key
+        so they can be inserted in batches with `run_etl_in_batches`."""
+        self.logger.info("Creating transaction fact table in pandas")
+        df: pd.DataFrame = self._create_transaction_fact(
+            source_df=source_df,
+            invoice_keys=invoice_keys,
+            product_keys=product_keys,
+            customer_keys=customer_keys
+        )
+        return df.sort_values("invoice_key", kind="stable", ignore_index=True)
+
+    def _split_into_batches(self, df: pd.DataFrame, batch_size: int) -> list[pd.DataFrame]:
+        """Split fact rows ordered by invoice key into batches of about `batch_size` rows.
+        Batches end on invoice boundaries, so every batch covers its own invoice key range."""
+        invoice_keys: np.ndarray = df["invoice_key"].to_numpy()
+        # every row goes to the batch of the first row of its invoice
+        first_row_of_invoice: np.ndarray = np.searchsorted(invoice_keys, invoice_keys, side="left")
+        _, batch_of_row = np.unique(first_row_of_invoice // batch_size, return_inverse=True)
+        boundaries: np.ndarray = np.flatnonzero(np.diff(batch_of_row)) + 1
+        return [df.iloc[start:end] for start, end in zip(np.r_[0, boundaries], np.r_[boundaries, len(df)])]
+
+    def run_etl_in_batches(
+        self,
+        df: pd.DataFrame,
+        batch_size: int,
+        batches_committed: int = 0,
+        record_batch: Callable[[int], None] | None = None
+    ) -> None:
+        """Full-load fact rows created with `create_fact`, committing every batch of about `batch_size` rows.
+        After each commit `record_batch` is called with the number of batches committed so far.
+        With `batches_committed`, the load resumes after the batches committed by an earlier run.
+        Rows of the first batch not recorded are deleted first, as that batch may have been
+        committed without being recorded.
+        Secondary indexes are dropped with the truncate and created once all batches are committed."""
+        batches: list[pd.DataFrame] = self._split_into_batches(df, batch_size) if not df.empty else []
+
+        if batches_committed == 0:
+            self.logger.info("Truncating table for full-load")
+            self.truncate_table(table_name=self.table_name, session=self.db_session)
+            self.drop_indexes(model=TransactionFact)
+        elif batches_committed < len(batches):
+            first_invoice_key: int = int(batches[batches_committed]["invoice_key"].iloc[0])
+            self.logger.info(f"Resuming after {batches_committed} of {len(batches)} committed batches")
+            self.write(lambda: self.db_session.execute(
+                text(f"DELETE FROM {self.table_name} WHERE invoice_key >= :invoice_key"),
+                {"invoice_key": first_invoice_key}
+            ))
+
+        for batch_number in range(batches_committed, len(batches)):
+            self.logger.info(f"Inserting batch {batch_number + 1} of {len(batches)}")
+            self._insert_fact(df=batches[batch_number].copy())
+            self.flush_writes()
+            self.db_session.commit()
+            if record_batch is not None:
+                record_batch(batch_number + 1)
+        self._create_indexes()
+
+        self.logger.info("Transaction fact table ETL step successful")
+
+    def _split_by_key_range(self, df: pd.DataFrame, n_partitions: int) -> list[pd.DataFrame]:
+        """Split fact rows into `n_partitions` partitions of equal-width invoice key ranges"""
+        invoice_keys: np.ndarray = df["invoice_key"].to_numpy()
+        max_invoice_key: int = max(int(invoice_keys.max(initial=1)), 1)
+        partition_of_row: np.ndarray = (invoice_keys - 1) * n_partitions // max_invoice_key
+        return [df[partition_of_row == partition] for partition in range(n_partitions)]
+
+    def _insert_partition(self, df: pd.DataFrame, session_factory: sessionmaker[Session]) -> None:
+        """Insert a partition of fact rows on its own session and commit it"""
+        session: Session = session_factory()
+        try:
+            self.loader.load(df=df, model=TransactionFact, session=session, table_name=self.table_name)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def run_etl_by_key_range(
+        self,
+        source_df: pd.DataFrame,
+        invoice_keys: KeyIndex,
+        product_keys: KeyIndex,
+        customer_keys: EffectiveKeyIndex,
+        session_factory: sessionmaker[Session],
+        n_writers: int = 1
+    ) -> pd.DataFrame:
+        """Create the transaction fact table and insert it with `n_writers` concurrent writers,
+        each writing one invoice key range on its own session.
+        Every writer commits its own partition, so this is meant for tables no reader uses yet,
+        such as shadow tables that are swapped into place afterwards. Returns the fact rows, as `run_etl`."""
+        self.logger.info("Creating transaction fact table in pandas")
+        df: pd.DataFrame = self._create_transaction_fact(
+            source_df=source_df,
+            invoice_keys=invoice_keys,
+            product_keys=product_keys,
+            customer_keys=customer_keys
+        )
+        df = self.create_insert_txstamp(df=df)
+
+        self.logger.info(f"Inserting dataframe into table with {n_writers} writers by invoice key range")
+        with ThreadPoolExecutor(max_workers=n_writers, thread_name_prefix="fact-writer") as executor:
+            futures = [
+                executor.submit(self._insert_partition, partition, session_factory)
+                for partition in self._split_by_key_range(df, n_writers)
+            ]
+        for future in futures:
+            future.result()
 
         self.logger.info("Transaction fact table ETL step successful")
+
+        return df
+
+    def _split_open_invoice(self, df: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+        """Split off the rows of the last invoice in a chunk, as that invoice may continue in the next chunk"""
+        is_open: pd.Series = df["invoice_no"] == df["invoice_no"].iloc[-1]
+        return df[~is_open], df[is_open]
+
+    def run_etl_in_chunks(
+        self,
+        source_chunks: Iterable[pd.DataFrame],
+        invoice_keys: KeyIndex,
+        product_keys: KeyIndex,
+        customer_keys: EffectiveKeyIndex,
+        incremental: bool = False,
+        collect_fact: Callable[[pd.DataFrame], None] | None = None
+    ) -> None:
+        """Create and insert the transaction fact table one source chunk at a time.
+        Rows of the last invoice in each chunk are carried over to the next chunk,
+        so duplicate line items are grouped to the fact grain exactly as in a full load.
+        This relies on the rows of an invoice being adjacent in the source file.
+        `collect_fact` is called with the fact rows of every chunk, e.g. to summarize them.
+        Full loads insert without secondary indexes and create them after the last chunk."""
+        if not incremental:
+            self.logger.info("Truncating table for full-load")
+            self.truncate_table(table_name=self.table_name, session=self.db_session)
+            self.drop_indexes(model=TransactionFact)
+
+        # flags which invoice keys have already been written, to detect invoices split across chunks
+        max_invoice_key: int = int(invoice_keys.surrogate_keys.max(initial=0))
+        loaded_invoice_keys = np.zeros(max_invoice_key + 1, dtype=bool)
+        carry_over: pd.DataFrame | None = None
+
+        for chunk in source_chunks:
+            if carry_over is not None:
+                chunk = pd.concat([carry_over, chunk], ignore_index=True)
+            if chunk.empty:
+                continue
+
+            chunk, carry_over = self._split_open_invoice(chunk)
+            self._insert_fact_chunk(chunk, loaded_invoice_keys, invoice_keys, product_keys, customer_keys, collect_fact)
+
+        if carry_over is not None:
+            self._insert_fact_chunk(carry_over, loaded_invoice_keys, invoice_keys, product_keys, customer_keys, collect_fact)
+        if not incremental:
+            self._create_indexes()
+
+        self.logger.info("Transaction fact table ETL step successful")
+
+    def _insert_fact_chunk(
+        self,
+        source_df: pd.DataFrame,
+        loaded_invoice_keys: np.ndarray,
+        invoice_keys: KeyIndex,
+        product_keys: KeyIndex,
+        customer_keys: EffectiveKeyIndex,
+        collect_fact: Callable[[pd.DataFrame], None] | None = None
+    ) -> None:
+        """Create and insert the transaction fact rows of a single source chunk"""
+        if source_df.empty:
+            return
+
+        self.logger.info("Creating transaction fact rows for chunk in pandas")
+        df: pd.DataFrame = self._create_transaction_fact(
+            source_df=source_df,
+            invoice_keys=invoice_keys,
+            product_keys=product_keys,
+            customer_keys=customer_keys
+        )
+
+        chunk_invoice_keys = df["invoice_key"].unique()
+        if loaded_invoice_keys[chunk_invoice_keys].any():
+            raise ValueError(
+                "Rows of the same invoice are not adjacent in the source file. "
+                "Use a full load instead of chunked streaming for this file."
+            )
+        loaded_invoice_keys[chunk_invoice_keys] = True
+
+        self._insert_fact(df=df)
+        if collect_fact is not None:
+            collect_fact(df)
@@ -0,0 +1,99 @@
+import hashlib
+import numpy as np
+import pandas as pd
+from sqlalchemy import bindparam
+from sqlalchemy.sql import text
+from etl.constants import SOURCE_TRANSFORM_VERSION
+from etl.transformations.base import ETLBase
+from etl.logger import get_logger
+from sqlalchemy.orm import Session, sessionmaker
+from etl.db.p_partition import PartitionState
+from etl.db.loader import BulkLoader, get_bulk_loader
+
+# columns of the cleaned source the dimensions and the transaction fact are built from
+PARTITION_COLUMNS: list[str] = [
+    "invoice_no", "type", "code", "description", "invoice_date", "customer_id", "country", "quantity", "price"
+]
+
+
+class ETLPartitionState(ETLBase):
+    """ETL logic used to detect the month partitions of the cleaned source that changed since they were loaded.
+    Every partition is summarised by a content hash, which is stored in the partition state table
+    once the partition's facts are loaded."""
+    def __init__(self, table_name: str, session: sessionmaker[Session], loader: BulkLoader | None = None):
+        self.logger = get_logger(self.__class__.__name__)
+        self.table_name: str = table_name
+        self.db_session: sessionmaker[Session] = session
+        self.loader: BulkLoader = loader if loader is not None else get_bulk_loader(session)
+
+    def _content_hash(self, row_count: int, row_hash_sum: int, variant: str | None) -> str:
+        """Hash the summary of a partition together with the transform version and variant,
+        so partitions cleaned by other transforms count as changed."""
+        return hashlib.sha256(
+            f"v{SOURCE_TRANSFORM_VERSION}-{variant}-{row_count}-{row_hash_sum}".encode()
+        ).hexdigest()
+
+    def hash_partitions(self, df: pd.DataFrame, month_keys: np.ndarray, variant: str | None = None) -> pd.DataFrame:
+        """Return the row count and content hash of every month partition of the cleaned source,
+        `month_keys` being the YYYYMM month of every row.
+        Rows are hashed in one vectorized pass and the row hashes of each month are summed (wrapping around),
+        so the hash does not depend on the order of the rows."""
+        row_hashes = pd.util.hash_pandas_object(df[PARTITION_COLUMNS], index=False).to_numpy()
+        summary: pd.DataFrame = pd.Series(row_hashes).groupby(month_keys).agg(["size", "sum"])
+
+        return pd.DataFrame({
+            "month_key": summary.index.to_numpy(dtype=np.int32),
+            "row_count": summary["size"].to_numpy(),
+            "content_hash": [
+                self._content_hash(int(row_count), int(row_hash_sum), variant)
+                for row_count, row_hash_sum in zip(summary["size"], summary["sum"])
+            ],
+        })
+
+    def find_changed_partitions(self, hashes: pd.DataFrame) -> pd.DataFrame:
+        """Return the partitions whose content hash differs from the stored one or that were never loaded."""
+        self.logger.info("Reading stored partition hashes")
+        stored_df: pd.DataFrame = self.read_table(columns=["month_key", "content_hash"])
+
+        merged_df: pd.DataFrame = pd.merge(
+            hashes,
+            stored_df.astype({"month_key": np.int32}),
+            on=["month_key", "content_hash"],
+            how="left",
+            indicator=True
+        )
+        return merged_df[merged_df["_merge"] == "left_only"].drop(columns=["_merge"]).reset_index(drop=True)
+
+    def forget(self, from_month_key: int | None = None) -> None:
+        """Forget the stored hashes of all partitions, or of the partitions from `from_month_key` on,
+        once their facts are loaded by other modes. Forgotten partitions are reloaded by the next
+        changed-partition run."""
+        if from_month_key is None:
+            self.truncate_table(table_name=self.table_name, session=self.db_session)
+            return
+
+        self.write(lambda: self.db_session.execute(
+            text(f"DELETE FROM {self.table_name} WHERE month_key >= :month_key"),
+            {"month_key": from_month_key}
+        ))
+
+    def run_etl(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Concrete implementation of run_etl abstract method.
+        Stores the hashes of the reloaded partitions in `df`, replacing their stored hashes."""
+        month_keys: list[int] = [int(month_key) for month_key in df["month_key"]]
+        if not month_keys:
+            return df
+
+        self.logger.info(f"Replacing stored hashes of {len(month_keys)} partitions")
+        self.write(lambda: self.db_session.execute(
+            text(f"DELETE FROM {self.table_name} WHERE month_key IN :month_keys").bindparams(
+                bindparam("month_keys", expanding=True)
+            ),
+            {"month_keys": month_keys}
+        ))
+        df = self.create_insert_txstamp(df=df.copy())
+        self.insert_dataframe(df=df, model=PartitionState)
+
+        self.logger.info("Partition state ETL step successful")
+
+        return df
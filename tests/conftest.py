@@ -0,0 +1,33 @@
+import pandas as pd
+import pytest
+from benchmarks.synthetic import SyntheticInvoiceGenerator
+from etl.main import _read_csv_from_source
+from star_schema import load, natural_key_tables
+
+# enough rows for 13 months of invoices with cancellations, missing customers and duplicate lines
+N_ROWS: int = 20_000
+
+
+@pytest.fixture(scope="session")
+def source_csv(tmp_path_factory) -> str:
+    """Path of a synthetic invoices CSV file."""
+    path = str(tmp_path_factory.mktemp("source") / "invoices.csv")
+    SyntheticInvoiceGenerator(seed=0).write_csv(file_path=path, n_rows=N_ROWS)
+    return path
+
+
+@pytest.fixture
+def source_df(source_csv) -> pd.DataFrame:
+    """The synthetic source, read as by `etl.main`."""
+    return _read_csv_from_source(source_csv)
+
+
+@pytest.fixture(scope="session")
+def reference_tables(tmp_path_factory, source_csv) -> dict[str, pd.DataFrame]:
+    """Natural-key tables of a full in-memory load of the synthetic source with `run_pipeline`,
+    which every other load mode must reproduce."""
+    engine = load(
+        str(tmp_path_factory.mktemp("reference") / "invoices.db"),
+        lambda pipeline: pipeline.run_pipeline(_read_csv_from_source(source_csv))
+    )
+    return natural_key_tables(engine)
@@ -0,0 +1,77 @@
+import pandas as pd
+from typing import Callable
+from sqlalchemy import Engine
+from sqlalchemy.orm import Session, sessionmaker
+from etl.db.core import DBContext
+from etl.elt import ELTPipeline
+from etl.pipeline import ETLPipeline
+
+# surrogate keys differ between load modes, so tables are compared on their natural keys
+SURROGATE_KEYS: dict[str, str] = {
+    "dim_invoice": "invoice_key",
+    "dim_customer": "customer_key",
+    "dim_product": "product_key",
+}
+
+FACT_QUERY: str = """
+    SELECT f.date_key, i.invoice_no, i.type, c.customer_id, c.country, c.effective_from, p.code, f.quantity, f.price
+    FROM fact_transactions f
+    JOIN dim_invoice i ON i.invoice_key = f.invoice_key
+    JOIN dim_customer c ON c.customer_key = f.customer_key
+    JOIN dim_product p ON p.product_key = f.product_key
+"""
+
+
+def create_database(db_path: str) -> tuple[Engine, Session]:
+    """Create a SQLite database with the star schema tables and a session on it."""
+    db = DBContext()
+    engine: Engine = db.get_sqlite_engine(db_path=db_path)
+    db.create_tables(engine)
+    return engine, sessionmaker(bind=engine)()
+
+
+def load(db_path: str, run: Callable[[ETLPipeline], None], **options) -> Engine:
+    """Run and commit a load of an `ETLPipeline` created with `options` into a SQLite database."""
+    engine, session = create_database(db_path)
+    pipeline = ETLPipeline(session, **options)
+    try:
+        run(pipeline)
+        pipeline.commit()
+    finally:
+        pipeline.close()
+    return engine
+
+
+def load_elt(db_path: str, run: Callable[[ELTPipeline], None]) -> Engine:
+    """Run and commit a load of an `ELTPipeline` into a SQLite database."""
+    engine, session = create_database(db_path)
+    pipeline = ELTPipeline(session)
+    try:
+        run(pipeline)
+        pipeline.commit()
+    finally:
+        pipeline.close()
+    return engine
+
+
+def _sorted(df: pd.DataFrame) -> pd.DataFrame:
+    """Sort a table on all of its columns, so tables are compared independently of row order."""
+    return df.sort_values(list(df.columns), ignore_index=True)
+
+
+def natural_key_tables(engine: Engine) -> dict[str, pd.DataFrame]:
+    """Read the dimensions without their surrogate keys and the fact with the natural keys of its dimensions."""
+    tables: dict[str, pd.DataFrame] = {}
+    for table_name in ["dim_date", "dim_invoice", "dim_customer", "dim_product"]:
+        df: pd.DataFrame = pd.read_sql_table(table_name, engine)
+        tables[table_name] = _sorted(df.drop(columns=[SURROGATE_KEYS.get(table_name), "_insert_txstamp"], errors="ignore"))
+    tables["fact_transactions"] = _sorted(pd.read_sql(FACT_QUERY, engine))
+    return tables
+
+
+def assert_same_tables(actual: dict[str, pd.DataFrame], expected: dict[str, pd.DataFrame]) -> None:
+    """Assert that two loads produced the same natural-key tables."""
+    assert actual.keys() == expected.keys()
+    for table_name, expected_df in expected.items():
+        assert len(expected_df) > 0, f"{table_name} is empty"
+        pd.testing.assert_frame_equal(actual[table_name], expected_df, check_dtype=False, obj=table_name)
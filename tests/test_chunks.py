@@ -0,0 +1,28 @@
+import pytest
+from etl.main import _read_csv_chunks_from_source
+from star_schema import assert_same_tables, load, natural_key_tables
+
+
+@pytest.mark.parametrize("chunk_size", [997, 5_000])
+def test_chunks_match_full_load(tmp_path, source_csv, reference_tables, chunk_size):
+    """Streaming the source in chunks gives the tables of a full load, with invoices split across chunks
+    carried over to the next chunk."""
+    engine = load(
+        str(tmp_path / "invoices.db"),
+        lambda pipeline: pipeline.run_pipeline_in_chunks(
+            lambda: _read_csv_chunks_from_source(file_path=source_csv, chunk_size=chunk_size)
+        )
+    )
+    assert_same_tables(natural_key_tables(engine), reference_tables)
+
+
+def test_chunks_with_background_writer_match_full_load(tmp_path, source_csv, reference_tables):
+    """Chunked loads writing on the background writer give the tables of a full load."""
+    engine = load(
+        str(tmp_path / "invoices.db"),
+        lambda pipeline: pipeline.run_pipeline_in_chunks(
+            lambda: _read_csv_chunks_from_source(file_path=source_csv, chunk_size=997)
+        ),
+        background_writer=True
+    )
+    assert_same_tables(natural_key_tables(engine), reference_tables)
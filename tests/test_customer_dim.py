@@ -0,0 +1,36 @@
+import logging
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from etl.transformations.d_customer import ETLCustomerDimension
+
+
+@pytest.fixture
+def customer_step() -> ETLCustomerDimension:
+    session = sessionmaker(bind=create_engine("sqlite://"))()
+    return ETLCustomerDimension(table_name="dim_customer", session=session)
+
+
+def test_customer_days_with_several_countries_are_logged(customer_step, caplog):
+    """A customer invoiced from several countries on one day gets the version of the most invoiced one,
+    and the rows of the other countries are reported."""
+    members = pd.DataFrame({
+        "customer_id": [1, 1, 1, 2, -1, -1],
+        "invoice_date": pd.to_datetime(["2010-01-04", "2010-01-04", "2010-01-05", "2010-01-04", "2010-01-04", "2010-01-04"]),
+        "country": ["France", "Germany", "Germany", "Spain", "France", "Germany"],
+        "size": [3, 1, 2, 4, 1, 1],
+    })
+    with caplog.at_level(logging.WARNING):
+        days = customer_step._attributes_by_day(members)
+
+    assert days[["customer_id", "effective_from", "country"]].values.tolist() == [
+        [-1, pd.Timestamp("2010-01-04"), "France"],
+        [-1, pd.Timestamp("2010-01-04"), "Germany"],
+        [1, pd.Timestamp("2010-01-04"), "France"],
+        [1, pd.Timestamp("2010-01-05"), "Germany"],
+        [2, pd.Timestamp("2010-01-04"), "Spain"],
+    ]
+    # anonymous customers are kept apart by country, so only customer 1 has rows of another country
+    assert "1 customer days have rows from several countries (e.g. customer 1 on 2010-01-04)" in caplog.text
+    assert "1 rows are attributed" in caplog.text
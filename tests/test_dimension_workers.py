@@ -0,0 +1,25 @@
+import pandas as pd
+from star_schema import assert_same_tables, create_database, load, natural_key_tables
+from etl.pipeline import ETLPipeline
+
+
+def test_dimension_workers_match_full_load(tmp_path, source_df, reference_tables):
+    """Building the dimensions concurrently gives the tables of a sequential full load."""
+    engine = load(
+        str(tmp_path / "invoices.db"), lambda pipeline: pipeline.run_pipeline(source_df), max_workers=4
+    )
+    assert_same_tables(natural_key_tables(engine), reference_tables)
+
+
+def test_dimension_workers_roll_back_with_the_pipeline(tmp_path, source_df):
+    """Dimensions built concurrently are loaded in the pipeline's transaction, so a rollback discards all of them."""
+    engine, session = create_database(str(tmp_path / "invoices.db"))
+    pipeline = ETLPipeline(session, max_workers=4)
+    try:
+        pipeline.run_pipeline(source_df)
+        pipeline.rollback()
+    finally:
+        pipeline.close()
+
+    for table_name in ["dim_date", "dim_invoice", "dim_customer", "dim_product", "fact_transactions"]:
+        assert pd.read_sql(f"SELECT COUNT(*) AS n FROM {table_name}", engine)["n"].iloc[0] == 0, table_name
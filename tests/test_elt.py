@@ -0,0 +1,16 @@
+import pandas as pd
+from etl.main import _read_csv_chunks_from_source
+from star_schema import assert_same_tables, load_elt, natural_key_tables
+
+
+def test_elt_matches_full_load(tmp_path, source_csv, reference_tables):
+    """The set-based ELT load gives the tables of the in-memory full load, and leaves no staged rows behind."""
+    engine = load_elt(
+        str(tmp_path / "invoices.db"),
+        lambda pipeline: pipeline.run_pipeline(
+            _read_csv_chunks_from_source(file_path=source_csv, chunk_size=5_000, dtype=str)
+        )
+    )
+    assert_same_tables(natural_key_tables(engine), reference_tables)
+    for table_name in ["stg_invoices", "stg_invoices_clean"]:
+        assert pd.read_sql(f"SELECT COUNT(*) AS n FROM {table_name}", engine)["n"].iloc[0] == 0
@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from etl.transformations.f_transaction import ETLTransactionFact
+
+KEY_COLUMNS: list[str] = ["date_key", "invoice_key", "product_key", "customer_key"]
+MEASURES: list[str] = ["quantity", "price", "revenue"]
+
+
+@pytest.fixture
+def fact_step() -> ETLTransactionFact:
+    session = sessionmaker(bind=create_engine("sqlite://"))()
+    return ETLTransactionFact(table_name="fact_transactions", session=session)
+
+
+@pytest.fixture
+def encoded_df() -> pd.DataFrame:
+    """Encoded rows with duplicate grains and missing (-1) codes in every key column, in no particular order."""
+    rng = np.random.default_rng(0)
+    n_rows = 5_000
+    df = pd.DataFrame({column: rng.integers(-1, count, n_rows) for column, count in zip(KEY_COLUMNS, [4, 30, 20, 10])})
+    df["quantity"] = rng.integers(-5, 50, n_rows)
+    df["price"] = rng.integers(1, 1_000, n_rows) / 100
+    df["revenue"] = df["quantity"] * df["price"]
+    return df
+
+
+def expected_grain(df: pd.DataFrame) -> pd.DataFrame:
+    """Group to the fact grain with a plain groupby on the key columns, sorted in primary key order."""
+    return df.groupby(KEY_COLUMNS, as_index=False)[MEASURES].sum()
+
+
+@pytest.mark.parametrize("code_counts", [
+    [4, 30, 20, 10],
+    # the combined codes do not fit into 64 bits, so rows are grouped on the key columns instead
+    [2 ** 16, 2 ** 16, 2 ** 16, 2 ** 16],
+], ids=["packed", "fallback"])
+def test_group_to_fact_grain_matches_groupby(fact_step, encoded_df, code_counts):
+    grouped_df = fact_step._group_to_fact_grain(encoded_df, code_counts=code_counts)
+    expected_df = expected_grain(encoded_df)
+
+    assert list(grouped_df.columns) == KEY_COLUMNS + MEASURES
+    assert (grouped_df[KEY_COLUMNS] == -1).any().all()
+    # rows come out in primary key order, like the clustered index
+    pd.testing.assert_frame_equal(grouped_df, expected_df, check_dtype=False)
@@ -0,0 +1,20 @@
+from etl.main import _read_csv_from_source
+from star_schema import assert_same_tables, load, natural_key_tables
+
+
+def test_files_match_full_load(tmp_path, source_df, reference_tables):
+    """Loading the source split into several files, transformed in worker processes,
+    gives the tables of a full load of their concatenation. Files are split mid-invoice."""
+    file_paths: list[str] = []
+    for position, start in enumerate(range(0, len(source_df), 6_667)):
+        file_path = str(tmp_path / f"invoices_{position}.csv")
+        source_df.iloc[start:start + 6_667].to_csv(file_path, index=False)
+        file_paths.append(file_path)
+
+    engine = load(
+        str(tmp_path / "invoices.db"),
+        lambda pipeline: pipeline.run_pipeline_from_files(
+            file_paths=file_paths, read_source=_read_csv_from_source, max_workers=2
+        )
+    )
+    assert_same_tables(natural_key_tables(engine), reference_tables)
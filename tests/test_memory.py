@@ -0,0 +1,39 @@
+import json
+import os
+import subprocess
+import sys
+import pytest
+from benchmarks.synthetic import SyntheticInvoiceGenerator
+
+REPO_ROOT: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+N_ROWS: int = 300_000
+# peak RSS growth of a low-copy load as a multiple of the CSV file size,
+# measured at 5.4x for 300k synthetic rows (7.5x without low-copy)
+MAX_RSS_MULTIPLE: float = 6.5
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="resident memory is read from /proc")
+def test_low_copy_peak_memory(tmp_path):
+    """A low-copy load of a generated source stays within the peak memory bound.
+    The load runs in its own process through the benchmark, so peak memory is not shared with the test run."""
+    csv_path = tmp_path / "invoices.csv"
+    output_path = tmp_path / "result.json"
+    SyntheticInvoiceGenerator(seed=0).write_csv(file_path=str(csv_path), n_rows=N_ROWS)
+
+    subprocess.run(
+        [
+            sys.executable, "-m", "benchmarks.run_benchmark",
+            "--single", str(csv_path),
+            "--single-output", str(output_path),
+            "--batch-size", "10000",
+            "--low-copy",
+        ],
+        cwd=REPO_ROOT,
+        check=True
+    )
+
+    result: dict = json.loads(output_path.read_text())
+    rss_multiple: float = result["peak_rss_growth_bytes"] / result["file_bytes"]
+    assert rss_multiple <= MAX_RSS_MULTIPLE, (
+        f"peak RSS growth is {rss_multiple:.1f}x the CSV file size, above the limit of {MAX_RSS_MULTIPLE}x"
+    )
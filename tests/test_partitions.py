@@ -0,0 +1,43 @@
+import pandas as pd
+from star_schema import assert_same_tables, load, natural_key_tables
+
+
+def modify_month_end(source_df: pd.DataFrame) -> pd.DataFrame:
+    """Return the source with the quantities of the last invoice day of March 2010 doubled."""
+    invoice_dates = pd.to_datetime(source_df["InvoiceDate"])
+    march: pd.Series = invoice_dates.dt.to_period("M") == pd.Period("2010-03")
+    month_end: pd.Series = march & (invoice_dates.dt.date == invoice_dates[march].dt.date.max())
+    assert month_end.any()
+
+    modified_df: pd.DataFrame = source_df.copy()
+    modified_df.loc[month_end, "Quantity"] *= 2
+    return modified_df
+
+
+def test_changed_partitions_match_full_load(tmp_path, source_df, reference_tables):
+    """Loading an empty database reloads every month and gives the tables of a full load.
+    Reloading the source with one month changed gives the tables of a full load of the changed source."""
+    db_path = str(tmp_path / "invoices.db")
+    engine = load(db_path, lambda pipeline: pipeline.run_pipeline_changed_partitions(source_df.copy()))
+    assert_same_tables(natural_key_tables(engine), reference_tables)
+
+    modified_df: pd.DataFrame = modify_month_end(source_df)
+    engine = load(db_path, lambda pipeline: pipeline.run_pipeline_changed_partitions(modified_df.copy()))
+    expected_engine = load(
+        str(tmp_path / "expected.db"), lambda pipeline: pipeline.run_pipeline(modified_df.copy())
+    )
+    assert_same_tables(natural_key_tables(engine), natural_key_tables(expected_engine))
+
+
+def test_unchanged_partitions_are_not_reloaded(tmp_path, source_df):
+    """Reloading an unchanged source leaves the tables as they are, surrogate keys included."""
+    db_path = str(tmp_path / "invoices.db")
+    engine = load(db_path, lambda pipeline: pipeline.run_pipeline_changed_partitions(source_df.copy()))
+    tables: dict[str, pd.DataFrame] = {
+        table_name: pd.read_sql_table(table_name, engine)
+        for table_name in ["dim_date", "dim_invoice", "dim_customer", "dim_product", "fact_transactions"]
+    }
+
+    engine = load(db_path, lambda pipeline: pipeline.run_pipeline_changed_partitions(source_df.copy()))
+    for table_name, expected_df in tables.items():
+        pd.testing.assert_frame_equal(pd.read_sql_table(table_name, engine), expected_df, obj=table_name)
@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+from etl import registry
+from etl.registry import KeyRegistry
+
+
+def test_registry_keeps_keys_across_instances(tmp_path):
+    """Keys are allocated in order of first appearance, kept by later registries on the same directory
+    through growth, and looked up alike for compact and default integer types."""
+    key_registry = KeyRegistry(registry_dir=str(tmp_path), name="dim_product", initial_capacity=16)
+    assert key_registry.get_or_create([pd.Series(["b", "a", "b"])]).tolist() == [1, 2, 1]
+    codes = pd.Series(np.arange(100))
+    surrogate_keys = key_registry.get_or_create([codes.astype(np.int16)], start=10)
+    key_registry.close()
+
+    key_registry = KeyRegistry(registry_dir=str(tmp_path), name="dim_product")
+    assert key_registry.lookup([pd.Series(["a", "b", "c"])]).tolist() == [2, 1, -1]
+    assert (key_registry.lookup([codes]) == surrogate_keys).all()
+    assert len(key_registry) == 102
+
+
+def test_registry_tells_colliding_natural_keys_apart(tmp_path, monkeypatch):
+    """Natural keys with the same hash are told apart by their stored bytes and get their own keys."""
+    monkeypatch.setattr(registry, "natural_key_hashes", lambda keys: np.full(len(keys), 42, dtype=np.uint64))
+    key_registry = KeyRegistry(registry_dir=str(tmp_path), name="dim_invoice", initial_capacity=16)
+    invoice_no, invoice_type = pd.Series(["1", "1", "2", "1"]), pd.Series(["Sale", "Cancel", "Sale", "Sale"])
+
+    assert key_registry.get_or_create([invoice_no, invoice_type]).tolist() == [1, 2, 3, 1]
+    assert key_registry.get_or_create([pd.Series(["3", "2"]), pd.Series(["Sale", "Sale"])]).tolist() == [4, 3]
+    assert key_registry.lookup([pd.Series(["1", "4"]), pd.Series(["Cancel", "Sale"])]).tolist() == [2, -1]